@@ -0,0 +1,5 @@
+# app/__main__.py
+# python -m app <komut> (bkz. app/cli.py)
+from app.cli import main
+
+main()
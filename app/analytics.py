@@ -0,0 +1,191 @@
+# app/analytics.py
+import time
+from collections import Counter
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import (
+    SessionLocal, CallOutput, CallOutputTopic, CallOutputKeyword, DailyTopicStats, DailySubtopicStats,
+    create_db_and_tables,
+)
+from app.call_queue import utcnow
+from app.utils import setup_logging
+
+log = setup_logging()
+
+# Rollup güncellemeleri: aynı anahtar varsa sayaçlar toplanır (SQLite UPSERT)
+_TOPIC_KEYS = ("day", "main_topic", "sentiment", "is_complaint")
+_TOPIC_COUNTERS = ("call_count", "nps_sum", "nps_count")
+_SUBTOPIC_KEYS = ("day", "sub_topic")
+_SUBTOPIC_COUNTERS = ("call_count", "complaint_count")
+
+def split_list(value):
+    """calls_output'ta ", " ile birleştirilerek saklanan listeyi (alt konular, anahtar kelimeler) böler."""
+    return [item for item in (value or "").split(", ") if item]
+
+def _day(processed_at):
+    # processed_at'i olmayan (çok eski) satırlar bugüne sayılır
+    return (processed_at or utcnow()).date().isoformat()
+
+def _child_rows(output_id, row):
+    topics = [
+        {"call_output_id": output_id, "kind": kind, "topic": topic, "position": position}
+        for kind, column in (("free", "sub_topics_free"), ("guided", "sub_topics_guided"))
+        for position, topic in enumerate(split_list(row.get(column)))
+    ]
+    keywords = [
+        {"call_output_id": output_id, "keyword": keyword, "position": position}
+        for position, keyword in enumerate(split_list(row.get("top_keywords")))
+    ]
+    return topics, keywords
+
+def _add_rollup_deltas(topic_deltas, subtopic_deltas, row, sign=1):
+    """Bir çıktı satırının rollup katkısını (sign=-1 ile geri alınmasını) biriktirir."""
+    day = _day(row["processed_at"])
+    complaint = bool(row.get("is_complaint"))
+    key = (day, row.get("main_topic_guided") or "", row.get("sentiment") or "", complaint)
+    deltas = topic_deltas.setdefault(key, Counter())
+    deltas["call_count"] += sign
+    if row.get("nps_score") is not None:
+        deltas["nps_sum"] += sign * row["nps_score"]
+        deltas["nps_count"] += sign
+    # Aynı guided alt konuya birden fazla serbest konu eşlenebilir; çağrı o alt konuda bir kez sayılır
+    for sub_topic in dict.fromkeys(split_list(row.get("sub_topics_guided"))):
+        deltas = subtopic_deltas.setdefault((day, sub_topic), Counter())
+        deltas["call_count"] += sign
+        deltas["complaint_count"] += sign * complaint
+
+def _upsert(db_session, table, keys, counters, deltas):
+    if not deltas:
+        return
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={name: getattr(table, name) + getattr(statement.excluded, name) for name in counters},
+    )
+    db_session.execute(statement, [
+        {**dict(zip(keys, key)), **{name: values.get(name, 0) for name in counters}}
+        for key, values in deltas.items()
+    ])
+
+def _apply_rollup_deltas(db_session, topic_deltas, subtopic_deltas):
+    _upsert(db_session, DailyTopicStats, _TOPIC_KEYS, _TOPIC_COUNTERS, topic_deltas)
+    _upsert(db_session, DailySubtopicStats, _SUBTOPIC_KEYS, _SUBTOPIC_COUNTERS, subtopic_deltas)
+
+def insert_call_outputs(db_session, rows):
+    """
+    'calls_output' satırlarını (call_output_values sözlükleri) tek executemany ile ekler; aynı
+    transaction'da alt konu/anahtar kelime satırlarını yazar ve günlük rollup'ları artırır.
+    processed_at verilmemişse şimdiki UTC zamanı yazılır (rollup günü ile aynı olsun diye).
+    Commit çağırana aittir. Dönüş: eklenen satırların id'leri (girdi sırasıyla).
+    """
+    if not rows:
+        return []
+    now = utcnow()
+    rows = [row if row.get("processed_at") else {**row, "processed_at": now} for row in rows]
+    output_ids = db_session.execute(
+        insert(CallOutput).returning(CallOutput.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+    topic_rows, keyword_rows = [], []
+    topic_deltas, subtopic_deltas = {}, {}
+    for output_id, row in zip(output_ids, rows):
+        topics, keywords = _child_rows(output_id, row)
+        topic_rows.extend(topics)
+        keyword_rows.extend(keywords)
+        _add_rollup_deltas(topic_deltas, subtopic_deltas, row)
+    if topic_rows:
+        db_session.execute(insert(CallOutputTopic), topic_rows)
+    if keyword_rows:
+        db_session.execute(insert(CallOutputKeyword), keyword_rows)
+    _apply_rollup_deltas(db_session, topic_deltas, subtopic_deltas)
+    return output_ids
+
+def update_guided_topics(db_session, old_rows, updates):
+    """
+    Guided konuları değişen satırlar için (bkz. app/remap_topics.py) guided alt konu satırlarını
+    yeniler ve rollup'lardaki eski katkıyı yenisiyle değiştirir. 'old_rows' güncellemeden önceki
+    satırlardır (id, processed_at, main_topic_guided, sub_topics_guided, sentiment, is_complaint,
+    nps_score); 'updates' aynı sırayla {"id", "main_topic_guided", "sub_topics_guided", ...}. Commit çağırana aittir.
+    """
+    topic_deltas, subtopic_deltas = {}, {}
+    topic_rows = []
+    for old, new in zip(old_rows, updates):
+        _add_rollup_deltas(topic_deltas, subtopic_deltas, old, sign=-1)
+        _add_rollup_deltas(topic_deltas, subtopic_deltas, {**old, **new})
+        topic_rows.extend(
+            {"call_output_id": new["id"], "kind": "guided", "topic": topic, "position": position}
+            for position, topic in enumerate(split_list(new.get("sub_topics_guided")))
+        )
+    db_session.execute(delete(CallOutputTopic).where(
+        CallOutputTopic.kind == "guided", CallOutputTopic.call_output_id.in_([new["id"] for new in updates])
+    ))
+    if topic_rows:
+        db_session.execute(insert(CallOutputTopic), topic_rows)
+    # Değişmeyen anahtarlarda -1/+1 birbirini götürür; yalnızca net farklar yazılır
+    _apply_rollup_deltas(
+        db_session,
+        {key: values for key, values in topic_deltas.items() if any(values.values())},
+        {key: values for key, values in subtopic_deltas.items() if any(values.values())},
+    )
+    db_session.execute(delete(DailyTopicStats).where(DailyTopicStats.call_count <= 0))
+    db_session.execute(delete(DailySubtopicStats).where(DailySubtopicStats.call_count <= 0))
+
+ROLLUP_SOURCE_COLUMNS = (
+    CallOutput.id, CallOutput.processed_at, CallOutput.main_topic_guided, CallOutput.sub_topics_free,
+    CallOutput.sub_topics_guided, CallOutput.top_keywords, CallOutput.sentiment, CallOutput.is_complaint,
+    CallOutput.nps_score,
+)
+
+def rebuild_analytics(chunk_size=5000):
+    """
+    Alt tabloları ve rollup'ları mevcut 'calls_output' satırlarından baştan oluşturur
+    (bu tablolardan önce yazılmış bir veritabanı için ya da tutarsızlık şüphesinde).
+    Satırlar id sırasıyla parça parça okunur; her şey tek transaction'da yazılır. Dönüş: işlenen satır sayısı.
+    """
+    create_db_and_tables()
+    db_session = SessionLocal()
+    start_time = time.time()
+    processed = 0
+    last_id = 0
+    try:
+        for table in (CallOutputTopic, CallOutputKeyword, DailyTopicStats, DailySubtopicStats):
+            db_session.execute(delete(table))
+        topic_deltas, subtopic_deltas = {}, {}
+        while True:
+            rows = db_session.execute(
+                select(*ROLLUP_SOURCE_COLUMNS).where(CallOutput.id > last_id).order_by(CallOutput.id).limit(chunk_size)
+            ).mappings().all()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            topic_rows, keyword_rows = [], []
+            for row in rows:
+                topics, keywords = _child_rows(row["id"], row)
+                topic_rows.extend(topics)
+                keyword_rows.extend(keywords)
+                _add_rollup_deltas(topic_deltas, subtopic_deltas, row)
+            if topic_rows:
+                db_session.execute(insert(CallOutputTopic), topic_rows)
+            if keyword_rows:
+                db_session.execute(insert(CallOutputKeyword), keyword_rows)
+            processed += len(rows)
+        _apply_rollup_deltas(db_session, topic_deltas, subtopic_deltas)
+        db_session.commit()
+        log.info(f"{processed} çıktı satırından alt tablolar ve günlük özetler {time.time() - start_time:.2f} sn'de oluşturuldu.")
+        return processed
+    except Exception as e:
+        db_session.rollback()
+        log.error(f"Analitik tabloları oluşturulurken hata: {e}")
+        raise
+    finally:
+        db_session.close()
+
+def rollup_coverage(db_session):
+    """(calls_output satır sayısı, rollup'lardaki çağrı sayısı); farklıysa rollup'lar yeniden oluşturulmalıdır."""
+    outputs = db_session.scalar(select(func.count()).select_from(CallOutput))
+    rolled_up = db_session.scalar(select(func.coalesce(func.sum(DailyTopicStats.call_count), 0)))
+    return outputs, rolled_up
+
+if __name__ == "__main__":
+    # Alt tabloları ve rollup'ları calls_output'tan yeniden oluştur
+    rebuild_analytics()
@@ -0,0 +1,61 @@
+# app/backends.py
+from app.config import LLM_BACKEND, LLM_MODEL, LITE_LLM_MODEL, EMBEDDING_MODEL, OPENAI_API_KEY, require_openai_api_key
+from app.rate_limiter import rate_limited_chat_model, RateLimitedEmbeddings
+from app.embedding_cache import CachedEmbeddings
+
+# LLM_BACKEND="openai": gerçek OpenAI istemcileri (paylaşılan hız sınırlayıcı ile)
+# LLM_BACKEND="fake":   ağsız, deterministik sahte model ve embedding'ler (app/fake_backends.py)
+
+def create_chat_model(structured_schema=None, lite: bool = False):
+    """
+    Çıkarım zinciri için LLM_BACKEND'e uygun chat modelini döner ('lite' ise LITE_LLM_MODEL).
+    'structured_schema' verilirse model yapılandırılmış çıktı (with_structured_output, include_raw=True)
+    modunda kurulur ve {"raw", "parsed", "parsing_error"} döner.
+    """
+    model_name = LITE_LLM_MODEL if lite else LLM_MODEL
+    if LLM_BACKEND == "fake":
+        from app.config import FAKE_LITE_LLM_LATENCY_SECONDS
+        from app.fake_backends import FakeChatModel
+        # OpenAI kotası yok: limiter'dan geçirilirse benchmark OPENAI_REQUESTS_PER_MINUTE'a takılır
+        llm = FakeChatModel(model_name=model_name)
+        if lite:
+            llm.latency_seconds = FAKE_LITE_LLM_LATENCY_SECONDS
+        if structured_schema is not None:
+            return llm.with_structured_output(structured_schema, include_raw=True)
+        return llm
+
+    require_openai_api_key()
+    from langchain_openai import ChatOpenAI
+    # İstemcinin kendi retry'ı kapalı: 429'lar paylaşılan limiter'a ulaşmalı ve
+    # tekrar denemeler de limiter'dan geçmeli (bkz. app/rate_limiter.py)
+    llm = ChatOpenAI(
+        model=model_name,
+        openai_api_key=OPENAI_API_KEY,
+        temperature=0,
+        max_retries=0
+    )
+    if structured_schema is not None:
+        # JSON şeması API'ye response_format olarak gider; strict modda çıktı şemaya zorlanır
+        llm = llm.with_structured_output(structured_schema, method="json_schema", strict=True, include_raw=True)
+    return rate_limited_chat_model(llm)
+
+def create_base_embeddings(max_retries: int = 2):
+    """Önbelleksiz, sınırlayıcısız embedding nesnesi (ör. index oluşturma için)."""
+    if LLM_BACKEND == "fake":
+        from app.fake_backends import FakeHashEmbeddings
+        return FakeHashEmbeddings()
+
+    require_openai_api_key()
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=OPENAI_API_KEY, max_retries=max_retries)
+
+def create_query_embeddings():
+    """
+    RAG sorguları için embedding nesnesi: disk önbelleği + (OpenAI'de) paylaşılan hız sınırlayıcı.
+    Önbellek anahtarı EMBEDDING_MODEL olduğu için sahte vektörler gerçeklerle karışmaz.
+    """
+    if LLM_BACKEND == "fake":
+        underlying = create_base_embeddings()
+    else:
+        underlying = RateLimitedEmbeddings(create_base_embeddings(max_retries=0))
+    return CachedEmbeddings(underlying, model_name=EMBEDDING_MODEL)
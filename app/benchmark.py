@@ -0,0 +1,514 @@
+# app/benchmark.py
+"""
+Ağsız, ücretsiz pipeline benchmark'ı: LLM_BACKEND="fake" ile sentetik transkriptler üzerinde
+run_pipeline'ı farklı batch boyutu x eşzamanlılık kombinasyonlarında çalıştırır ve
+çağrı/sn, aşama başına p50/p95 ve DB yazma süresini raporlar.
+
+    python -m app.benchmark --calls 200 --batch-sizes 5,10,20 --concurrency 10,20,50 --latency 0.5
+    python -m app.benchmark --topic-index --topics 400 --queries 2000   # NumPy konu index'i vs FAISS
+    python -m app.benchmark --startup                                    # CLI komutlarının import süresi
+
+Tüm dosyalar (SQLite, FAISS index, embedding önbelleği) geçici bir dizinde oluşturulur;
+gerçek bank_calls.db ve data/ dizinine dokunulmaz. Ayarlar app.config import edilmeden önce
+ortam değişkenleriyle verildiği için app modülleri fonksiyonların içinde import edilir.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SYNTHETIC_TOPIC_HIERARCHY = [
+    {"ana_konu": "Kartlar", "alt_konular": [
+        {"alt_konu": "Kredi kartı limit artırımı", "ornekler": "limitimi artırmak istiyorum, kart limiti yetmiyor"},
+        {"alt_konu": "Kart aidatı itirazı", "ornekler": "kart aidatı iadesi, yıllık ücret itirazı"},
+        {"alt_konu": "Kayıp kart bildirimi", "ornekler": "kartımı kaybettim, kartım çalındı"},
+    ]},
+    {"ana_konu": "Para Transferi", "alt_konular": [
+        {"alt_konu": "EFT işlemi gecikmesi", "ornekler": "EFT ulaşmadı, havale gecikti"},
+        {"alt_konu": "Döviz alım satım", "ornekler": "dolar almak istiyorum, döviz kuru"},
+    ]},
+    {"ana_konu": "Hesap İşlemleri", "alt_konular": [
+        {"alt_konu": "Hesap işletim ücreti iadesi", "ornekler": "hesap işletim ücreti kesilmiş, ücret iadesi"},
+        {"alt_konu": "Fatura talimatı", "ornekler": "otomatik fatura ödeme talimatı"},
+        {"alt_konu": "Vadeli mevduat faizi", "ornekler": "vadeli hesap faiz oranı"},
+    ]},
+    {"ana_konu": "Krediler", "alt_konular": [
+        {"alt_konu": "Konut kredisi faiz oranı", "ornekler": "konut kredisi faizi, ev kredisi"},
+        {"alt_konu": "Taksitli nakit avans", "ornekler": "nakit avans taksit"},
+    ]},
+    {"ana_konu": "Dijital Kanallar", "alt_konular": [
+        {"alt_konu": "İnternet bankacılığı şifre sorunu", "ornekler": "şifremi unuttum, giriş yapamıyorum"},
+        {"alt_konu": "Mobil uygulama giriş hatası", "ornekler": "mobil uygulama açılmıyor, hata veriyor"},
+    ]},
+]
+SYNTHETIC_PRODUCT_LIST = "Bonus Kart: Kredi kartı\nVadeli Mevduat: Faizli hesap\nKonut Kredisi: Ev kredisi\n"
+
+_CUSTOMER_LINES = [
+    "Merhaba, {topic} konusunda aradım.", "Geçen ay da aynı sorunu yaşadım.",
+    "Hesabımdan {amount} TL kesilmiş, bunun nedenini öğrenmek istiyorum.",
+    "Bu arada kart limitim ne kadardı?", "Çok mağdur oldum, şikayetçiyim.",
+    "Tamam, teşekkür ederim.", "Şubeye gitmem gerekiyor mu?", "Mobil uygulamadan yapamadım.",
+    "Garanti'de de hesabım var, orada böyle bir sorun yaşamadım.",
+]
+_AGENT_LINES = [
+    "Size nasıl yardımcı olabilirim?", "Kontrol ediyorum, lütfen hatta kalın.",
+    "İşleminiz {day} iş günü içinde tamamlanacak.", "Talebinizi ilgili birime iletiyorum.",
+    "Size uygun bir kampanyamız var.", "Başka yardımcı olabileceğim bir konu var mı?",
+    "Sizi ilgili birime aktarıyorum.",
+]
+# Kısa/basit çağrılar (küçük model katmanına yönlenebilenler) şikayet veya aktarma içermez
+_SIMPLE_CUSTOMER_LINES = [line for line in _CUSTOMER_LINES if "şikayet" not in line and "Garanti" not in line]
+_SIMPLE_AGENT_LINES = [line for line in _AGENT_LINES if "aktarıyorum" not in line]
+SIMPLE_CALL_RATIO = 0.3
+
+def synthetic_transcript(index: int, rng: random.Random) -> str:
+    """Rastgele uzunlukta, benzersiz bir sentetik müşteri-temsilci diyaloğu üretir."""
+    topic = rng.choice([sub["alt_konu"] for item in SYNTHETIC_TOPIC_HIERARCHY for sub in item["alt_konular"]])
+    lines = [f"Temsilci: Akbank'a hoş geldiniz, görüşme numaranız {index}."]
+    if rng.random() < SIMPLE_CALL_RATIO:
+        customer_lines, agent_lines, turns = _SIMPLE_CUSTOMER_LINES, _SIMPLE_AGENT_LINES, rng.randint(2, 5)
+    else:
+        customer_lines, agent_lines, turns = _CUSTOMER_LINES, _AGENT_LINES, rng.randint(4, 30)
+    for _ in range(turns):
+        lines.append("Müşteri: " + rng.choice(customer_lines).format(topic=topic.lower(), amount=rng.randint(10, 5000)))
+        lines.append("Temsilci: " + rng.choice(agent_lines).format(day=rng.randint(1, 5)))
+    return "\n".join(lines)
+
+def _prepare_environment(workdir, latency, error_rate, retry_backoff):
+    """app.config import edilmeden önce sahte arka ucu ve geçici dosya yollarını ayarlar."""
+    os.makedirs(workdir, exist_ok=True)
+    os.environ.update({
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY_SECONDS": str(latency),
+        "FAKE_LLM_ERROR_RATE": str(error_rate),
+        "RETRY_BACKOFF_BASE_SECONDS": str(retry_backoff),
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench_calls.db')}",
+        "TOPIC_HIERARCHY_PATH": os.path.join(workdir, "topic_hierarchy.json"),
+        "PRODUCT_LIST_PATH": os.path.join(workdir, "product_list.txt"),
+        "TOPIC_INDEX_PATH": os.path.join(workdir, "topic_index"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite"),
+    })
+    with open(os.environ["TOPIC_HIERARCHY_PATH"], "w", encoding="utf-8") as f:
+        json.dump(SYNTHETIC_TOPIC_HIERARCHY, f, ensure_ascii=False)
+    with open(os.environ["PRODUCT_LIST_PATH"], "w", encoding="utf-8") as f:
+        f.write(SYNTHETIC_PRODUCT_LIST)
+
+def _reset_database(num_calls, seed):
+    """Tabloları sıfırdan kurar ve 'num_calls' adet sentetik çağrı ekler."""
+    from app.models import Base, engine, SessionLocal, CallInput, create_db_and_tables
+    from app.preprocess import preprocess_fields
+
+    Base.metadata.drop_all(bind=engine)
+    create_db_and_tables()
+    rng = random.Random(seed)
+    db_session = SessionLocal()
+    try:
+        db_session.add_all([
+            CallInput(call_id=f"bench-{i}", status="pending", **preprocess_fields(synthetic_transcript(i, rng)))
+            for i in range(num_calls)
+        ])
+        db_session.commit()
+    finally:
+        db_session.close()
+    # Her senaryo soğuk embedding önbelleğiyle başlar
+    if os.path.exists(os.environ["EMBEDDING_CACHE_PATH"]):
+        os.remove(os.environ["EMBEDDING_CACHE_PATH"])
+
+def _status_counts():
+    from sqlalchemy import func
+    from app.models import SessionLocal, CallInput
+
+    db_session = SessionLocal()
+    try:
+        return dict(db_session.query(CallInput.status, func.count()).group_by(CallInput.status).all())
+    finally:
+        db_session.close()
+
+def run_scenario(num_calls, batch_size, max_concurrency, seed=0, extraction_mode="parser"):
+    """Tek bir (çıkarım modu, batch, eşzamanlılık) senaryosunu çalıştırır ve sonuç sözlüğünü döner."""
+    from app import metrics
+    from app.main import run_pipeline
+
+    _reset_database(num_calls, seed)
+    metrics.reset()
+    start = time.perf_counter()
+    # Özet benchmark sonucuna eklenir; pipeline'ın kendi özet dosyası ve endpoint'i kapalı
+    run_pipeline(worker_id="benchmark", batch_size=batch_size, max_concurrency=max_concurrency,
+                 extraction_mode=extraction_mode, metrics_port=0, metrics_summary_path=None)
+    elapsed = time.perf_counter() - start
+
+    statuses = _status_counts()
+    stages = metrics.stage_summary()
+    counters = metrics.counter_summary()
+    input_tokens = counters.get("input_tokens", 0)
+    llm_requests = counters.get("llm_requests", 0)
+    return {
+        "extraction_mode": extraction_mode,
+        "batch_size": batch_size,
+        "max_concurrency": max_concurrency,
+        "calls": num_calls,
+        "processed": statuses.get("processed", 0),
+        "dead": statuses.get("dead", 0),
+        # Run bittiğinde her çağrı işlenmiş ya da dead-letter'da olmalı (tekrar denemeler dahil)
+        "pending": statuses.get("pending", 0) + statuses.get("in_progress", 0),
+        "seconds": round(elapsed, 3),
+        "calls_per_second": round(statuses.get("processed", 0) / elapsed, 2) if elapsed else 0.0,
+        "db_write_seconds": stages.get("db_write", {}).get("total", 0.0),
+        "input_tokens": input_tokens,
+        "cached_input_tokens": counters.get("cached_input_tokens", 0),
+        "cache_hit_ratio": round(counters.get("cached_input_tokens", 0) / input_tokens, 3) if input_tokens else 0.0,
+        "llm_requests": llm_requests,
+        "input_tokens_per_request": round(input_tokens / llm_requests, 1) if llm_requests else 0.0,
+        "parse_failure_rate": round(counters.get("parse_failures", 0) / llm_requests, 4) if llm_requests else 0.0,
+        "tiers": {
+            tier: {"calls": counters.get(f"tier_{tier}_calls", 0), "llm_call": stages.get(f"llm_call_{tier}")}
+            for tier in ("lite", "full")
+        },
+        "db_writer": {
+            "commits": counters.get("db_commits", 0),
+            "rows_written": counters.get("db_rows_written", 0),
+            "commit": stages.get("db_commit"),
+            "queue_wait": stages.get("db_queue_wait"),
+            "queue_depth_max": metrics.gauge_summary().get("db_queue_depth", {}).get("max", 0),
+        },
+        "stages": stages,
+        "tokens": metrics.token_summary(),
+        "cache_hit_rates": metrics.cache_hit_rates(counters),
+        "counters": counters,
+        "gauges": metrics.gauge_summary(),
+    }
+
+def _format_table(results):
+    header = (
+        f"{'mod':>10} {'batch':>5} {'conc':>5} {'ok':>6} {'dead':>5} {'sn':>8} {'çağrı/sn':>9} "
+        f"{'llm p50/p95':>14} {'rag p50/p95':>14} {'db p50/p95':>14} {'db toplam':>10} {'önbellek %':>10}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        def pct(stage):
+            s = r["stages"].get(stage)
+            return f"{s['p50']:.3f}/{s['p95']:.3f}" if s else "-"
+        lines.append(
+            f"{r['extraction_mode']:>10} {r['batch_size']:>5} {r['max_concurrency']:>5} {r['processed']:>6} {r['dead']:>5} "
+            f"{r['seconds']:>8.2f} {r['calls_per_second']:>9.2f} {pct('llm_call'):>14} "
+            f"{pct('rag_mapping'):>14} {pct('db_write'):>14} {r['db_write_seconds']:>10.3f} {r['cache_hit_ratio'] * 100:>10.1f}"
+        )
+    return "\n".join(lines)
+
+def _format_extraction_table(results):
+    """Çıkarım modlarını (parser / structured) prompt token'ı, gecikme ve ayrıştırma hatası ile karşılaştırır."""
+    header = (
+        f"{'mod':>10} {'batch':>5} {'conc':>5} {'istek':>6} {'giriş tok/istek':>15} "
+        f"{'llm p50/p95':>14} {'parse hata %':>12}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        llm = r["stages"].get("llm_call")
+        latency = f"{llm['p50']:.3f}/{llm['p95']:.3f}" if llm else "-"
+        lines.append(
+            f"{r['extraction_mode']:>10} {r['batch_size']:>5} {r['max_concurrency']:>5} {r['llm_requests']:>6} "
+            f"{r['input_tokens_per_request']:>15.1f} {latency:>14} {r['parse_failure_rate'] * 100:>12.2f}"
+        )
+    return "\n".join(lines)
+
+def _format_tier_table(results):
+    """Katman (küçük model / ana model) başına çağrı sayısı ve LLM gecikmesi; kural motorunun çağrı başı süresi."""
+    header = (
+        f"{'mod':>10} {'batch':>5} {'conc':>5} {'katman':>7} {'çağrı':>6} {'pay %':>6} "
+        f"{'llm p50/p95':>14} {'kural p50 µs':>12}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        total = sum(tier["calls"] for tier in r["tiers"].values()) or 1
+        rules = r["stages"].get("rules")
+        rules_us = f"{rules['p50'] * 1e6:.0f}" if rules else "-"
+        for name, tier in r["tiers"].items():
+            llm = tier["llm_call"]
+            latency = f"{llm['p50']:.3f}/{llm['p95']:.3f}" if llm else "-"
+            lines.append(
+                f"{r['extraction_mode']:>10} {r['batch_size']:>5} {r['max_concurrency']:>5} {name:>7} "
+                f"{tier['calls']:>6} {tier['calls'] / total * 100:>6.1f} {latency:>14} {rules_us:>12}"
+            )
+    return "\n".join(lines)
+
+def _format_db_writer_table(results):
+    """DB yazma aşaması: commit sayısı, commit başı satır, commit gecikmesi, kuyrukta bekleme ve en büyük kuyruk derinliği."""
+    header = (
+        f"{'mod':>10} {'batch':>5} {'conc':>5} {'commit':>7} {'satır/commit':>12} "
+        f"{'commit p50/p95':>15} {'bekleme p50/p95':>16} {'maks kuyruk':>11}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        writer = r["db_writer"]
+        def pct(stats):
+            return f"{stats['p50']:.4f}/{stats['p95']:.4f}" if stats else "-"
+        rows_per_commit = writer["rows_written"] / writer["commits"] if writer["commits"] else 0.0
+        lines.append(
+            f"{r['extraction_mode']:>10} {r['batch_size']:>5} {r['max_concurrency']:>5} {writer['commits']:>7} "
+            f"{rows_per_commit:>12.1f} {pct(writer['commit']):>15} {pct(writer['queue_wait']):>16} "
+            f"{writer['queue_depth_max']:>11}"
+        )
+    return "\n".join(lines)
+
+def run_benchmark(num_calls, batch_sizes, concurrency_levels, latency, error_rate,
+                  retry_backoff=0.5, seed=0, workdir=None, keep_files=False, extraction_modes=("parser",)):
+    """Tüm senaryo kombinasyonlarını çalıştırır; sonuç listesini döner."""
+    workdir = workdir or tempfile.mkdtemp(prefix="call-llm-bench-")
+    _prepare_environment(workdir, latency, error_rate, retry_backoff)
+
+    from app.build_vector_store import build_vector_store
+
+    build_vector_store()
+    # Pipeline'ın batch başına INFO logları benchmark çıktısını boğmasın
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    try:
+        for extraction_mode in extraction_modes:
+            for batch_size in batch_sizes:
+                for max_concurrency in concurrency_levels:
+                    result = run_scenario(num_calls, batch_size, max_concurrency, seed, extraction_mode)
+                    results.append(result)
+                    print(
+                        f"mod={extraction_mode} batch={batch_size} conc={max_concurrency}: "
+                        f"{result['calls_per_second']:.2f} çağrı/sn "
+                        f"({result['processed']}/{num_calls} işlendi, {result['seconds']:.2f} sn)",
+                        flush=True
+                    )
+                    if result["pending"]:
+                        print(
+                            f"HATA: pipeline {result['pending']} çağrı işlenmeden (pending/in_progress) bitti.",
+                            file=sys.stderr, flush=True
+                        )
+    finally:
+        if not keep_files:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def _median_seconds(func, repeats):
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+def _cold_start_seconds(code, repeats):
+    """Yeni bir Python process'inde import + index yükleme süresi (process başlatma hariç)."""
+    script = f"import time; _s = time.perf_counter(); {code}; print(time.perf_counter() - _s)"
+    durations = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+        durations.append(float(output.stdout.strip().splitlines()[-1]))
+    return statistics.median(durations)
+
+def run_topic_benchmark(num_topics=400, num_queries=2000, dim=1536, repeats=5, seed=0, workdir=None, keep_files=False):
+    """
+    NumPy konu index'ini (TopicIndex) LangChain FAISS yoluyla karşılaştırır: soğuk başlangıç
+    (import + yükleme), sıcak yükleme ve embedding hariç batch eşleme süresi, top-1 uyumu.
+    Vektörler gerçek embedding boyutunda (varsayılan 1536) rastgele üretilir.
+    """
+    import numpy as np
+
+    workdir = workdir or tempfile.mkdtemp(prefix="call-llm-topic-bench-")
+    _prepare_environment(workdir, latency=0.0, error_rate=0.0, retry_backoff=0.5)
+    from langchain_community.vectorstores import FAISS
+    from app.fake_backends import FakeHashEmbeddings
+    from app.topic_index import TopicIndex, save_topic_index
+
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((num_topics, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    topics = [{"ana_konu": f"Ana Konu {i % 20}", "alt_konu": f"Alt Konu {i}"} for i in range(num_topics)]
+    # Sorgular: rastgele bir konunun gürültülü kopyası (gerçek serbest konu metinlerine benzer şekilde yakın)
+    targets = rng.integers(0, num_topics, num_queries)
+    queries = vectors[targets] + 0.05 * rng.standard_normal((num_queries, dim)).astype(np.float32)
+
+    faiss_path, numpy_path = os.path.join(workdir, "faiss_index"), os.environ["TOPIC_INDEX_PATH"]
+    embeddings = FakeHashEmbeddings(dim)
+    try:
+        FAISS.from_embeddings(
+            [(t["alt_konu"], v.tolist()) for t, v in zip(topics, vectors)], embeddings, metadatas=topics
+        ).save_local(faiss_path)
+        save_topic_index(numpy_path, vectors, topics, "benchmark")
+
+        faiss_store = FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True)
+        topic_index = TopicIndex.load(numpy_path, embeddings)
+
+        def faiss_lookup():
+            # app/topic_mapper.search_topics_batch ile aynı yol (embedding hariç)
+            _, indices = faiss_store.index.search(np.asarray(queries, dtype=np.float32), 1)
+            return [faiss_store.docstore.search(faiss_store.index_to_docstore_id[i]).metadata["alt_konu"]
+                    for i in indices[:, 0]]
+
+        def numpy_lookup():
+            indices, _ = topic_index.match_vectors(queries)
+            return [topic_index.topic(i)["alt_konu"] for i in indices]
+
+        agreement = sum(a == b for a, b in zip(faiss_lookup(), numpy_lookup())) / num_queries
+        results = {
+            "topics": num_topics, "queries": num_queries, "dim": dim, "top1_agreement": round(agreement, 4),
+            "faiss": {
+                "cold_start": _cold_start_seconds(
+                    "from langchain_community.vectorstores import FAISS; from app.fake_backends import FakeHashEmbeddings; "
+                    f"FAISS.load_local({faiss_path!r}, FakeHashEmbeddings({dim}), allow_dangerous_deserialization=True)",
+                    repeats),
+                "load": _median_seconds(
+                    lambda: FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True), repeats),
+                "lookup": _median_seconds(faiss_lookup, repeats),
+            },
+            "numpy": {
+                "cold_start": _cold_start_seconds(
+                    f"from app.topic_index import TopicIndex; TopicIndex.load({numpy_path!r}, None)", repeats),
+                "load": _median_seconds(lambda: TopicIndex.load(numpy_path, embeddings), repeats),
+                "lookup": _median_seconds(numpy_lookup, repeats),
+            },
+        }
+    finally:
+        if not keep_files:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def _format_topic_table(results):
+    header = f"{'motor':>6} {'soğuk başlangıç':>16} {'yükleme':>10} {'eşleme':>10} {'sorgu/sn':>12}"
+    lines = [header, "-" * len(header)]
+    for engine in ("faiss", "numpy"):
+        r = results[engine]
+        lines.append(
+            f"{engine:>6} {r['cold_start'] * 1000:>14.1f}ms {r['load'] * 1000:>8.2f}ms "
+            f"{r['lookup'] * 1000:>8.2f}ms {results['queries'] / r['lookup']:>12.0f}"
+        )
+    lines.append(
+        f"({results['topics']} konu, {results['queries']} sorgu, boyut {results['dim']}; "
+        f"top-1 uyumu %{results['top1_agreement'] * 100:.1f})"
+    )
+    return "\n".join(lines)
+
+def _import_profile(code):
+    """
+    Kodu '-X importtime' ile yeni bir process'te çalıştırır. Dönüş: (toplam import süresi ms,
+    {kök paket: ms}). Her modülün kendi (self) süresi kök paketine yazılır; toplamları import süresini verir.
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True
+    )
+    by_package = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        by_package[package] = by_package.get(package, 0.0) + int(self_us) / 1000
+    return sum(by_package.values()), by_package
+
+def run_startup_benchmark(commands=None, repeats=5):
+    """
+    CLI komutlarının (app/cli.py) başlangıç maliyeti: her komutun modülünü yeni bir process'te import
+    eder ve yorumlayıcının kendi başlangıcı (site, encodings) düşülmüş import süresini ölçer.
+    Her komut için medyan süre ve en pahalı kök paketler döner.
+    """
+    from app.cli import COMMAND_MODULES
+
+    baseline = statistics.median(_import_profile("pass")[0] for _ in range(repeats))
+    results = {"interpreter_ms": round(baseline, 1), "commands": {}}
+    for command in commands or list(COMMAND_MODULES):
+        module = COMMAND_MODULES[command]
+        # API anahtarı kontrolü atlanır (load_command yerine doğrudan modül import edilir)
+        code = f"import importlib, app.cli; importlib.import_module({module!r})"
+        profiles = [_import_profile(code) for _ in range(repeats)]
+        totals = sorted(total for total, _ in profiles)
+        by_package = profiles[-1][1]
+        heaviest = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:5]
+        results["commands"][command] = {
+            "module": module,
+            "import_ms": round(totals[len(totals) // 2] - baseline, 1),
+            "heaviest_packages": {package: round(ms, 1) for package, ms in heaviest},
+        }
+    return results
+
+def _format_startup_table(results):
+    header = f"{'komut':>13} {'modül':>22} {'import':>10}  en pahalı paketler (ms)"
+    lines = [header, "-" * (len(header) + 20)]
+    for command, r in results["commands"].items():
+        heaviest = ", ".join(f"{package} {ms:.0f}" for package, ms in r["heaviest_packages"].items())
+        lines.append(f"{command:>13} {r['module']:>22} {r['import_ms']:>8.0f}ms  {heaviest}")
+    lines.append(f"(yorumlayıcı başlangıcı {results['interpreter_ms']:.0f} ms düşülmüştür; medyan)")
+    return "\n".join(lines)
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item]
+
+def _str_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sahte LLM/embedding arka ucuyla pipeline benchmark'ı.")
+    parser.add_argument("--calls", type=int, default=200, help="Senaryo başına sentetik çağrı sayısı")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[5, 10, 20])
+    parser.add_argument("--concurrency", type=_int_list, default=[10, 20, 50])
+    parser.add_argument("--latency", type=float, default=0.5, help="Sahte LLM ortalama gecikmesi (sn)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Sahte LLM hata oranı (0-1)")
+    parser.add_argument("--retry-backoff", type=float, default=0.5,
+                        help="Benchmark'ta kullanılacak RETRY_BACKOFF_BASE_SECONDS")
+    parser.add_argument("--extraction-modes", type=_str_list, default=["parser", "structured"],
+                        help="Karşılaştırılacak çıkarım modları (parser, structured)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Geçici dosyaların yazılacağı dizin (varsayılan: mkdtemp)")
+    parser.add_argument("--keep-files", action="store_true", help="Benchmark dosyalarını silme")
+    parser.add_argument("--json", dest="json_path", help="Sonuçların (tüm aşama istatistikleri) yazılacağı JSON dosyası")
+    parser.add_argument("--topic-index", action="store_true",
+                        help="Pipeline yerine yalnızca konu eşleme (NumPy index vs FAISS) benchmark'ını çalıştır")
+    parser.add_argument("--topics", type=int, default=400, help="Konu index benchmark'ında alt konu sayısı")
+    parser.add_argument("--queries", type=int, default=2000, help="Konu index benchmark'ında sorgu sayısı")
+    parser.add_argument("--dim", type=int, default=1536, help="Konu index benchmark'ında vektör boyutu")
+    parser.add_argument("--startup", action="store_true",
+                        help="Pipeline yerine CLI komutlarının import (başlangıç) süresini ölç (-X importtime)")
+    args = parser.parse_args()
+
+    if args.startup:
+        startup_results = run_startup_benchmark()
+        print("\n--- BAŞLANGIÇ (IMPORT) SÜRESİ ---")
+        print(_format_startup_table(startup_results))
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump(startup_results, f, ensure_ascii=False, indent=2)
+        sys.exit(0)
+
+    if args.topic_index:
+        topic_results = run_topic_benchmark(
+            args.topics, args.queries, args.dim, seed=args.seed, workdir=args.workdir, keep_files=args.keep_files
+        )
+        print("\n--- KONU EŞLEME BENCHMARK SONUCU ---")
+        print(_format_topic_table(topic_results))
+        if args.json_path:
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump(topic_results, f, ensure_ascii=False, indent=2)
+        sys.exit(0)
+
+    results = run_benchmark(
+        args.calls, args.batch_sizes, args.concurrency, args.latency, args.error_rate,
+        retry_backoff=args.retry_backoff, seed=args.seed, workdir=args.workdir, keep_files=args.keep_files,
+        extraction_modes=args.extraction_modes
+    )
+    print("\n--- BENCHMARK SONUCU (süreler sn; llm = çağrı başı gecikme, rag = batch başı, db = commit başı) ---")
+    print(_format_table(results))
+    print("\n--- ÇIKARIM MODU KARŞILAŞTIRMASI ---")
+    print(_format_extraction_table(results))
+    print("\n--- KATMAN İSTATİSTİKLERİ ---")
+    print(_format_tier_table(results))
+    print("\n--- DB YAZMA AŞAMASI (süreler sn) ---")
+    print(_format_db_writer_table(results))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nAyrıntılı sonuçlar '{args.json_path}' dosyasına yazıldı.")
+    # Tekrar denemeli (--error-rate) senaryolar dahil, işlenmeden kalan çağrı bir hatadır
+    if any(result["pending"] for result in results):
+        sys.exit(1)
@@ -1,35 +1,35 @@
 # app/build_vector_store.py
+import hashlib
 import logging
+import os
+import shutil
 from app.utils import load_json_file, setup_logging
-from app.config import TOPIC_HIERARCHY_PATH, OPENAI_API_KEY
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+from app.config import TOPIC_HIERARCHY_PATH, TOPIC_INDEX_PATH, TOPIC_INDEX_KEEP_VERSIONS, EMBEDDING_MODEL
+from app.backends import create_base_embeddings
+from app.topic_index import (
+    FAISS_DIR, current_index_path, load_document_vectors, new_version_dir, publish_version, save_topic_index,
+)
 from langchain_core.documents import Document
-import os
-import shutil 
 
 log = setup_logging()
-FAISS_INDEX_PATH = "data/faiss_index"
+
+def _document_hash(doc):
+    # Konu metni ve etiketleri birlikte özetlenir: örnekler ya da ana konu değişirse doküman "değişmiş" sayılır
+    key = f"{doc.metadata['ana_konu']}\x1f{doc.metadata['alt_konu']}\x1f{doc.page_content}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
 def build_vector_store():
     """
     topic_hierarchy.json dosyasını okur.
     "Alt Konu + Örnekler" metnini vektörize eder.
     Bu, RAG doğruluğu için en zengin bağlamı sağlar.
-    """
-    
-    # Önceki hatalı (gürültüsüz ama aptal) index'i temizle
-    if os.path.exists(FAISS_INDEX_PATH):
-        log.warning(f"Mevcut hatalı index '{FAISS_INDEX_PATH}' bulundu ve siliniyor...")
-        try:
-            shutil.rmtree(FAISS_INDEX_PATH)
-            log.info("Eski index başarıyla silindi.")
-        except Exception as e:
-            log.error(f"Eski index silinirken hata: {e}. Lütfen manuel olarak silin.")
-            return
 
+    Build artımlıdır: önceki sürümde aynı özetle bulunan dokümanların vektörleri yeniden kullanılır,
+    yalnızca eklenen/değişen dokümanlar embed edilir. Yeni sürüm TOPIC_INDEX_PATH/versions/ altında
+    ayrı bir dizine yazılır ve CURRENT işaretçisi en son atomik olarak değiştirilir.
+    """
     log.info("Zenginleştirilmiş vektör veritabanı oluşturma işlemi başlıyor...")
-    
+
     topic_data = load_json_file(TOPIC_HIERARCHY_PATH)
     if not topic_data:
         log.error("Konu hiyerarşisi yüklenemedi.")
@@ -41,35 +41,81 @@ def build_vector_store():
         for alt_konu_item in item.get("alt_konular", []):
             alt_konu = alt_konu_item.get("alt_konu")
             ornekler = alt_konu_item.get("ornekler")
-            
+
             # --- GERÇEK DÜZELTME BURADA ---
             # Vektörize edilecek metin (page_content):
             # Alt konunun kendisi + Anlamsal bağlam için örnekler
             # "Ana Konu" metnini çıkararak gürültüyü azaltıyoruz.
             page_content = f"Alt Konu: {alt_konu}\nÖrnekler: {ornekler}"
-            
+
             # Ana konuyu ve alt konuyu hala metadata'da tutuyoruz
             metadata = {
                 "ana_konu": ana_konu,
                 "alt_konu": alt_konu
             }
-            
+
             docs.append(Document(page_content=page_content, metadata=metadata))
 
     log.info(f"Vektörize edilmek üzere {len(docs)} adet zenginleştirilmiş konu dokümanı oluşturuldu.")
+    hashes = [_document_hash(doc) for doc in docs]
 
+    # Önceki sürümün vektörleri (yalnızca aynı embedding modeliyle oluşturulduysa kullanılabilir)
+    previous_path = current_index_path(TOPIC_INDEX_PATH)
+    previous_vectors, previous_info = load_document_vectors(previous_path) if previous_path else ({}, {})
+    if previous_vectors and previous_info.get("embedding_model") != EMBEDDING_MODEL:
+        log.warning(
+            f"Mevcut index '{previous_info.get('embedding_model')}' ile oluşturulmuş; "
+            f"tüm dokümanlar '{EMBEDDING_MODEL}' ile yeniden vektörize edilecek."
+        )
+        previous_vectors = {}
+
+    if previous_vectors and list(previous_vectors) == hashes and len(set(hashes)) == len(hashes):
+        log.info(f"Konu hiyerarşisi değişmemiş; etkin index ('{previous_path}') kullanılmaya devam ediyor.")
+        return
+
+    changed = [i for i, content_hash in enumerate(hashes) if content_hash not in previous_vectors]
+    removed = len(set(previous_vectors) - set(hashes))
+    log.info(
+        f"Artımlı build: {len(docs) - len(changed)} doküman yeniden kullanılıyor, "
+        f"{len(changed)} yeni/değişmiş doküman vektörize edilecek, {removed} doküman kaldırıldı."
+    )
+
+    staging = None
     try:
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        
-        log.info("Dokümanlar vektörize ediliyor ve FAISS index'i oluşturuluyor...")
-        vector_store = FAISS.from_documents(docs, embeddings)
-        
-        vector_store.save_local(FAISS_INDEX_PATH)
-        log.info(f"Zenginleştirilmiş vektör veritabanı başarıyla '{FAISS_INDEX_PATH}' adresine kaydedildi.")
-        
+        embeddings = create_base_embeddings()
+
+        new_vectors = {}
+        if changed:
+            log.info("Dokümanlar vektörize ediliyor...")
+            embedded = embeddings.embed_documents([docs[i].page_content for i in changed])
+            new_vectors = {hashes[i]: vector for i, vector in zip(changed, embedded)}
+        vectors = [
+            new_vectors[content_hash] if content_hash in new_vectors else previous_vectors[content_hash].tolist()
+            for content_hash in hashes
+        ]
+
+        # Aynı vektörlerden iki index: NumPy konu index'i (varsayılan) ve FAISS (TOPIC_MATCHER="faiss").
+        # Her ikisi de yeni sürüm dizinine yazılır; okuyucular CURRENT değişene kadar eski sürümü görür.
+        version, staging = new_version_dir(TOPIC_INDEX_PATH)
+        metadatas = [doc.metadata for doc in docs]
+        save_topic_index(staging, vectors, metadatas, EMBEDDING_MODEL, hashes=hashes)
+        from langchain_community.vectorstores import FAISS  # yalnızca index gerçekten yeniden yazılırken
+
+        texts = [doc.page_content for doc in docs]
+        vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+        vector_store.save_local(os.path.join(staging, FAISS_DIR))
+
+        publish_version(TOPIC_INDEX_PATH, version, staging, keep_versions=TOPIC_INDEX_KEEP_VERSIONS)
+        staging = None
+        log.info(f"Konu index'i sürüm '{version}' olarak '{TOPIC_INDEX_PATH}' altında yayınlandı ({len(docs)} konu).")
+
     except Exception as e:
-        log.error(f"VVektör veritabanı oluşturulurken hata: {e}")
+        log.error(f"Vektör veritabanı oluşturulurken hata: {e}")
+    finally:
+        if staging is not None:
+            # Yarım kalan sürüm yayınlanmaz; etkin index değişmeden kalır
+            shutil.rmtree(staging, ignore_errors=True)
 
 if __name__ == "__main__":
-    # Bu script artık eski index'i otomatik silip yeniden kurar
-    build_vector_store()
\ No newline at end of file
+    # Yalnızca değişen konular yeniden vektörize edilir; yeni sürüm atomik olarak yayınlanır
+    build_vector_store()
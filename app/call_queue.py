@@ -0,0 +1,170 @@
+# app/call_queue.py
+import datetime
+import os
+import random
+import socket
+from sqlalchemy import select, update, func, or_, and_
+from app.models import CallInput
+from app.config import LEASE_SECONDS, MAX_CALL_ATTEMPTS, RETRY_BACKOFF_BASE_SECONDS, RETRY_BACKOFF_MAX_SECONDS
+
+def utcnow():
+    """Lease karşılaştırmaları için naive UTC zaman damgası."""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+def default_worker_id():
+    """Bu process için benzersiz bir worker kimliği üretir (host-pid)."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def _claimable(now):
+    """
+    Geri çekilme süresi dolmuş 'pending' çağrılar ve lease süresi dolmuş
+    'in_progress' çağrılar sahiplenilebilir.
+    """
+    return or_(
+        and_(
+            CallInput.status == "pending",
+            or_(CallInput.next_attempt_at.is_(None), CallInput.next_attempt_at <= now)
+        ),
+        and_(CallInput.status == "in_progress", CallInput.lease_expires_at < now)
+    )
+
+def _pack_by_tokens(candidates, token_budget, long_threshold):
+    """
+    Sıradaki adaylardan, toplam token'ı 'token_budget'ı aşmayan bir önek seçer.
+    'long_threshold'ı aşan (uzun) transkript sıranın başındaysa tek başına alınır,
+    ortadaysa atlanır (sıranın başına geldiğinde kendi batch'ini alır).
+    """
+    chosen = []
+    total = 0
+    for call_id, tokens in candidates:
+        is_long = long_threshold is not None and tokens > long_threshold
+        if is_long:
+            if not chosen:
+                return [call_id]
+            continue
+        if chosen and token_budget is not None and total + tokens > token_budget:
+            break
+        chosen.append(call_id)
+        total += tokens
+    return chosen
+
+def claim_calls(db_session, worker_id, limit, token_budget=None, long_threshold=None):
+    """
+    En fazla 'limit' adet çağrıyı atomik olarak sahiplenir (status -> 'in_progress',
+    worker_id, lease_expires_at) ve sahiplenilen satırları döner. 'token_budget' verilirse
+    batch, ingest'te hesaplanan token_count'lara göre bu bütçeye sığacak şekilde paketlenir;
+    'long_threshold'ı aşan transkriptler tek başına sahiplenilir.
+    Aynı veritabanını paylaşan diğer worker'lar bu satırları tekrar alamaz.
+    """
+    now = utcnow()
+    lease_until = now + datetime.timedelta(seconds=LEASE_SECONDS)
+
+    # Ön işlemesi yapılmamış (eski) satırlarda token sayısı uzunluktan tahmin edilir
+    tokens = func.coalesce(CallInput.token_count, func.length(CallInput.transcript) / 3 + 1)
+    candidates = db_session.execute(
+        select(CallInput.id, tokens)
+        .where(_claimable(now))
+        .order_by(CallInput.id)
+        .limit(limit)
+    ).all()
+    # Okuma transaction'ı burada biter: SQLite'ta okuma kilidini tutarak yazmaya geçmek,
+    # aynı anda claim yapan worker'lar arasında anında "database is locked" hatasına yol açar
+    db_session.commit()
+    candidate_ids = _pack_by_tokens(candidates, token_budget, long_threshold)
+    if not candidate_ids:
+        return []
+
+    # _claimable tekrar kontrol edilir: arada başka bir worker'ın aldığı satırlar atlanır
+    db_session.execute(
+        update(CallInput)
+        .where(CallInput.id.in_(candidate_ids))
+        .where(_claimable(now))
+        .values(status="in_progress", worker_id=worker_id, lease_expires_at=lease_until)
+        .execution_options(synchronize_session=False)
+    )
+    db_session.commit()
+
+    # Bu claim'e ait satırlar: worker_id + lease bitiş zamanı birlikte claim'i tekil olarak tanımlar
+    return db_session.query(CallInput).filter(
+        CallInput.status == "in_progress",
+        CallInput.worker_id == worker_id,
+        CallInput.lease_expires_at == lease_until
+    ).order_by(CallInput.id).all()
+
+def renew_leases(db_session, worker_id, call_ids):
+    """Hâlâ işlenmekte olan çağrıların lease süresini uzatır (heartbeat)."""
+    if not call_ids:
+        return
+    lease_until = utcnow() + datetime.timedelta(seconds=LEASE_SECONDS)
+    db_session.execute(
+        update(CallInput)
+        .where(CallInput.id.in_(call_ids))
+        .where(CallInput.worker_id == worker_id)
+        .where(CallInput.status == "in_progress")
+        .values(lease_expires_at=lease_until)
+        .execution_options(synchronize_session=False)
+    )
+    db_session.commit()
+
+def release_claims(db_session, worker_id, call_ids):
+    """Yarıda kalan (ör. Ctrl-C) çağrıları lease süresini beklemeden tekrar 'pending' yapar."""
+    if not call_ids:
+        return
+    db_session.execute(
+        update(CallInput)
+        .where(CallInput.id.in_(call_ids))
+        .where(CallInput.worker_id == worker_id)
+        .where(CallInput.status == "in_progress")
+        .values(status="pending", lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db_session.commit()
+
+def release_lease(call):
+    """İşi biten çağrının lease bilgisini temizler (status'u çağıran belirler)."""
+    call.lease_expires_at = None
+
+def call_state_values(call) -> dict:
+    """Çağrının kuyruk durumu kolonları (yazma aşamasında birincil anahtara göre toplu UPDATE için)."""
+    return {
+        "id": call.id,
+        "status": call.status,
+        "lease_expires_at": call.lease_expires_at,
+        "retry_count": call.retry_count,
+        "last_error": call.last_error,
+        "next_attempt_at": call.next_attempt_at,
+    }
+
+def schedule_retry(call, error):
+    """
+    Başarısız çağrıyı üstel geri çekilme ile tekrar kuyruğa alır. MAX_CALL_ATTEMPTS
+    aşılırsa 'dead' (dead-letter) statüsüne taşır. Dönüş: çağrının yeni statüsü.
+    """
+    call.retry_count = (call.retry_count or 0) + 1
+    call.last_error = f"{type(error).__name__}: {error}"[:2000]
+    if call.retry_count >= MAX_CALL_ATTEMPTS:
+        call.status = "dead"
+        call.next_attempt_at = None
+    else:
+        delay = min(RETRY_BACKOFF_BASE_SECONDS * 2 ** (call.retry_count - 1), RETRY_BACKOFF_MAX_SECONDS)
+        # Aynı anda düşen çağrılar aynı anda geri dönmesin diye küçük bir jitter
+        delay *= random.uniform(0.8, 1.2)
+        call.status = "pending"
+        call.next_attempt_at = utcnow() + datetime.timedelta(seconds=delay)
+    return call.status
+
+def seconds_until_next_retry(db_session):
+    """
+    Bir sonraki çağrının sahiplenilebilmesine kalan süre: şu an sahiplenilebilir çağrı varsa 0.0
+    (ör. geri çekilmesi, DB yazıcısı boşaltılırken dolmuş bir çağrı), yoksa geri çekilmede bekleyen
+    en yakın çağrıya kalan süre. Bekleyen ('pending') çağrı kalmadıysa None.
+    """
+    now = utcnow()
+    if db_session.query(CallInput.id).filter(_claimable(now)).first() is not None:
+        return 0.0
+    next_attempt = db_session.query(func.min(CallInput.next_attempt_at)).filter(
+        CallInput.status == "pending"
+    ).scalar()
+    if next_attempt is None:
+        return None
+    return max((next_attempt - now).total_seconds(), 0.0)
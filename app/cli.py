@@ -0,0 +1,155 @@
+# app/cli.py
+"""
+Tek giriş noktası: python -m app <komut>
+
+  ingest        Transkript dosyasını (xlsx/csv/parquet) veritabanına yükler
+  build-index   Konu index'ini (artımlı) oluşturur ve yeni sürümü yayınlar
+  run           Batch pipeline'ını çalıştırır
+  analyze-one   Tek bir çağrıyı analiz edip CallAnalysisOutput JSON'unu yazar
+  serve         Sürekli çalışan HTTP analiz servisini başlatır
+  remap-topics  Guided konuları LLM'siz yeniden eşler
+  stats         Kuyruk, tablo ve günlük konu özetini gösterir
+  export        Sonuçları tarihe göre bölümlenmiş Parquet'e (artımlı) aktarır
+
+Ağır bağımlılıklar (LangChain, FAISS, pandas, pyarrow, SQLAlchemy) yalnızca seçilen komutun modülü
+import edilirken yüklenir; bu dosya modül düzeyinde yalnızca standart kütüphaneyi kullanır.
+OPENAI_API_KEY kontrolü yalnızca API'yi çağıran komutlarda yapılır.
+"""
+import argparse
+import importlib
+import sys
+
+# Komut -> işleyicisinin bulunduğu modül (yalnızca komut çalışırken import edilir; startup benchmark'ı da kullanır)
+COMMAND_MODULES = {
+    "ingest": "app.setup_db",
+    "build-index": "app.build_vector_store",
+    "run": "app.main",
+    "analyze-one": "app.service",
+    "serve": "app.service",
+    "remap-topics": "app.remap_topics",
+    "stats": "app.stats",
+    "export": "app.export",
+}
+# OpenAI'ye istek atan (embedding ya da LLM) komutlar
+API_COMMANDS = {"build-index", "run", "analyze-one", "serve", "remap-topics"}
+
+def load_command(command):
+    """Komutun modülünü import edip döner."""
+    if command in API_COMMANDS:
+        from app.config import require_openai_api_key
+        try:
+            require_openai_api_key()
+        except ValueError as e:
+            sys.exit(f"HATA: {e}")
+    return importlib.import_module(COMMAND_MODULES[command])
+
+def _kwargs(args, *names):
+    # Verilmeyen seçenekler None kalır; modülün kendi varsayılanı kullanılır (varsayılanlar için modül import edilmez)
+    return {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+
+def _ingest(args):
+    load_command("ingest").ingest(**_kwargs(args, "path", "chunk_size"))
+
+def _build_index(args):
+    load_command("build-index").build_vector_store()
+
+def _run(args):
+    main = load_command("run")
+    if args.workers > 1:
+        main.run_workers(args.workers)
+    else:
+        main.run_pipeline(**_kwargs(args, "batch_size", "max_concurrency"))
+
+def _read_transcript(args):
+    if args.id is not None:
+        from app.models import SessionLocal, CallInput
+
+        db_session = SessionLocal()
+        try:
+            call = db_session.get(CallInput, args.id)
+        finally:
+            db_session.close()
+        if call is None:
+            sys.exit(f"HATA: ID'si {args.id} olan çağrı veritabanında bulunamadı.")
+        return call.transcript
+    if args.file == "-":
+        return sys.stdin.read()
+    with open(args.file, encoding="utf-8") as f:
+        return f.read()
+
+def _analyze_one(args):
+    service = load_command("analyze-one")
+    result = service.analyze_one(_read_transcript(args))
+    print(result.model_dump_json(indent=2, ensure_ascii=False))
+
+def _serve(args):
+    load_command("serve").run_service(**_kwargs(args, "host", "port"))
+
+def _remap_topics(args):
+    load_command("remap-topics").run_remap(**_kwargs(args, "chunk_size"), force=args.all)
+
+def _stats(args):
+    load_command("stats").print_stats(
+        as_json=args.json, daily_subtopics=args.daily_subtopics, rebuild=args.rebuild, **_kwargs(args, "days")
+    )
+
+def _export(args):
+    load_command("export").export_outputs(
+        **_kwargs(args, "output_dir", "chunk_size"), full=args.full, include_transcript=not args.without_transcript
+    )
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m app", description="Çağrı analiz pipeline'ı komutları.")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="komut")
+
+    ingest = commands.add_parser("ingest", help="Transkript dosyasını veritabanına yükler")
+    ingest.add_argument("path", nargs="?", help="Yüklenecek dosya (varsayılan: data/new_calls.xlsx)")
+    ingest.add_argument("--chunk-size", type=int)
+    ingest.set_defaults(handler=_ingest)
+
+    build_index = commands.add_parser("build-index", help="Konu index'ini oluşturur")
+    build_index.set_defaults(handler=_build_index)
+
+    run = commands.add_parser("run", help="Batch pipeline'ını çalıştırır")
+    run.add_argument("--workers", type=int, default=1, help="Aynı kuyruğu paylaşan worker process sayısı")
+    run.add_argument("--batch-size", type=int)
+    run.add_argument("--max-concurrency", type=int)
+    run.set_defaults(handler=_run)
+
+    analyze_one = commands.add_parser("analyze-one", help="Tek bir çağrıyı analiz eder")
+    source = analyze_one.add_mutually_exclusive_group(required=True)
+    source.add_argument("--id", type=int, help="calls_input tablosundaki çağrının id'si")
+    source.add_argument("--file", help="Transkript dosyası ('-': standart girdi)")
+    analyze_one.set_defaults(handler=_analyze_one)
+
+    serve = commands.add_parser("serve", help="HTTP analiz servisini başlatır")
+    serve.add_argument("--host")
+    serve.add_argument("--port", type=int)
+    serve.set_defaults(handler=_serve)
+
+    remap = commands.add_parser("remap-topics", help="Guided konuları yeniden eşler")
+    remap.add_argument("--chunk-size", type=int)
+    remap.add_argument("--all", action="store_true", help="Sürümüne bakmadan tüm satırları yeniden eşle")
+    remap.set_defaults(handler=_remap_topics)
+
+    stats = commands.add_parser("stats", help="Kuyruk, tablo ve konu özetini gösterir")
+    stats.add_argument("--json", action="store_true", help="Özeti JSON olarak yaz")
+    stats.add_argument("--days", type=int, help="Konu özetinin kapsadığı gün sayısı (varsayılan: 30)")
+    stats.add_argument("--daily-subtopics", action="store_true", help="Guided alt konuların günlük sayılarını da yaz")
+    stats.add_argument("--rebuild", action="store_true", help="Günlük özetleri calls_output'tan yeniden oluştur")
+    stats.set_defaults(handler=_stats)
+
+    export = commands.add_parser("export", help="Sonuçları Parquet'e aktarır")
+    export.add_argument("output_dir", nargs="?", help="Hedef dizin (varsayılan: exports)")
+    export.add_argument("--full", action="store_true", help="Watermark'ı yok say, tümünü yeniden aktar")
+    export.add_argument("--chunk-size", type=int)
+    export.add_argument("--without-transcript", action="store_true", help="Transkript metnini aktarma")
+    export.set_defaults(handler=_export)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# app/compaction.py
+import asyncio
+import re
+from collections import Counter
+from app.models import CallAnalysisOutput
+from app.preprocess import count_tokens
+from app.rules import detect_signals, apply_rule_flags
+from app.config import COMPACTION_ENABLED, MAP_REDUCE_THRESHOLD_TOKENS, MAP_REDUCE_CHUNK_TOKENS
+
+# Bekleme müziği, anons, sessizlik gibi transkripsiyon notları: "[bekleme müziği]", "(anons)" ...
+_NOTE = re.compile(
+    r"[\[(<{]\s*(?:bekleme|müzik|muzik|anons|sessizlik|hold|music|silence|ses yok|kayıt|beep|bip)[^\])>}]*[\])>}]",
+    re.IGNORECASE
+)
+# Anlam taşımayan dolgu sözcükleri (tek başına geçtiklerinde)
+_FILLER = re.compile(r"(?<![\w'’])(?:ı+h*|e+h*m*|a+h*|hı+|hm+)(?!\w)[,.…]*\s*", re.IGNORECASE)
+# Bilgi taşımayan kalıp cümleler (karşılama, kayıt anonsu, kapanış)
+_BOILERPLATE = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r"görüşmeniz(?:in)? (?:kalite|hizmet)[^.!?]*(?:kaydedil|kayıt altına alın)[^.!?]*[.!?]?",
+        r"[\w'’]+ hoş geldiniz[^.!?]*[.!?]?",
+        r"başka (?:bir )?(?:konuda )?yardımcı olabileceğim (?:bir )?(?:konu|şey)? ?var mı[^.!?]*[.!?]?",
+        r"(?:iyi|güzel) günler dilerim[^.!?]*[.!?]?",
+        r"hattan ayrılmayın(?:ız)?[^.!?]*[.!?]?",
+        r"beni duyabiliyor musunuz[^.!?]*[.!?]?",
+    )
+]
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPEAKER = re.compile(r"^(Müşteri|Temsilci):\s*")
+# Bu uzunluğun (kelime) altındaki satırlar transkriptte tekrar ediyorsa atılır ("Tamam.", "Hatta mısınız?")
+_SHORT_TURN_WORDS = 6
+
+def _line_key(text):
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+def compact_transcript(transcript: str) -> str:
+    """
+    LLM'e gönderilecek transkripti anlamını bozmadan kısaltır:
+    transkripsiyon notlarını ve dolgu sözcüklerini siler, kalıp cümleleri çıkarır,
+    art arda tekrar eden konuşmaları ve transkriptte tekrar eden kısa konuşmaları birleştirir.
+    """
+    lines = []
+    seen_short = set()
+    previous_key = None
+    for line in transcript.split("\n"):
+        speaker_match = _SPEAKER.match(line)
+        speaker = speaker_match.group(0) if speaker_match else ""
+        text = line[len(speaker):]
+        text = _NOTE.sub(" ", text)
+        for pattern in _BOILERPLATE:
+            text = pattern.sub(" ", text)
+        text = _FILLER.sub(" ", text)
+        text = " ".join(text.split())
+        if not text or not _line_key(text):
+            continue
+
+        key = (speaker, _line_key(text))
+        # Art arda aynı konuşma (ör. tekrarlanan selamlama) tek satıra iner
+        if key == previous_key:
+            continue
+        previous_key = key
+        if len(text.split()) < _SHORT_TURN_WORDS:
+            if key in seen_short:
+                continue
+            seen_short.add(key)
+        lines.append(speaker + text)
+    return "\n".join(lines)
+
+def split_into_chunks(transcript: str, chunk_tokens: int):
+    """Transkripti satır sınırlarından, her biri yaklaşık 'chunk_tokens' token olan parçalara böler."""
+    chunks, current, current_tokens = [], [], 0
+    for line in transcript.split("\n"):
+        line_tokens = count_tokens(line)
+        pieces = [line]
+        if line_tokens > chunk_tokens:
+            # Satır sonu olmayan çok uzun metinler kelime sınırından bölünür
+            words = line.split()
+            step = max(1, len(words) * chunk_tokens // line_tokens)
+            pieces = [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        for piece in pieces:
+            piece_tokens = count_tokens(piece)
+            if current and current_tokens + piece_tokens > chunk_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _weighted_choice(values, weights):
+    totals = Counter()
+    for value, weight in zip(values, weights):
+        if value:
+            totals[value] += weight
+    return totals.most_common(1)[0][0] if totals else None
+
+def merge_chunk_results(results, chunk_weights) -> CallAnalysisOutput:
+    """
+    Map-reduce'un 'reduce' adımı: parça bazlı çıkarımları tek bir CallAnalysisOutput'ta birleştirir.
+    Ana konu ve duygu, parçaların token ağırlığıyla en baskın olandır (en çok zaman alan konu);
+    bayraklar herhangi bir parçada varsa doğrudur; niyet ilk parçadan alınır.
+    """
+    first = results[0]
+    main_topic = _weighted_choice([r.main_topic_free for r in results], chunk_weights)
+
+    sub_topics = [main_topic] if main_topic else []
+    for result in results:
+        for topic in result.sub_topics_free or []:
+            if topic not in sub_topics:
+                sub_topics.append(topic)
+
+    keyword_counts = Counter(keyword for result in results for keyword in result.top_keywords)
+    nps_scores = [r.nps_score for r in results if r.nps_score is not None]
+    complaint_reasons = [r.complaint_reason for r in results if r.complaint_reason]
+    nps_rationales = [r.nps_rationale for r in results if r.nps_rationale]
+
+    return CallAnalysisOutput(
+        intent=first.intent,
+        summary=" ".join(r.summary for r in results),
+        main_topic_free=main_topic or first.main_topic_free,
+        sub_topics_free=sub_topics[:3],
+        sentiment=_weighted_choice([r.sentiment for r in results], chunk_weights) or first.sentiment,
+        is_complaint=any(r.is_complaint for r in results),
+        complaint_reason="; ".join(dict.fromkeys(complaint_reasons)) or None,
+        is_product_offer=any(r.is_product_offer for r in results),
+        is_escalation=any(r.is_escalation for r in results),
+        is_regulatory_mention=any(r.is_regulatory_mention for r in results),
+        is_other_bank_mention=any(r.is_other_bank_mention for r in results),
+        # Çağrı sonundaki memnuniyet en belirleyici olduğu için son skorlu parça
+        nps_score=nps_scores[-1] if nps_scores else None,
+        nps_rationale=" ".join(nps_rationales) or None,
+        top_keywords=[keyword for keyword, _ in keyword_counts.most_common(4)],
+    )
+
+def prepare_transcript_parts(transcript: str, token_count=None):
+    """
+    Çıkarım zincirine gidecek transkript metin(ler)ini hazırlar: (COMPACTION_ENABLED ise)
+    sıkıştırır; sonuç MAP_REDUCE_THRESHOLD_TOKENS'ı aşıyorsa parçalara böler.
+    Dönüş: (parçalar, parça token sayıları, orijinal token, gönderilecek token)
+    """
+    original_tokens = token_count or count_tokens(transcript)
+    text = compact_transcript(transcript) if COMPACTION_ENABLED else transcript
+    compacted_tokens = count_tokens(text) if COMPACTION_ENABLED else original_tokens
+    if compacted_tokens <= MAP_REDUCE_THRESHOLD_TOKENS:
+        return [text], [compacted_tokens], original_tokens, compacted_tokens
+
+    chunks = split_into_chunks(text, MAP_REDUCE_CHUNK_TOKENS)
+    # Modelin parçanın bütünün bir bölümü olduğunu bilmesi için başlık eklenir
+    parts = [f"[Bölüm {i}/{len(chunks)}]\n{chunk}" for i, chunk in enumerate(chunks, start=1)]
+    return parts, [count_tokens(chunk) for chunk in chunks], original_tokens, compacted_tokens
+
+async def extract_call(extraction_chain, transcript_start: str, transcript: str, token_count=None):
+    """Tek bir çağrı için (gerekirse map-reduce ile) çıkarım yapar. Dönüş: (sonuç, kazanılan token)."""
+    parts, weights, original_tokens, compacted_tokens = prepare_transcript_parts(transcript, token_count)
+    results = await asyncio.gather(*[
+        extraction_chain.ainvoke({"transcript_start": transcript_start, "full_transcript": part}) for part in parts
+    ])
+    result = results[0] if len(results) == 1 else merge_chunk_results(results, weights)
+    return apply_rule_flags(result, detect_signals(transcript)), original_tokens - compacted_tokens
@@ -5,19 +5,107 @@ import os
 # .env dosyasındaki değişkenleri yükle
 load_dotenv()
 
+# LLM/embedding arka ucu: "openai" (gerçek API) veya "fake" (ağsız, ücretsiz; benchmark ve testler için)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+
+# Anahtar yalnızca API'yi çağıran komutlarda (run, build-index, analyze-one, serve) zorunludur;
+# ingest / stats gibi komutlar anahtarsız çalışır (bkz. require_openai_api_key)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY ortam değişkeni bulunamadı. .env dosyasını kontrol edin.")
 
-# Veritabanı URL'si (models.py'dan alıyoruz)
-from app.models import DATABASE_URL
+def require_openai_api_key():
+    """OpenAI arka ucu seçiliyse anahtarın tanımlı olduğunu doğrular."""
+    if LLM_BACKEND == "openai" and not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY ortam değişkeni bulunamadı. .env dosyasını kontrol edin.")
+
+# Banka simülasyonu için lokal SQLite veritabanı yolu (app/models.py motoru bununla kurar)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./bank_calls.db")
 DB_URL = DATABASE_URL
 
 # İşlem ayarları
 BATCH_SIZE = 5          # Her döngüde kaç çağrı işlenecek
+MAX_CONCURRENT_CALLS = 20  # Aynı anda LLM'de işlenmekte olan (in-flight) en fazla çağrı sayısı
+PROGRESS_LOG_INTERVAL = 30 # Kaç saniyede bir ilerleme/throughput (çağrı/sn) loglanacak
+BATCH_TOKEN_BUDGET = 60_000  # Bir batch'teki transkriptlerin toplam token üst sınırı (batch'ler buna göre paketlenir)
+LONG_TRANSCRIPT_TOKENS = 12_000  # Bu sınırın üstündeki transkriptler tek başına bir batch'e alınır
+COMPACTION_ENABLED = True  # LLM'e gitmeden önce dolgu/tekrar/kalıp cümleleri ayıkla (app/compaction.py)
+MAP_REDUCE_THRESHOLD_TOKENS = 12_000  # Sıkıştırma sonrası bu sınırı aşan transkriptler parça parça çıkarılıp birleştirilir
+MAP_REDUCE_CHUNK_TOKENS = 6_000  # Map-reduce parça boyutu (token)
+NEAR_DUP_JACCARD_THRESHOLD = 0.85 # Bu benzerliğin üstündeki transkriptler yakın-kopya sayılır
+MINHASH_NUM_PERM = 128   # MinHash imza uzunluğu
+MINHASH_SHINGLE_SIZE = 3 # Kelime n-gram (shingle) uzunluğu
+MINHASH_CHUNK_SIZE = 2000 # İmzası hesaplanacak transkriptler bu büyüklükte parçalar halinde okunup yazılır
+LEASE_SECONDS = 600     # Sahiplenilen (in_progress) çağrının lease süresi; dolarsa başka worker geri alır
 MAX_RETRIES = 3          # Hata durumunda kaç kez denenecek
+MAX_CALL_ATTEMPTS = 5    # Bir çağrı en fazla kaç kez kuyruğa geri döner; sonra 'dead' (dead-letter) olur
+RETRY_BACKOFF_BASE_SECONDS = float(os.getenv("RETRY_BACKOFF_BASE_SECONDS", "30"))  # Üstel geri çekilme: 30, 60, 120, ... sn
+RETRY_BACKOFF_MAX_SECONDS = 3600
+# DB yazma aşaması (app/db_writer.py): batch sonuçları kuyruğa alınır, tek bir yazıcı toplu olarak commit eder
+DB_WRITER_MAX_ROWS = 500  # Bekleyen satır sayısı buna ulaşınca hemen commit edilir
+DB_WRITER_MAX_DELAY_SECONDS = 0.2  # İlk bekleyen sonuç en geç bu süre sonunda commit edilir
+DB_WRITER_QUEUE_SIZE = 200  # Kuyruk dolarsa batch'ler yazıcıyı bekler (backpressure)
+# Ölçümler (app/metrics.py): 0'dan farklıysa 127.0.0.1:METRICS_PORT/metrics adresinde Prometheus endpoint'i açılır
+# (--workers ile her worker bir sonraki portu kullanır); run sonunda JSON özeti METRICS_SUMMARY_PATH'e yazılır
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_SUMMARY_PATH = os.getenv("METRICS_SUMMARY_PATH", "logs/metrics_summary.json")
+# Sürekli çalışan analiz servisi (app/service.py): eşzamanlı tekil istekler bir zaman penceresinde
+# mikro-batch'lerde toplanıp tek LLM batch'i + tek RAG aramasıyla işlenir
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+SERVICE_BATCH_WINDOW_SECONDS = float(os.getenv("SERVICE_BATCH_WINDOW_SECONDS", "0.02"))  # İlk istekten sonra bekleme süresi
+SERVICE_MAX_BATCH_SIZE = 20  # Bir mikro-batch'teki en fazla transkript sayısı
+SERVICE_MAX_CONCURRENT_BATCHES = 4  # Aynı anda LLM'de işlenen en fazla mikro-batch sayısı
+SERVICE_MAX_TRANSCRIPTS_PER_REQUEST = 100  # Tek bir HTTP isteğindeki en fazla transkript sayısı
+SERVICE_MAX_BODY_BYTES = 10 * 1024 * 1024  # İstek gövdesi üst sınırı
+# Parquet dışa aktarımı (app/export.py): processed_date=YYYY-MM-DD/ bölümlerine yazılır; kökteki
+# _export_state.json son aktarılan calls_output id'sini (watermark) tutar, sonraki aktarım oradan devam eder
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_CHUNK_SIZE = 10_000  # Veritabanından tek seferde okunan (ve bir row group olarak yazılan) en fazla satır
+EXPORT_COMPRESSION = "zstd"
+
+# OpenAI hız sınırları (hesabınızın limitlerine göre ayarlayın)
+OPENAI_REQUESTS_PER_MINUTE = 500
+OPENAI_TOKENS_PER_MINUTE = 200_000
+LLM_COMPLETION_TOKENS_ESTIMATE = 800  # TPM bütçesi için çıktı token tahmini (yanıt gelince düzeltilir)
+RATE_LIMIT_MIN_CONCURRENCY = 1        # 429 sonrası eşzamanlılığın inebileceği en düşük değer
+RATE_LIMIT_DEFAULT_BACKOFF_SECONDS = 5 # Retry-After başlığı yoksa 429 sonrası duraklama
+RATE_LIMIT_INCREASE_COOLDOWN_SECONDS = 10  # Son 429'dan sonra eşzamanlılık limiti bu süre boyunca artırılmaz
+RATE_LIMIT_MAX_RETRIES = 10           # Limiter'ın duraklatıp tekrar denediği 429'lar için ayrı bütçe (MAX_RETRIES'tan sayılmaz)
 LLM_MODEL = "gpt-5-nano"     # Önerilen model (veya gpt-4-turbo)
+PROMPT_VERSION = "v2"   # Prompt değiştiğinde artırın; sonuç önbelleği (analysis_cache) bu versiyona bağlıdır
+# Çıkarım modu: "parser" (PydanticOutputParser + prompt'ta format talimatları) veya
+# "structured" (with_structured_output: şema API'ye ayrı gider, çıktı şemaya zorlanır)
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "parser")
+EMBEDDING_MODEL = "text-embedding-ada-002"  # RAG index'i ve sorgular için embedding modeli
+
+# İki katmanlı çıkarım: flag alanları (regülasyon, rakip banka, aktarma) kural motoruyla (app/rules.py)
+# doldurulur; kısa ve şikayet/regülasyon/aktarma sinyali olmayan çağrılar küçük modele, azaltılmış şemayla gider
+TIERED_EXTRACTION_ENABLED = os.getenv("TIERED_EXTRACTION_ENABLED", "true").lower() == "true"
+LITE_LLM_MODEL = os.getenv("LITE_LLM_MODEL", "gpt-4.1-nano")  # Akıl yürütmesiz, düşük gecikmeli küçük model
+LITE_MAX_TOKENS = 800  # Bu token sayısının üstündeki transkriptler her zaman ana modele gider
+
+# Sahte (fake) arka uç ayarları (LLM_BACKEND="fake")
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0.5"))  # Yanıt başına ortalama gecikme
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0.0"))  # Hatalı (parse edilemeyen / timeout) yanıt oranı
+FAKE_LITE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LITE_LLM_LATENCY_SECONDS", str(FAKE_LLM_LATENCY_SECONDS / 2)))
+FAKE_EMBEDDING_DIM = 256  # Hash tabanlı sahte embedding boyutu
+if LLM_BACKEND == "fake":
+    # Sahte yanıtlar/vektörler gerçek modelin önbellek ve günlük kayıtlarına karışmasın
+    LLM_MODEL = f"fake-{LLM_MODEL}"
+    LITE_LLM_MODEL = f"fake-{LITE_LLM_MODEL}"
+    EMBEDDING_MODEL = f"fake-hash-{FAKE_EMBEDDING_DIM}"
 
-# Dosya yolları
-TOPIC_HIERARCHY_PATH = "data/topic_hierarchy.json"
-PRODUCT_LIST_PATH = "data/product_list.txt"
\ No newline at end of file
+# Dosya yolları (benchmark gibi izole çalıştırmalar için ortam değişkeniyle değiştirilebilir)
+TOPIC_HIERARCHY_PATH = os.getenv("TOPIC_HIERARCHY_PATH", "data/topic_hierarchy.json")
+PRODUCT_LIST_PATH = os.getenv("PRODUCT_LIST_PATH", "data/product_list.txt")
+# Sürümlü konu index'i kökü: versions/<sürüm>/ (NumPy + FAISS) ve etkin sürümü gösteren CURRENT (app/topic_index.py)
+TOPIC_INDEX_PATH = os.getenv("TOPIC_INDEX_PATH", "data/topic_index")
+TOPIC_INDEX_KEEP_VERSIONS = 3  # build sonrası diskte tutulan sürüm sayısı (etkin sürüm dahil)
+# Çalışan worker'lar CURRENT'ı en fazla bu aralıkla kontrol edip yeni sürüme geçer
+TOPIC_INDEX_REFRESH_SECONDS = float(os.getenv("TOPIC_INDEX_REFRESH_SECONDS", "30"))
+REMAP_CHUNK_SIZE = 2000  # Yeniden eşleme işinde (app/remap_topics.py) tek seferde okunup güncellenen satır sayısı
+# Konu eşleme motoru: "numpy" (mmap'li matris + tek matris çarpımı) veya "faiss" (LangChain FAISS)
+TOPIC_MATCHER = os.getenv("TOPIC_MATCHER", "numpy")
+# NumPy motorunda kosinüs skoru bu değerin altındaki en iyi eşleşme "eşleşme yok" sayılır (0: her zaman eşle)
+TOPIC_MATCH_MIN_SCORE = float(os.getenv("TOPIC_MATCH_MIN_SCORE", "0.0"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000  # Aşılınca en eski kullanılan (LRU) kayıtlar silinir
\ No newline at end of file
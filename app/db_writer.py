@@ -0,0 +1,177 @@
+# app/db_writer.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from sqlalchemy import update
+from app.models import SessionLocal, CallInput
+from app.analytics import insert_call_outputs
+from app.result_cache import store_cached_results
+from app.journal import clear_journal
+from app.config import DB_WRITER_MAX_ROWS, DB_WRITER_MAX_DELAY_SECONDS, DB_WRITER_QUEUE_SIZE
+from app.dedupe import resolve_duplicates, release_duplicates
+from app.utils import setup_logging
+from app import metrics
+
+log = setup_logging()
+
+@dataclass
+class BatchWrite:
+    """
+    Bir batch'in kalıcı hale getirilecek sonuçları. Yalnızca düz veri taşır (ORM nesnesi yok);
+    yazıcı thread'i kendi oturumunu kullanır. Bir BatchWrite'ın tüm değişiklikleri aynı
+    transaction'da commit edilir (çıktı + günlük silme atomiktir).
+    """
+    outputs: list = field(default_factory=list)  # calls_output satırları (call_output_values)
+    call_updates: list = field(default_factory=list)  # calls_input güncellemeleri: {"id": ..., "status": ..., ...}
+    cache_entries: list = field(default_factory=list)  # analysis_cache satırları (cached_result_values)
+    journal_hashes: list = field(default_factory=list)  # Sonucu yazılan, günlükten silinecek içerik özetleri
+    representative_results: dict = field(default_factory=dict)  # temsilci id -> CallAnalysisOutput (kopyalar için)
+    representative_versions: dict = field(default_factory=dict)  # temsilci id -> hierarchy_version
+    dead_ids: list = field(default_factory=list)  # Kopyaları serbest bırakılacak 'dead' temsilciler
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+    def row_count(self):
+        return len(self.outputs) + len(self.call_updates)
+
+def _apply(db_session, writes):
+    """BatchWrite'ları tek transaction'da uygular: her tablo için tek bir toplu (executemany) ifade."""
+    outputs = [row for write in writes for row in write.outputs]
+    call_updates = [row for write in writes for row in write.call_updates]
+    cache_entries = [row for write in writes for row in write.cache_entries]
+    journal_hashes = {content_hash for write in writes for content_hash in write.journal_hashes}
+    store_cached_results(db_session, cache_entries)
+    clear_journal(db_session, journal_hashes)
+    # Çıktılar, alt konu/anahtar kelime satırları ve günlük rollup'lar aynı transaction'da yazılır
+    insert_call_outputs(db_session, outputs)
+    if call_updates:
+        # Birincil anahtara göre toplu UPDATE (aynı kolon kümesine sahip satırlar tek executemany'de)
+        db_session.execute(update(CallInput), call_updates)
+
+    representative_results, representative_versions, dead_ids = {}, {}, []
+    for write in writes:
+        representative_results.update(write.representative_results)
+        representative_versions.update(write.representative_versions)
+        dead_ids.extend(write.dead_ids)
+    # Bu çağrıların yakın-kopyaları (dedupe aşaması) aynı analizi LLM'siz kullanır
+    resolved = resolve_duplicates(db_session, representative_results, representative_versions)
+    if resolved:
+        log.info(f"{resolved} yakın-kopya çağrı temsilci analizinden dolduruldu (LLM çağrısı önlendi).")
+    # Dead-letter'a düşen temsilcilerin yakın-kopyaları bağımsız olarak işlenmeye devam eder
+    release_duplicates(db_session, dead_ids)
+
+class DBWriter:
+    """
+    Tek yazıcılı DB aşaması. Batch'ler sonuçlarını submit() ile kuyruğa bırakıp LLM işine devam eder;
+    tek bir yazıcı görevi kuyruğu boşaltır ve biriken sonuçları ayrı bir thread'de toplu olarak yazar.
+    Commit, bekleyen satır sayısı DB_WRITER_MAX_ROWS'a ulaşınca ya da ilk sonuç
+    DB_WRITER_MAX_DELAY_SECONDS beklediğinde yapılır. SQLite'a aynı anda tek yazıcı yazdığı için
+    batch'ler birbirinin kilidini beklemez ve event loop SQLite gecikmesiyle durmaz.
+    Metrikler: db_queue_depth (gauge), db_commit / db_write / db_queue_wait (süre), db_commits,
+    db_rows_written, db_write_errors (sayaç).
+    """
+
+    def __init__(self, max_rows=DB_WRITER_MAX_ROWS, max_delay=DB_WRITER_MAX_DELAY_SECONDS,
+                 queue_size=DB_WRITER_QUEUE_SIZE):
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._arrived = asyncio.Event()
+        # SQLite bağlantıları tek thread'de kalsın; yazmalar sırayla yapılır
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def submit(self, write: BatchWrite):
+        """Batch sonucunu yazma kuyruğuna ekler. Kuyruk doluysa yer açılana kadar bekler."""
+        if self._task is None or self._task.done():
+            raise RuntimeError("DB yazıcısı çalışmıyor")
+        write.enqueued_at = time.perf_counter()
+        await self._queue.put(write)
+        self._arrived.set()
+        metrics.gauge("db_queue_depth", self._queue.qsize())
+
+    async def drain(self):
+        """Kuyruktaki tüm sonuçlar commit edilene kadar bekler."""
+        if self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def close(self):
+        """Bekleyen sonuçları yazar ve yazıcıyı durdurur."""
+        try:
+            await self.drain()
+        finally:
+            if self._task is not None:
+                self._task.cancel()
+                try:
+                    await self._task
+                except asyncio.CancelledError:
+                    pass
+            self._executor.shutdown(wait=True)
+
+    async def _collect(self):
+        """İlk sonucu bekler; ardından satır ya da süre eşiğine kadar gelenleri toplar."""
+        writes = [await self._queue.get()]
+        rows = writes[0].row_count()
+        deadline = writes[0].enqueued_at + self.max_delay
+        while rows < self.max_rows:
+            if not self._queue.empty():
+                write = self._queue.get_nowait()
+                writes.append(write)
+                rows += write.row_count()
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            # Kuyruk öğesi yerine olay beklenir: zaman aşımında kuyruktan öğe kaybolmaz
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        return writes
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            writes = await self._collect()
+            try:
+                await loop.run_in_executor(self._executor, self._flush, writes)
+            finally:
+                metrics.gauge("db_queue_depth", self._queue.qsize())
+                for _ in writes:
+                    self._queue.task_done()
+
+    def _flush(self, writes):
+        """Yazıcı thread'inde çalışır. Toplu yazım başarısız olursa batch'ler tek tek denenir."""
+        start = time.perf_counter()
+        groups = [writes]
+        while groups:
+            group = groups.pop(0)
+            db_session = SessionLocal()
+            try:
+                _apply(db_session, group)
+                commit_start = time.perf_counter()
+                db_session.commit()
+                metrics.observe("db_commit", time.perf_counter() - commit_start)
+                metrics.increment("db_commits")
+                metrics.increment("db_rows_written", sum(write.row_count() for write in group))
+                now = time.perf_counter()
+                for write in group:
+                    metrics.observe("db_queue_wait", now - write.enqueued_at)
+            except Exception as e:
+                db_session.rollback()
+                if len(group) > 1:
+                    log.warning(f"Toplu DB yazımı başarısız ({e}); {len(group)} batch tek tek yazılıyor...")
+                    groups = [[write] for write in group] + groups
+                    continue
+                # Çağrılar 'in_progress' kalır; lease dolunca tekrar işlenir (LLM yanıtı günlükte durur)
+                metrics.increment("db_write_errors")
+                metrics.increment("errors", stage="db_write", type=type(e).__name__)
+                log.error(f"Batch sonuçları veritabanına yazılamadı: {e}")
+            finally:
+                db_session.close()
+        metrics.observe("db_write", time.perf_counter() - start)
@@ -0,0 +1,231 @@
+# app/dedupe.py
+import hashlib
+import re
+import time
+from collections import defaultdict
+import numpy as np
+from sqlalchemy import select, update
+from app.models import SessionLocal, CallInput, CallOutput, create_db_and_tables, call_output_values
+from app.analytics import insert_call_outputs
+from app.config import NEAR_DUP_JACCARD_THRESHOLD, MINHASH_NUM_PERM, MINHASH_SHINGLE_SIZE, MINHASH_CHUNK_SIZE
+from app.utils import setup_logging
+
+log = setup_logging()
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Sabit tohum: imzalar farklı çalıştırmalar arasında karşılaştırılabilir olmalı
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, np.iinfo(np.int64).max, size=MINHASH_NUM_PERM, dtype=np.int64).astype(np.uint64)
+_PERM_B = _rng.randint(0, np.iinfo(np.int64).max, size=MINHASH_NUM_PERM, dtype=np.int64).astype(np.uint64)
+
+# Şablon çağrılarda farklılaşan kısımlar (tutar, tarih, kart no vb.) karşılaştırmayı bozmasın
+_DIGITS = re.compile(r"\d+")
+_WORD = re.compile(r"\w+")
+
+def _shingles(transcript: str):
+    """Transkripti normalize edip kelime n-gram'larına (shingle) ayırır."""
+    text = transcript.replace("İ", "i").replace("I", "ı").lower()
+    words = _WORD.findall(_DIGITS.sub("0", text))
+    if len(words) < MINHASH_SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + MINHASH_SHINGLE_SIZE]) for i in range(len(words) - MINHASH_SHINGLE_SIZE + 1)}
+
+def minhash_signature(transcript: str) -> np.ndarray:
+    """Transkriptin MinHash imzasını (MINHASH_NUM_PERM adet uint32) hesaplar."""
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+         for s in _shingles(transcript)],
+        dtype=np.uint64
+    )
+    with np.errstate(over="ignore"):
+        permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=1).astype(np.uint32)
+
+def _lsh_params(threshold, num_perm):
+    """Eşik benzerliğine en yakın 'S-eğrisi' dönüm noktasını veren (bant, satır) çiftini seçer."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+def find_near_duplicate_clusters(signatures, threshold=NEAR_DUP_JACCARD_THRESHOLD):
+    """
+    LSH bantlama ile aday çiftleri bulur, tahmini Jaccard benzerliği eşiği geçenleri
+    union-find ile kümeler. Dönüş: [[call_id, ...], ...] (yalnızca 2+ elemanlı kümeler)
+    """
+    bands, rows = _lsh_params(threshold, MINHASH_NUM_PERM)
+    parent = {call_id: call_id for call_id in signatures}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for band in range(bands):
+        buckets = defaultdict(list)
+        for call_id, signature in signatures.items():
+            buckets[signature[band * rows:(band + 1) * rows].tobytes()].append(call_id)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            for position, other in enumerate(members[1:], start=1):
+                # Aynı bantta buluşan önceki üyelerden biriyle eşiği geçmesi yeterli
+                for earlier in members[:position]:
+                    if find(earlier) == find(other):
+                        break
+                    if np.mean(signatures[earlier] == signatures[other]) >= threshold:
+                        parent[find(other)] = find(earlier)
+                        break
+
+    clusters = defaultdict(list)
+    for call_id in signatures:
+        clusters[find(call_id)].append(call_id)
+    return [sorted(members) for members in clusters.values() if len(members) > 1]
+
+def _copy_output_values(source: CallOutput, input_call_id) -> dict:
+    """Temsilci çağrının analiz satırını kopya çağrı için çoğaltır (insert_call_outputs'a verilecek kolon değerleri)."""
+    columns = [c.name for c in CallOutput.__table__.columns if c.name not in ("id", "input_call_id", "processed_at")]
+    return {"input_call_id": input_call_id, **{name: getattr(source, name) for name in columns}}
+
+def resolve_duplicates(db_session, representative_results, hierarchy_versions=None):
+    """
+    İşlenen temsilci çağrıların sonuçlarını, 'duplicate' olarak işaretlenmiş kopyalarına yazar.
+    representative_results: {temsilci CallInput.id: CallAnalysisOutput}; hierarchy_versions:
+    {temsilci CallInput.id: konu index'i sürümü}. Commit çağırana aittir.
+    Dönüş: LLM'e gitmeden işlenen kopya çağrı sayısı.
+    """
+    if not representative_results:
+        return 0
+    duplicates = db_session.query(CallInput).filter(
+        CallInput.duplicate_of.in_(list(representative_results)),
+        CallInput.status == "duplicate"
+    ).all()
+    insert_call_outputs(db_session, [
+        call_output_values(
+            duplicate.id, representative_results[duplicate.duplicate_of],
+            (hierarchy_versions or {}).get(duplicate.duplicate_of)
+        )
+        for duplicate in duplicates
+    ])
+    for duplicate in duplicates:
+        duplicate.status = "processed"
+    return len(duplicates)
+
+def release_duplicates(db_session, representative_ids):
+    """
+    Temsilcisi 'dead'/'failed' olan kopyaları bağımsız çağrı olarak tekrar 'pending' yapar.
+    Commit çağırana aittir. Dönüş: serbest bırakılan kopya sayısı.
+    """
+    if not representative_ids:
+        return 0
+    return db_session.query(CallInput).filter(
+        CallInput.status == "duplicate",
+        CallInput.duplicate_of.in_(list(representative_ids))
+    ).update({"status": "pending", "duplicate_of": None}, synchronize_session=False)
+
+def _compute_missing_signatures(db_session, chunk_size=MINHASH_CHUNK_SIZE):
+    """
+    İmzası olmayan transkriptlerin MinHash imzalarını id sırasıyla parça parça hesaplayıp yazar.
+    Yalnızca id ve (ingest'te normalize edilmiş) transkript okunur; büyük bir ingest sonrasında da
+    bellekte aynı anda en fazla bir parça transkript bulunur. Dönüş: imzası hesaplanan satır sayısı.
+    """
+    computed = 0
+    last_id = 0
+    while True:
+        rows = db_session.execute(
+            select(CallInput.id, CallInput.transcript)
+            .where(CallInput.id > last_id, CallInput.minhash.is_(None))
+            .order_by(CallInput.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return computed
+        last_id = rows[-1].id
+        db_session.execute(update(CallInput), [
+            {"id": row.id, "minhash": minhash_signature(row.transcript).tobytes()} for row in rows
+        ])
+        db_session.commit()
+        computed += len(rows)
+
+def flag_near_duplicates(threshold=NEAR_DUP_JACCARD_THRESHOLD):
+    """
+    Tüm transkriptler üzerinde yakın-kopya kümelerini bulur. Her kümede bir temsilci seçilir
+    (varsa zaten işlenmiş çağrı); bekleyen diğer üyeler 'duplicate' olarak işaretlenir ve
+    temsilcinin analizi hazır olduğunda LLM'e gitmeden onu kullanır.
+    """
+    create_db_and_tables()
+    db_session = SessionLocal()
+    start_time = time.time()
+    try:
+        # Temsilcisi kalıcı olarak başarısız olmuş kopyaları kuyruğa geri bırak
+        failed_ids = [row.id for row in db_session.query(CallInput.id).filter(CallInput.status.in_(["failed", "dead"]))]
+        released = release_duplicates(db_session, failed_ids)
+        if released:
+            log.info(f"Temsilcisi başarısız olan {released} kopya çağrı tekrar 'pending' yapıldı.")
+
+        # İmzası olmayan (yeni) transkriptlerin MinHash imzalarını hesapla ve sakla
+        computed = _compute_missing_signatures(db_session)
+        log.info(f"{computed} yeni transkript için MinHash imzası hesaplandı.")
+
+        rows = db_session.query(CallInput.id, CallInput.status, CallInput.minhash).filter(
+            CallInput.status.notin_(["failed", "dead"])
+        ).all()
+        signatures = {row.id: np.frombuffer(row.minhash, dtype=np.uint32) for row in rows}
+        statuses = {row.id: row.status for row in rows}
+
+        clusters = find_near_duplicate_clusters(signatures, threshold)
+
+        flagged = 0
+        reused = 0
+        copied_outputs = []
+        for members in clusters:
+            processed = [call_id for call_id in members if statuses[call_id] == "processed"]
+            # Zincirleme kopya oluşmasın: 'duplicate' çağrılar temsilci olamaz
+            candidates = processed or [
+                call_id for call_id in members if statuses[call_id] in ("pending", "in_progress")
+            ]
+            if not candidates:
+                continue
+            representative_id = candidates[0]
+            representative_output = None
+            if processed:
+                representative_output = db_session.query(CallOutput).filter(
+                    CallOutput.input_call_id == representative_id
+                ).first()
+
+            for call_id in members:
+                if call_id == representative_id or statuses[call_id] != "pending":
+                    continue
+                call = db_session.get(CallInput, call_id)
+                call.duplicate_of = representative_id
+                if representative_output is not None:
+                    copied_outputs.append(_copy_output_values(representative_output, call_id))
+                    call.status = "processed"
+                    reused += 1
+                else:
+                    call.status = "duplicate"
+                    flagged += 1
+        insert_call_outputs(db_session, copied_outputs)
+        db_session.commit()
+
+        log.info(
+            f"Yakın-kopya taraması {time.time() - start_time:.2f} sn sürdü: {len(clusters)} küme "
+            f"(Jaccard >= {threshold}). {reused} çağrı mevcut analizden anında dolduruldu, "
+            f"{flagged} çağrı temsilcisinin analizini bekleyecek. Toplam {reused + flagged} LLM çağrısı önlendi."
+        )
+        return reused + flagged
+    except Exception as e:
+        db_session.rollback()
+        log.error(f"Yakın-kopya taraması sırasında hata: {e}")
+    finally:
+        db_session.close()
+
+if __name__ == "__main__":
+    flag_near_duplicates()
@@ -0,0 +1,178 @@
+# app/embedding_cache.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+from app import metrics
+
+log = logging.getLogger(__name__)
+
+def normalize_text(text: str) -> str:
+    """Önbellek anahtarı için metni normalize eder (Unicode NFC + boşluk sadeleştirme)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+class CachedEmbeddings(Embeddings):
+    """
+    Herhangi bir Embeddings nesnesini saran, SQLite tabanlı kalıcı embedding önbelleği.
+    Anahtar: (embedding modeli, normalize edilmiş metin). Önbellek 'max_entries'
+    kaydı aşınca en uzun süredir kullanılmayan (LRU) kayıtlar silinir.
+    Hit/miss sayaçları ve miss'lerde harcanan süre 'stats()' ile okunabilir.
+    Async yolda SQLite okuma/yazmaları event loop'u bloklamasın diye ayrı bir thread'de yapılır.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str,
+                 cache_path: str = EMBEDDING_CACHE_PATH,
+                 max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.miss_seconds = 0.0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._entry_count = 0
+
+    # --- SQLite yardımcıları ---
+
+    def _connection(self):
+        if self._conn is None:
+            cache_dir = os.path.dirname(self.cache_path)
+            if cache_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+            self._conn = sqlite3.connect(self.cache_path, timeout=30, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, text))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+            self._entry_count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._conn
+
+    def _lookup(self, texts):
+        """Önbellekte bulunan metinlerin vektörlerini döner ve son kullanım zamanlarını günceller."""
+        found = {}
+        with self._lock:
+            conn = self._connection()
+            for text in texts:
+                row = conn.execute(
+                    "SELECT vector FROM embeddings WHERE model = ? AND text = ?",
+                    (self.model_name, text)
+                ).fetchone()
+                if row:
+                    found[text] = np.frombuffer(row[0], dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text = ?",
+                    [(now, self.model_name, text) for text in found]
+                )
+                conn.commit()
+        return found
+
+    def _store(self, texts, vectors):
+        """Yeni vektörleri yazar; kapasite aşıldıysa LRU kayıtları siler."""
+        now = time.time()
+        rows = [
+            (self.model_name, text, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            conn = self._connection()
+            # Yalnızca gerçekten eklenen satırlar sayılır; aynı anahtarı (ör. başka bir process) zaten
+            # yazmışsa kayıt güncellenir ve kayıt sayısı değişmez
+            changes_before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text, vector, last_used) VALUES (?, ?, ?, ?)", rows
+            )
+            inserted = conn.total_changes - changes_before
+            if inserted < len(rows):
+                conn.executemany(
+                    "UPDATE embeddings SET vector = ?, last_used = ? WHERE model = ? AND text = ?",
+                    [(vector, last_used, model, text) for model, text, vector, last_used in rows]
+                )
+            self._entry_count += inserted
+            if self._entry_count > self.max_entries:
+                # Her seferinde tek tek silmemek için kapasitenin %90'ına kadar boşalt
+                evict_count = self._entry_count - int(self.max_entries * 0.9)
+                conn.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (evict_count,)
+                )
+                self._entry_count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                log.info(f"Embedding önbelleğinden {evict_count} eski kayıt silindi.")
+            conn.commit()
+
+    # --- Embeddings arayüzü ---
+
+    def _split(self, texts):
+        normalized = [normalize_text(text) for text in texts]
+        found = self._lookup(list(dict.fromkeys(normalized)))
+        missing = [text for text in dict.fromkeys(normalized) if text not in found]
+        hits = sum(1 for text in normalized if text in found)
+        self.hits += hits
+        self.misses += len(missing)
+        metrics.increment("embedding_cache_hits", hits)
+        metrics.increment("embedding_cache_lookups", hits + len(missing))
+        return normalized, found, missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        normalized, found, missing = self._split(texts)
+        if missing:
+            start = time.time()
+            vectors = self.underlying.embed_documents(missing)
+            self.miss_seconds += time.time() - start
+            metrics.observe("embedding_api", time.time() - start)
+            self._store(missing, vectors)
+            found.update(zip(missing, vectors))
+        return [list(found[text]) for text in normalized]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        normalized, found, missing = await asyncio.to_thread(self._split, texts)
+        if missing:
+            start = time.time()
+            vectors = await self.underlying.aembed_documents(missing)
+            self.miss_seconds += time.time() - start
+            metrics.observe("embedding_api", time.time() - start)
+            await asyncio.to_thread(self._store, missing, vectors)
+            found.update(zip(missing, vectors))
+        return [list(found[text]) for text in normalized]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    # --- İstatistikler ---
+
+    def stats(self):
+        """Önbellek hit/miss sayaçlarını ve miss'lerde harcanan embedding süresini döner."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "miss_seconds": round(self.miss_seconds, 3),
+            # Hit başına ortalama miss gecikmesi kadar süre kazanıldığı varsayımı
+            "estimated_saved_seconds": round(self.miss_seconds / self.misses * self.hits, 3) if self.misses else 0.0,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        log.info(
+            f"Embedding önbelleği: {stats['hits']} hit, {stats['misses']} miss "
+            f"(hit oranı %{stats['hit_rate'] * 100:.1f}), miss süresi {stats['miss_seconds']} sn, "
+            f"tahmini kazanç ~{stats['estimated_saved_seconds']} sn."
+        )
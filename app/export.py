@@ -0,0 +1,203 @@
+# app/export.py
+"""
+calls_input + calls_output satırlarını analiz için Parquet'e aktarır.
+
+Satırlar calls_output.id sırasıyla EXPORT_CHUNK_SIZE'lık parçalar halinde okunur (tüm tablo belleğe
+alınmaz) ve işlendikleri güne göre hive tarzı bölümlere yazılır:
+
+    exports/processed_date=2026-10-17/part-20261017T120000123456-1a2b.parquet
+
+Alt konu ve anahtar kelime sütunları ", " ile birleştirilmiş metin yerine list<string>'dir.
+Kökteki _export_state.json son aktarılan calls_output id'sini (watermark) tutar; sonraki aktarım
+yalnızca ondan sonra yazılmış satırları ekler. calls_output id'leri commit sırasıyla artar (SQLite
+yazıcıları sıralıdır), bu yüzden id watermark'ı satır kaçırmaz. Guided konuları sonradan değişen
+satırlar (remap-topics) artımlı aktarımda yeniden yazılmaz; bunun için --full kullanılır.
+
+Dosyalar önce '.' ile başlayan geçici adlarla yazılır (pyarrow.dataset / Spark / DuckDB bunları
+okumaz), aktarım bitince yerlerine taşınır; watermark en son güncellenir. Yarıda kalan bir aktarım
+yarım dosya yayınlamaz ve hiçbir satırı atlamaz (yalnızca taşıma ile watermark arasında çökülürse
+aynı satırlar bir sonraki aktarımda tekrar yazılabilir).
+
+Okuma örneği:
+    pyarrow.dataset.dataset("exports", format="parquet", partitioning="hive").to_table()
+"""
+import argparse
+import json
+import os
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select
+from app.models import SessionLocal, CallInput, CallOutput, create_db_and_tables
+from app.analytics import split_list
+from app.call_queue import utcnow
+from app.config import EXPORT_DIR, EXPORT_CHUNK_SIZE, EXPORT_COMPRESSION
+from app.utils import setup_logging
+
+log = setup_logging()
+
+STATE_FILE = "_export_state.json"
+PARTITION_COLUMN = "processed_date"
+LIST_COLUMNS = ("sub_topics_free", "sub_topics_guided", "top_keywords")
+
+# (sütun adı, kaynak kolon, Arrow tipi); bölüm sütunu (processed_date) dosyaya değil dizin adına yazılır
+_COLUMNS = [
+    ("output_id", CallOutput.id, pa.int64()),
+    ("call_input_id", CallInput.id, pa.int64()),
+    ("call_id", CallInput.call_id, pa.string()),
+    ("call_created_at", CallInput.created_at, pa.timestamp("us", tz="UTC")),
+    ("token_count", CallInput.token_count, pa.int32()),
+    ("duplicate_of", CallInput.duplicate_of, pa.int64()),
+    ("intent", CallOutput.intent, pa.string()),
+    ("summary", CallOutput.summary, pa.string()),
+    ("main_topic_free", CallOutput.main_topic_free, pa.string()),
+    ("main_topic_guided", CallOutput.main_topic_guided, pa.string()),
+    ("sub_topics_free", CallOutput.sub_topics_free, pa.list_(pa.string())),
+    ("sub_topics_guided", CallOutput.sub_topics_guided, pa.list_(pa.string())),
+    ("sentiment", CallOutput.sentiment, pa.string()),
+    ("is_complaint", CallOutput.is_complaint, pa.bool_()),
+    ("complaint_reason", CallOutput.complaint_reason, pa.string()),
+    ("is_product_offer", CallOutput.is_product_offer, pa.bool_()),
+    ("is_escalation", CallOutput.is_escalation, pa.bool_()),
+    ("is_regulatory_mention", CallOutput.is_regulatory_mention, pa.bool_()),
+    ("is_other_bank_mention", CallOutput.is_other_bank_mention, pa.bool_()),
+    ("nps_score", CallOutput.nps_score, pa.int32()),
+    ("nps_rationale", CallOutput.nps_rationale, pa.string()),
+    ("top_keywords", CallOutput.top_keywords, pa.list_(pa.string())),
+    ("hierarchy_version", CallOutput.hierarchy_version, pa.string()),
+    ("processed_at", CallOutput.processed_at, pa.timestamp("us", tz="UTC")),
+]
+_TRANSCRIPT_COLUMN = ("transcript", CallInput.transcript, pa.string())
+
+def read_state(output_dir):
+    """Son aktarımın durumunu ({"last_output_id", ...}) döner; hiç aktarım yapılmadıysa None."""
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_state(output_dir, state):
+    # CURRENT işaretçisindeki gibi (app/topic_index.py): geçici dosyaya yaz, atomik olarak değiştir
+    tmp_path = os.path.join(output_dir, f".{STATE_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, STATE_FILE))
+
+def _iter_chunks(db_session, columns, after_id, chunk_size):
+    """calls_output.id > after_id satırlarını id sırasıyla (keyset sayfalama) parça parça verir."""
+    query = (
+        select(*(source for _, source, _ in columns))
+        .join(CallInput, CallInput.id == CallOutput.input_call_id)
+    )
+    last_id = after_id
+    while True:
+        rows = db_session.execute(
+            query.where(CallOutput.id > last_id).order_by(CallOutput.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield rows
+
+def _partition_tables(rows, columns, schema):
+    """Bir parçayı işlendiği güne göre gruplayıp gün -> Arrow tablosu döner."""
+    names = [name for name, _, _ in columns]
+    processed_at_index = names.index("processed_at")
+    by_day = {}
+    for row in rows:
+        # processed_at'i olmayan (çok eski) satırlar rollup'lardaki gibi bugüne sayılır
+        day = (row[processed_at_index] or utcnow()).date().isoformat()
+        by_day.setdefault(day, []).append(row)
+    return {
+        day: pa.Table.from_pydict({
+            name: [split_list(row[i]) if name in LIST_COLUMNS else row[i] for row in day_rows]
+            for i, name in enumerate(names)
+        }, schema=schema)
+        for day, day_rows in by_day.items()
+    }
+
+def _published_parts(output_dir):
+    for entry in os.scandir(output_dir):
+        if entry.is_dir() and entry.name.startswith(f"{PARTITION_COLUMN}="):
+            for part in os.scandir(entry.path):
+                if part.name.startswith("part-") and part.name.endswith(".parquet"):
+                    yield part.path
+
+def export_outputs(output_dir=EXPORT_DIR, full=False, chunk_size=EXPORT_CHUNK_SIZE, include_transcript=True):
+    """
+    Son watermark'tan sonra yazılmış çıktıları Parquet bölümlerine ekler (full=True: hepsini baştan
+    yazar ve önceki dosyaları kaldırır). Her gün için bu aktarımda tek dosya açılır, her parça bir
+    row group olarak eklenir. Dönüş: {"rows", "files", "last_output_id"}.
+    """
+    create_db_and_tables()
+    os.makedirs(output_dir, exist_ok=True)
+    state = None if full else read_state(output_dir)
+    after_id = state["last_output_id"] if state else 0
+    if state and state.get("include_transcript", True) != include_transcript:
+        # Aynı veri kümesindeki dosyaların şeması farklı olmasın
+        raise ValueError(
+            f"'{output_dir}' transkript sütunu {'ile' if state.get('include_transcript', True) else 'olmadan'} "
+            "aktarılmış; seçeneği değiştirmek için --full ile yeniden aktarın."
+        )
+    columns = _COLUMNS + [_TRANSCRIPT_COLUMN] if include_transcript else _COLUMNS
+    schema = pa.schema([(name, arrow_type) for name, _, arrow_type in columns])
+    run_id = f"{utcnow():%Y%m%dT%H%M%S%f}-{os.getpid():x}"
+    previous_parts = list(_published_parts(output_dir)) if full else []
+
+    start_time = time.time()
+    writers = {}  # gün -> (ParquetWriter, geçici yol, nihai yol)
+    exported = 0
+    last_id = after_id
+    db_session = SessionLocal()
+    try:
+        for rows in _iter_chunks(db_session, columns, after_id, chunk_size):
+            for day, table in _partition_tables(rows, columns, schema).items():
+                if day not in writers:
+                    partition_dir = os.path.join(output_dir, f"{PARTITION_COLUMN}={day}")
+                    os.makedirs(partition_dir, exist_ok=True)
+                    tmp_path = os.path.join(partition_dir, f".part-{run_id}.parquet.tmp")
+                    writer = pq.ParquetWriter(tmp_path, schema, compression=EXPORT_COMPRESSION)
+                    writers[day] = (writer, tmp_path, os.path.join(partition_dir, f"part-{run_id}.parquet"))
+                writers[day][0].write_table(table)
+            exported += len(rows)
+            last_id = rows[-1][0]
+        for writer, _, _ in writers.values():
+            writer.close()
+    except BaseException:
+        for writer, tmp_path, _ in writers.values():
+            writer.close()
+            os.remove(tmp_path)
+        raise
+    finally:
+        db_session.close()
+
+    # Önce dosyalar yayınlanır, sonra watermark ilerletilir: arada çökülürse bu satırlar yeniden
+    # aktarılabilir ama hiçbiri atlanmaz
+    for _, tmp_path, final_path in writers.values():
+        os.replace(tmp_path, final_path)
+    published = {final_path for _, _, final_path in writers.values()}
+    for path in previous_parts:
+        if path not in published:
+            os.remove(path)
+    if exported or full:
+        _write_state(output_dir, {
+            "last_output_id": last_id,
+            "exported_at": utcnow().isoformat(timespec="seconds"),
+            "include_transcript": include_transcript,
+            "last_run": {"rows": exported, "files": len(writers), "full": full},
+        })
+    log.info(
+        f"{exported} satır {len(writers)} bölüme aktarıldı ({output_dir}, watermark: {after_id} -> {last_id}), "
+        f"{time.time() - start_time:.2f} sn."
+    )
+    return {"rows": exported, "files": len(writers), "last_output_id": last_id}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analiz sonuçlarını tarihe göre bölümlenmiş Parquet'e aktarır.")
+    parser.add_argument("output_dir", nargs="?", default=EXPORT_DIR)
+    parser.add_argument("--full", action="store_true", help="Watermark'ı yok say, tümünü yeniden aktar")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--without-transcript", action="store_true", help="Transkript metnini aktarma")
+    args = parser.parse_args()
+    export_outputs(args.output_dir, full=args.full, chunk_size=args.chunk_size, include_transcript=not args.without_transcript)
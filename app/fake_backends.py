@@ -0,0 +1,192 @@
+# app/fake_backends.py
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, List, Optional, Sequence
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+from app.config import FAKE_LLM_LATENCY_SECONDS, FAKE_LLM_ERROR_RATE, FAKE_EMBEDDING_DIM, LLM_MODEL
+from app.models import CallAnalysisOutput
+
+# Sahte yanıtlarda kullanılan konu havuzu (serbest konular gerçek çağrılardaki gibi tekrar eder)
+FAKE_TOPICS = [
+    "Kredi kartı limit artırımı", "EFT işlemi gecikmesi", "Hesap işletim ücreti iadesi",
+    "Kart aidatı itirazı", "İnternet bankacılığı şifre sorunu", "Taksitli nakit avans",
+    "Konut kredisi faiz oranı", "Kayıp kart bildirimi", "Fatura talimatı", "Vadeli mevduat faizi",
+    "Döviz alım satım", "Mobil uygulama giriş hatası",
+]
+FAKE_INTENTS = ["Limit artırımı", "Şikayet", "Bilgi talebi", "İptal talebi", "İtiraz", "Başvuru"]
+FAKE_SENTIMENTS = ["POZITIF", "NEGATIF", "NOTR"]
+
+class FakeLLMTimeoutError(TimeoutError):
+    """Sahte modelin ürettiği geçici (timeout benzeri) hata."""
+
+def fake_analysis(seed_text: str) -> CallAnalysisOutput:
+    """Metnin hash'inden deterministik (her seferinde aynı) bir CallAnalysisOutput üretir."""
+    rng = random.Random(hashlib.sha256(seed_text.encode("utf-8")).digest())
+    main_topic = rng.choice(FAKE_TOPICS)
+    sub_topics = [main_topic] + rng.sample([t for t in FAKE_TOPICS if t != main_topic], rng.randint(0, 2))
+    is_complaint = rng.random() < 0.3
+    return CallAnalysisOutput(
+        intent=rng.choice(FAKE_INTENTS),
+        summary=f"Müşteri {main_topic.lower()} hakkında aradı. Temsilci gerekli bilgiyi verdi.",
+        main_topic_free=main_topic,
+        sub_topics_free=sub_topics,
+        sentiment=rng.choice(FAKE_SENTIMENTS),
+        is_complaint=is_complaint,
+        complaint_reason=f"{main_topic} ile ilgili memnuniyetsizlik" if is_complaint else None,
+        is_product_offer=rng.random() < 0.2,
+        is_escalation=rng.random() < 0.1,
+        is_regulatory_mention=rng.random() < 0.05,
+        is_other_bank_mention=rng.random() < 0.1,
+        nps_score=rng.randint(0, 10),
+        nps_rationale="Sahte (fake) arka uç tarafından üretildi.",
+        top_keywords=[word.lower() for word in main_topic.split()[:3]],
+    )
+
+class FakeChatModel(BaseChatModel):
+    """
+    Ağ erişimi olmadan çalışan, ücretsiz sahte chat modeli (LLM_BACKEND="fake").
+    Yanıt, prompt'un hash'inden üretilen geçerli bir CallAnalysisOutput JSON'udur; aynı prompt
+    her zaman aynı yanıtı alır. 'latency_seconds' ortalama gecikmeyi, 'error_rate' ise
+    parse edilemeyen yanıt veya timeout hatası döndürülme olasılığını belirler.
+    with_structured_output ile kullanıldığında yanıt bir tool call olarak döner; sağlayıcı
+    tarafında şemaya zorlanan çıktıyı taklit etmek için bu modda bozuk JSON üretilmez.
+    """
+
+    model_name: str = LLM_MODEL
+    latency_seconds: float = FAKE_LLM_LATENCY_SECONDS
+    error_rate: float = FAKE_LLM_ERROR_RATE
+    seed: int = 0
+    _rng: random.Random = PrivateAttr()
+    _seen_prefixes: set = PrivateAttr(default_factory=set)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    def _cached_prefix_tokens(self, messages: List[BaseMessage], tools: Optional[List[dict]] = None) -> int:
+        """
+        Sağlayıcı tarafı prefix önbelleğini taklit eder: aynı (tool şemaları + sistem mesajı) prefix'i
+        daha önce görüldüyse ve en az 1024 token ise, 128 token'lık bloklar halinde önbellekten okunmuş sayılır.
+        """
+        if not messages or not isinstance(messages[0], SystemMessage):
+            return 0
+        system_text = (json.dumps(tools, ensure_ascii=False) if tools else "") + str(messages[0].content)
+        system_tokens = len(system_text) // 3 + 1
+        prefix_key = hashlib.sha256(system_text.encode("utf-8")).digest()
+        if prefix_key not in self._seen_prefixes:
+            self._seen_prefixes.add(prefix_key)
+            return 0
+        return (system_tokens // 128) * 128 if system_tokens >= 1024 else 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-call-analysis"
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[Any] = None, **kwargs: Any):
+        # tool_choice yok sayılır: sahte model tool verildiğinde her zaman ilk tool'u çağırır
+        structured_format = kwargs.get("ls_structured_output_format")
+        if structured_format and not isinstance(structured_format.get("schema"), dict):
+            # ChatOpenAI gibi şema bir kez dönüştürülür; aksi halde her çağrıda JSON şeması yeniden üretilir
+            kwargs["ls_structured_output_format"] = {
+                **structured_format, "schema": convert_to_openai_tool(structured_format["schema"])
+            }
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[dict]] = None):
+        """(gecikme, AIMessage veya hata) döner; gecikme çağıran tarafından uygulanır."""
+        prompt_text = "\n".join(str(message.content) for message in messages)
+        delay = self.latency_seconds * self._rng.uniform(0.5, 1.5)
+        malformed = False
+        if self._rng.random() < self.error_rate:
+            if self._rng.random() < 0.5:
+                return delay, FakeLLMTimeoutError("Sahte LLM zaman aşımı (fake backend)")
+            malformed = not tools
+        # Tool şemaları da sağlayıcı tarafında prompt token'ı olarak sayılır
+        input_tokens = len(prompt_text) // 3 + 1
+        tool_calls = []
+        if tools:
+            input_tokens += len(json.dumps(tools, ensure_ascii=False)) // 3
+            # Yalnızca istenen şemanın alanları döner (ör. küçük modelin azaltılmış şeması)
+            properties = tools[0]["function"].get("parameters", {}).get("properties", {})
+            args = {name: value for name, value in fake_analysis(prompt_text).model_dump(mode="json").items()
+                    if name in properties}
+            content = ""
+            tool_calls = [{"name": tools[0]["function"]["name"], "args": args, "id": f"call_{self._rng.getrandbits(32):08x}"}]
+            output_tokens = len(json.dumps(args, ensure_ascii=False)) // 3 + 1
+        else:
+            if malformed:
+                content = '{"intent": "Bilgi talebi", "summary": "Yarım kalmış yanıt'
+            else:
+                content = fake_analysis(prompt_text).model_dump_json()
+            output_tokens = len(content) // 3 + 1
+        cached_tokens = min(self._cached_prefix_tokens(messages, tools), input_tokens)
+        message = AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            response_metadata={"model_name": self.model_name},
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_token_details": {"cache_read": cached_tokens},
+            },
+        )
+        return delay, message
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        delay, message = self._respond(messages, kwargs.get("tools"))
+        time.sleep(delay)
+        if isinstance(message, Exception):
+            raise message
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        delay, message = self._respond(messages, kwargs.get("tools"))
+        await asyncio.sleep(delay)
+        if isinstance(message, Exception):
+            raise message
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+_TOKEN = re.compile(r"\w+")
+
+class FakeHashEmbeddings(Embeddings):
+    """
+    Hash tabanlı, deterministik sahte embedding'ler: her kelimenin hash'inden sabit bir rastgele
+    vektör üretilir, metnin vektörü kelime vektörlerinin normalize toplamıdır. Böylece ortak
+    kelimesi olan metinler birbirine yakın düşer ve RAG eşlemesi anlamlı kalır.
+    """
+
+    def __init__(self, dim: int = FAKE_EMBEDDING_DIM):
+        self.dim = dim
+        self._word_vectors = {}
+
+    def _word_vector(self, word):
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+    def _embed(self, text: str) -> List[float]:
+        words = _TOKEN.findall(text.replace("İ", "i").replace("I", "ı").lower()) or [""]
+        vector = np.sum([self._word_vector(word) for word in words], axis=0)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
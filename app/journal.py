@@ -0,0 +1,55 @@
+# app/journal.py
+from sqlalchemy import delete, select, update
+from app.models import SessionLocal, LLMJournal, CallInput, CallAnalysisOutput
+from app.config import PROMPT_VERSION, LLM_MODEL
+from app.result_cache import ACCEPTED_LLM_MODELS
+
+def record_response(input_call_id, content_hash, output: CallAnalysisOutput, llm_model: str = LLM_MODEL):
+    """Ham LLM yanıtını geldiği anda kendi transaction'ında kalıcı olarak günlüğe yazar."""
+    journal_session = SessionLocal()
+    try:
+        journal_session.add(LLMJournal(
+            input_call_id=input_call_id,
+            transcript_hash=content_hash,
+            prompt_version=PROMPT_VERSION,
+            llm_model=llm_model,
+            response_json=output.model_dump_json()
+        ))
+        journal_session.commit()
+    finally:
+        journal_session.close()
+
+def load_journaled_responses(db_session, hashes):
+    """Daha önce alınmış ama DB'ye yazılamamış yanıtları döner: {hash: CallAnalysisOutput}."""
+    if not hashes:
+        return {}
+    rows = db_session.query(LLMJournal).filter(
+        LLMJournal.transcript_hash.in_(set(hashes)),
+        LLMJournal.prompt_version == PROMPT_VERSION,
+        LLMJournal.llm_model.in_(ACCEPTED_LLM_MODELS)
+    ).order_by(LLMJournal.id).all()
+    return {row.transcript_hash: CallAnalysisOutput.model_validate_json(row.response_json) for row in rows}
+
+def clear_journal(db_session, hashes):
+    """Sonucu yazılan yanıtları günlükten siler (commit çağırana aittir, çıktı yazımıyla atomiktir)."""
+    if hashes:
+        db_session.execute(delete(LLMJournal).where(LLMJournal.transcript_hash.in_(set(hashes))))
+
+def requeue_journaled_failures(db_session):
+    """
+    LLM yanıtı günlükte duran ama 'failed'/'dead' kalmış çağrıları tek bir UPDATE ile tekrar 'pending'
+    yapar. Bu çağrılar yeniden işlendiğinde LLM'e gidilmez, günlükteki yanıt kullanılır.
+    Deneme sayacı sıfırlanır; aksi halde 'dead' bir çağrı ilk geçici hatada yeniden 'dead' olurdu.
+    """
+    # Yalnızca load_journaled_responses'ın tekrar oynatacağı (geçerli prompt/model) yanıtlar
+    journaled_hashes = select(LLMJournal.transcript_hash).where(
+        LLMJournal.prompt_version == PROMPT_VERSION,
+        LLMJournal.llm_model.in_(ACCEPTED_LLM_MODELS)
+    )
+    requeued = db_session.execute(
+        update(CallInput)
+        .where(CallInput.status.in_(["failed", "dead"]), CallInput.content_hash.in_(journaled_hashes))
+        .values(status="pending", next_attempt_at=None, retry_count=0)
+    ).rowcount
+    db_session.commit()
+    return requeued
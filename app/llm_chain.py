@@ -1,30 +1,101 @@
 # app/llm_chain.py
-from langchain_openai import ChatOpenAI
+import time
+from langchain_core.callbacks import UsageMetadataCallbackHandler
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
-from app.models import CallAnalysisOutput
-from app.config import OPENAI_API_KEY, LLM_MODEL, MAX_RETRIES
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableBranch, RunnableLambda
+from app.models import CallAnalysisOutput, CallAnalysisLite
+from app.backends import create_chat_model
+from app.config import EXTRACTION_MODE
+from app import metrics
 
-def create_extraction_chain(product_list_str: str):
+EXTRACTION_MODES = ("parser", "structured")
+
+# Yapılandırılmış çıktı modunda şema prompt'a yazılmaz, API'ye ayrıca gönderilir
+STRUCTURED_OUTPUT_INSTRUCTIONS = "Yanıtını yalnızca sağlanan yapılandırılmış çıktı şemasına uygun olarak ver."
+
+def _unwrap_structured_output(output: dict) -> CallAnalysisOutput:
+    """include_raw=True çıktısından modeli döner; şemaya uymayan yanıtta parser modundaki gibi hata fırlatır."""
+    if output.get("parsing_error") is not None or output.get("parsed") is None:
+        raw = output.get("raw")
+        raise OutputParserException(
+            f"Yapılandırılmış çıktı ayrıştırılamadı: {output.get('parsing_error')}",
+            llm_output=str(getattr(raw, "content", "")),
+        )
+    return output["parsed"]
+
+class LLMMetricsCallbackHandler(UsageMetadataCallbackHandler):
+    """
+    Token kullanımını model başına toplar (UsageMetadataCallbackHandler) ve her LLM isteği için
+    süreyi ('llm_request'), prompt/completion/önbellekli token sayılarını ve anlık istek sayısını
+    ('llm_requests_in_flight') metriklere yazar.
+    """
+
+    # Event loop'ta doğrudan çalışır (işlem kısa); aksi halde her olay executor'a gönderilir
+    run_inline = True
+
+    def __init__(self):
+        super().__init__()
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+        metrics.adjust_gauge("llm_requests_in_flight", 1)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        super().on_llm_end(response, run_id=run_id, **kwargs)
+        self._finish(run_id)
+        for generation in response.generations[0] if response.generations else []:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if not usage:
+                continue
+            metrics.observe_tokens("prompt_tokens_per_request", usage.get("input_tokens", 0))
+            metrics.observe_tokens("completion_tokens_per_request", usage.get("output_tokens", 0))
+            metrics.observe_tokens(
+                "cached_tokens_per_request", (usage.get("input_token_details") or {}).get("cache_read", 0)
+            )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def _finish(self, run_id):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            metrics.observe("llm_request", time.perf_counter() - start)
+            metrics.adjust_gauge("llm_requests_in_flight", -1)
+
+def _timed_step(stage, runnable):
+    """Zincirdeki bir adımın (ör. yanıt ayrıştırma) süresini 'stage' olarak ölçen sarmalayıcı."""
+    def _invoke(value):
+        with metrics.timed(stage):
+            return runnable.invoke(value)
+
+    async def _ainvoke(value):
+        # CPU işi: executor'a göndermek yerine doğrudan çalıştırılır
+        return _invoke(value)
+
+    return RunnableLambda(_invoke, afunc=_ainvoke)
+
+def create_extraction_chain(product_list_str: str, mode: str = EXTRACTION_MODE, lite: bool = False):
     """
     ZİNCİR 1: Zenginleştirilmiş İkili-Bağlamlı Çıkarım Zinciri.
     'intent' alanını çağrı başından, diğerlerini tamamından çıkarır.
+    mode="parser": JSON format talimatları prompt'ta, yanıt PydanticOutputParser ile ayrıştırılır.
+    mode="structured": şema with_structured_output ile modele bağlanır (function calling / JSON schema).
+    lite=True: küçük model (LITE_LLM_MODEL) ve azaltılmış şema (CallAnalysisLite).
     """
-    
-    llm = ChatOpenAI(
-        model=LLM_MODEL,
-        openai_api_key=OPENAI_API_KEY,
-        temperature=0
-    ).with_retry(stop_after_attempt=MAX_RETRIES)
-
-    parser = PydanticOutputParser(pydantic_object=CallAnalysisOutput)
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Geçersiz EXTRACTION_MODE: '{mode}' (beklenen: {', '.join(EXTRACTION_MODES)})")
 
- 
-    prompt_template = """
+    # Sistem mesajı: tüm çağrılarda birebir aynı olan statik içerik (rol, talimatlar, ürün listesi,
+    # çıktı formatı). Değişen kısım (transkript) en sonda, ayrı bir kullanıcı mesajında durduğu için
+    # sağlayıcının prefix önbelleği (prompt caching) tüm statik kısmı kapsar.
+    system_template = """
     Sen bir banka çağrı merkezinde çalışan, deneyimli bir kalite ve analiz uzmanısın.
     Görevin, sana verilen müşteri hizmetleri çağrı transkriptini analiz ederek farklı kritere göre yapılandırılmış bir JSON formatında raporlamaktır.
-    iki farklı metin parçası verilecek: Çağrının başı ve çağrının tamamı.
-    Ayrıca, bankaya ait ürünleri tanıyabilmene yardımcı olması için ürün listesi ve tanımları iletilecek.
+    Kullanıcı mesajında iki farklı metin parçası verilecek: Çağrının başı ve çağrının tamamı.
+    Ayrıca, bankaya ait ürünleri tanıyabilmene yardımcı olması için ürün listesi ve tanımları aşağıda iletilmiştir.
     
     ### Görev Talimatları:
     1. `intent` (Müşteri Niyeti) alanını doldurmak için SADECE 'ÇAĞRI BAŞLANGICI' metnini kullan. Bu, müşterinin asıl arama nedenidir.
@@ -34,6 +105,7 @@ def create_extraction_chain(product_list_str: str):
     5.  `sub_topics_free` (Serbest Alt Konular) alanını doldururken, 'TÜM TRANSKRİPT' metnini dikkatle incele. Müşterinin dile getirdiği tüm farklı konuları, talepleri veya soruları listele.
         **ÖNEMLİ:** Müşteri, ana konudan (`main_topic_free`) tamamen bağımsız, "bir de şunu sorayım", "bu arada...", "aklıma gelmişken..." gibi ifadelerle ikincil bir talepte bulunursa (örneğin, önce EFT sorununu konuşup sonra "kart limitim ne kadardı?" diye sorarsa), bu ikincil talebi MUTLAKA ayrı bir alt konu olarak eklemelisin.
     6. **ÖNEMLİ**: `main_topic_guided` ve `sub_topics_guided` alanlarını DOLDURMA. Bu alanları 'null' veya boş bırak.
+    7. Transkript '[Bölüm i/n]' ile başlıyorsa, uzun bir çağrının yalnızca bir bölümüdür; alanları bu bölüme göre doldur.
 
     ### Referans Bilgiler (Bağlam):
 
@@ -42,6 +114,11 @@ def create_extraction_chain(product_list_str: str):
     {product_list}
     -----------------------
 
+    ### Çıktı Formatı:
+    {format_instructions}
+    """
+
+    human_template = """
     ### Analiz Edilecek Metinler:
 
     ---[ÇAĞRI BAŞLANGICI (Sadece 'intent' tespiti için)]----
@@ -51,19 +128,33 @@ def create_extraction_chain(product_list_str: str):
     ---[TÜM TRANSKRİPT ('main_topic_free' ve diğer tüm alanlar için)]----
     {full_transcript}
     ------------------------------------------------
-
-    ### Çıktı Formatı:
-    {format_instructions}
     """
 
-    prompt = ChatPromptTemplate.from_template(
-        template=prompt_template,
-        partial_variables={
-            "format_instructions": parser.get_format_instructions(),
-            "product_list": product_list_str
-        }
-    )
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_template),
+        ("human", human_template),
+    ])
 
-    chain = prompt | llm | parser
+    # LLM_BACKEND'e göre OpenAI (hız sınırlayıcılı) veya sahte model
+    schema = CallAnalysisLite if lite else CallAnalysisOutput
+    if mode == "structured":
+        llm = create_chat_model(structured_schema=schema, lite=lite)
+        prompt = prompt.partial(format_instructions=STRUCTURED_OUTPUT_INSTRUCTIONS, product_list=product_list_str)
+        return prompt | llm | _timed_step("llm_parse", RunnableLambda(_unwrap_structured_output))
+
+    llm = create_chat_model(lite=lite)
+    parser = PydanticOutputParser(pydantic_object=schema)
+    prompt = prompt.partial(format_instructions=parser.get_format_instructions(), product_list=product_list_str)
+    chain = prompt | llm | _timed_step("llm_parse", parser)
     
-    return chain
\ No newline at end of file
+    return chain
+
+def create_tiered_extraction_chain(product_list_str: str, mode: str = EXTRACTION_MODE):
+    """
+    Girdideki "tier" anahtarına göre yönlendiren zincir: "lite" girdiler küçük modele (azaltılmış şema),
+    diğerleri ana modele gider. "tier" verilmeyen girdiler ana zinciri kullanır.
+    """
+    return RunnableBranch(
+        (lambda inputs: inputs.get("tier") == "lite", create_extraction_chain(product_list_str, mode, lite=True)),
+        create_extraction_chain(product_list_str, mode),
+    )
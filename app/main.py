@@ -1,181 +1,549 @@
 # app/main.py
+import argparse
 import asyncio
+import multiprocessing
+import os
 import time
 from sqlalchemy.orm import sessionmaker
-from app.models import engine, CallInput, CallOutput, SessionLocal
-from app.config import BATCH_SIZE, OPENAI_API_KEY
+from app.models import engine, CallInput, CallOutput, SessionLocal, create_db_and_tables
+from app.config import BATCH_SIZE, MAX_CONCURRENT_CALLS, PROGRESS_LOG_INTERVAL, LEASE_SECONDS
+from app.config import BATCH_TOKEN_BUDGET, LONG_TRANSCRIPT_TOKENS, METRICS_PORT, METRICS_SUMMARY_PATH
+from app.config import EXTRACTION_MODE, LLM_MODEL, LITE_LLM_MODEL, EMBEDDING_MODEL
+from app.config import TOPIC_INDEX_PATH, TOPIC_INDEX_REFRESH_SECONDS, TOPIC_MATCHER, TOPIC_MATCH_MIN_SCORE
+from app.topic_index import FAISS_DIR, TopicIndex, current_index_path, current_version
+from app.call_queue import claim_calls, renew_leases, release_lease, release_claims, schedule_retry, seconds_until_next_retry, default_worker_id
+from app.call_queue import call_state_values
 from app.utils import setup_logging, load_text_file, get_call_start
 from app.config import PRODUCT_LIST_PATH
-from app.llm_chain import create_extraction_chain
-from app.models import CallAnalysisOutput
+from app.llm_chain import create_tiered_extraction_chain, LLMMetricsCallbackHandler
+from app.rules import detect_signals, choose_tier, apply_rule_flags
+from app.topic_mapper import index_version, map_guided_topics
+from app.backends import create_query_embeddings
+from app.rate_limiter import get_rate_limiter
+from app.models import CallAnalysisOutput, call_output_values
+from app.result_cache import transcript_hash, lookup_cached_results, cached_result_values
+from app.journal import record_response, load_journaled_responses, requeue_journaled_failures
+from app.db_writer import BatchWrite, DBWriter
+from app.preprocess import preprocess_missing_calls
+from app.compaction import prepare_transcript_parts, merge_chunk_results
+from app import metrics
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+from langchain_core.exceptions import OutputParserException
 
 log = setup_logging()
-FAISS_INDEX_PATH = "data/faiss_index"
 
 def load_retriever():
-    """Lokal FAISS veritabanını yükler ve bir vector_store nesnesi döner."""
+    """
+    Konu index'ini yükler: TOPIC_MATCHER="numpy" ise mmap'li NumPy index'i (TopicIndex),
+    "faiss" ise lokal FAISS veritabanı. Her ikisi de map_guided_topics ile kullanılabilir.
+    """
     try:
-        log.info(f"Vektör veritabanı '{FAISS_INDEX_PATH}' yükleniyor...")
-        embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-        vector_store = FAISS.load_local(FAISS_INDEX_PATH, embeddings, allow_dangerous_deserialization=True) 
+        # Aynı serbest konu metinleri sürekli tekrar ettiği için embedding'ler diskte önbelleklenir
+        embeddings = create_query_embeddings()
+        if TOPIC_MATCHER == "numpy":
+            log.info(f"Konu index'i '{TOPIC_INDEX_PATH}' yükleniyor (NumPy, mmap)...")
+            topic_index = TopicIndex.load(
+                TOPIC_INDEX_PATH, embeddings, min_score=TOPIC_MATCH_MIN_SCORE, refresh_seconds=TOPIC_INDEX_REFRESH_SECONDS
+            )
+            if topic_index.info.get("embedding_model") != EMBEDDING_MODEL:
+                log.warning(
+                    f"Konu index'i '{topic_index.info.get('embedding_model')}' ile oluşturulmuş, sorgular "
+                    f"'{EMBEDDING_MODEL}' kullanıyor. Index'i yeniden oluşturun."
+                )
+            return topic_index
+        index_path = current_index_path(TOPIC_INDEX_PATH)
+        if index_path is None:
+            raise FileNotFoundError(f"'{TOPIC_INDEX_PATH}' altında yayınlanmış konu index'i yok")
+        faiss_path = os.path.join(index_path, FAISS_DIR)
+        from langchain_community.vectorstores import FAISS  # yalnızca TOPIC_MATCHER="faiss" ise (import'u ~1 sn)
+
+        log.info(f"Vektör veritabanı '{faiss_path}' yükleniyor...")
+        vector_store = FAISS.load_local(faiss_path, embeddings, allow_dangerous_deserialization=True)
+        # calls_output.hierarchy_version için (TopicIndex'te olduğu gibi); FAISS yolu CURRENT'ı yeniden okumaz
+        vector_store.version = current_version(TOPIC_INDEX_PATH)
         return vector_store
     except Exception as e:
-        log.error(f"HATA: FAISS index'i yüklenemedi: {e}")
+        log.error(f"HATA: Konu index'i yüklenemedi: {e}")
         log.error(f"Lütfen önce 'python app/build_vector_store.py' komutunu çalıştırdığınızdan emin olun.")
         return None
 
-async def process_batch(extraction_chain, vector_store, db_session, call_batch):
+async def _map_topics_isolated(vector_store, partial_results):
     """
-    "İkili-Arama RAG" akışı (HATA DÜZELTMESİ: Her alt konu için ayrı RAG)
+    RAG eşlemesini önce tüm batch için tek seferde dener; başarısız olursa çağrıları tek tek
+    eşleyerek hatayı yalnızca sorunlu çağrılara izole eder. Dönüş: {hash: hata}.
     """
-    log.info(f"{len(call_batch)} adet çağrı işleniyor (Adım 1: LLM Çıkarım)...")
-    
+    try:
+        await map_guided_topics(vector_store, list(partial_results.values()))
+        return {}
+    except Exception as e:
+        log.warning(f"Toplu RAG eşlemesi başarısız ({e}); çağrılar tek tek eşleniyor...")
+
+    errors = {}
+    for content_hash, partial_result in partial_results.items():
+        try:
+            await map_guided_topics(vector_store, [partial_result])
+        except Exception as e:
+            errors[content_hash] = e
+    return errors
+
+def _tier_model(tier):
+    return LITE_LLM_MODEL if tier == "lite" else LLM_MODEL
+
+def _log_token_usage(usage_by_model):
+    """Batch'in token kullanımını loglar; önbellekli/önbelleksiz giriş token'larını ayırır."""
+    input_tokens = sum(usage.get("input_tokens", 0) for usage in usage_by_model.values())
+    output_tokens = sum(usage.get("output_tokens", 0) for usage in usage_by_model.values())
+    cached_tokens = sum(
+        (usage.get("input_token_details") or {}).get("cache_read", 0) for usage in usage_by_model.values()
+    )
+    if not input_tokens:
+        return
+    metrics.increment("input_tokens", input_tokens)
+    metrics.increment("cached_input_tokens", cached_tokens)
+    metrics.increment("output_tokens", output_tokens)
+    for model, usage in usage_by_model.items():
+        metrics.increment("model_input_tokens", usage.get("input_tokens", 0), model=model)
+        metrics.increment("model_cached_input_tokens",
+                          (usage.get("input_token_details") or {}).get("cache_read", 0), model=model)
+        metrics.increment("model_output_tokens", usage.get("output_tokens", 0), model=model)
+    log.info(
+        f"Token kullanımı: giriş {input_tokens} (önbellekten {cached_tokens}, önbelleksiz "
+        f"{input_tokens - cached_tokens}, %{cached_tokens / input_tokens * 100:.1f} önbellek), çıkış {output_tokens}."
+    )
+
+async def extract_calls(extraction_chain, calls, on_result=None):
+    """
+    Çağrıları tek bir batch isteğiyle LLM'e gönderir: kural motoru, sıkıştırma, katman seçimi ve
+    (uzun çağrılarda) map-reduce dahil. 'calls' {içerik özeti: çağrı} sözlüğüdür; çağrıların
+    transcript, transcript_start, token_count ve id alanları kullanılır.
+    'on_result(hash, sonuç, model)' coroutine'i her çağrının sonucu tamamlandığı anda beklenir (ör. günlüğe yazmak için).
+    Tek bir çağrının parser/timeout hatası diğerlerini etkilemez.
+    Dönüş: ({hash: CallAnalysisOutput}, {hash: hata}, {hash: "lite"/"full"})
+    """
+    # Transkriptler sıkıştırılır; eşiği aşanlar parçalara bölünür (map-reduce) ve
+    # parçaları da aynı batch isteğine eklenir. input_owners: girdi -> çağrının hash'i
     inputs_for_chain = []
-    for call in call_batch:
-        full_transcript = call.transcript
-        transcript_start = get_call_start(full_transcript)
-        inputs_for_chain.append({
-            "transcript_start": transcript_start,
-            "full_transcript": full_transcript
-        })
-    
+    input_owners = []
+    chunk_weights = {}  # hash -> parça token sayıları
+    call_signals = {}  # hash -> kural motorunun bulduğu kategoriler
+    call_tiers = {}  # hash -> "lite" / "full"
+    tokens_before = tokens_after = 0
+    for content_hash, call in calls.items():
+        # Katman 1: flag alanları için kural motoru (tam transkript üzerinde, sıkıştırmadan önce)
+        rules_start = time.perf_counter()
+        call_signals[content_hash] = detect_signals(call.transcript)
+        metrics.observe("rules", time.perf_counter() - rules_start)
+        parts, weights, original_tokens, compacted_tokens = prepare_transcript_parts(call.transcript, call.token_count)
+        tier = choose_tier(compacted_tokens, len(parts), call_signals[content_hash])
+        call_tiers[content_hash] = tier
+        metrics.increment(f"tier_{tier}_calls")
+        chunk_weights[content_hash] = weights
+        tokens_before += original_tokens
+        tokens_after += compacted_tokens
+        metrics.observe_tokens("tokens_saved_per_call", original_tokens - compacted_tokens)
+        log.debug(f"Çağrı ID {call.id}: {original_tokens} -> {compacted_tokens} token ({len(parts)} parça).")
+        if len(parts) > 1:
+            log.info(f"Uzun çağrı (ID {call.id}, {compacted_tokens} token) map-reduce ile {len(parts)} parçada işleniyor.")
+        transcript_start = call.transcript_start or get_call_start(call.transcript)
+        for part in parts:
+            inputs_for_chain.append({"transcript_start": transcript_start, "full_transcript": part, "tier": tier})
+            input_owners.append(content_hash)
+    if tokens_before:
+        log.info(
+            f"Sıkıştırma: {len(calls)} çağrıda {tokens_before} -> {tokens_after} token "
+            f"({tokens_before - tokens_after} token, %{(tokens_before - tokens_after) / tokens_before * 100:.1f} tasarruf)."
+        )
+    lite_count = sum(1 for tier in call_tiers.values() if tier == "lite")
+    if call_tiers:
+        log.info(f"Katmanlar: {lite_count} çağrı küçük modele ({LITE_LLM_MODEL}), {len(call_tiers) - lite_count} çağrı ana modele.")
+
+    results, errors = {}, {}
+    if not inputs_for_chain:
+        return results, errors, call_tiers
+    llm_start = time.perf_counter()
+    chunk_results = {content_hash: {} for content_hash in calls}
+    # Yanıtların usage_metadata'sı (önbellekten okunan giriş token'ları dahil) bu batch için toplanır;
+    # istek başı süre ve token dağılımları metriklere yazılır
+    usage_handler = LLMMetricsCallbackHandler()
+    async for index, chunk_result in extraction_chain.abatch_as_completed(
+        inputs_for_chain, config={"callbacks": [usage_handler]}, return_exceptions=True
+    ):
+        # Batch'teki çağrılar aynı anda başladığı için bu, çağrının kendi gecikmesidir
+        content_hash = input_owners[index]
+        metrics.observe("llm_call", time.perf_counter() - llm_start)
+        metrics.observe(f"llm_call_{call_tiers[content_hash]}", time.perf_counter() - llm_start)
+        metrics.increment("llm_requests")
+        if isinstance(chunk_result, Exception):
+            # Ayrıştırma hataları (bozuk/şemaya uymayan yanıt) diğer hatalardan ayrı sayılır
+            metrics.increment("parse_failures" if isinstance(chunk_result, OutputParserException) else "llm_errors")
+            metrics.increment("errors", stage="llm", type=type(chunk_result).__name__)
+        if content_hash in errors:
+            continue
+        if isinstance(chunk_result, Exception):
+            errors[content_hash] = chunk_result
+            continue
+        parts = chunk_results[content_hash]
+        parts[index] = chunk_result
+        if len(parts) < len(chunk_weights[content_hash]):
+            continue
+        # Tüm parçalar geldi: tek parçaysa sonuç aynen, değilse 'reduce' ile birleştirilir
+        ordered = [parts[i] for i in sorted(parts)]
+        result = ordered[0] if len(ordered) == 1 else merge_chunk_results(ordered, chunk_weights[content_hash])
+        result = apply_rule_flags(result, call_signals[content_hash])
+        if on_result is not None:
+            await on_result(content_hash, result, _tier_model(call_tiers[content_hash]))
+        results[content_hash] = result
+    metrics.observe("llm_extraction", time.perf_counter() - llm_start)
+    _log_token_usage(usage_handler.usage_metadata)
+    return results, errors, call_tiers
+
+async def process_batch(extraction_chain, vector_store, db_session, call_batch, writer):
+    """
+    "İkili-Arama RAG" akışı: LLM çıkarımı, ardından batch'teki tüm ana/alt konular için
+    tek seferde RAG eşlemesi (her alt konu ayrı eşlenir).
+    Transkript içeriği daha önce analiz edildiyse (analysis_cache) LLM'e hiç gidilmez.
+    Hatalar çağrı bazında izole edilir: başarısız çağrılar geri çekilme ile tekrar kuyruğa
+    alınır, sağlıklı çağrılar normal şekilde yazılır.
+    Sonuçlar doğrudan yazılmaz; DB yazma aşamasına (DBWriter) bırakılır ve batch'in slotu hemen boşalır.
+    """
+    # --- ADIM 0: İÇERİK ÖNBELLEĞİ (aynı transkript, farklı call_id) ---
+    lookup_start = time.perf_counter()
+    # İçerik özeti ingest'te hesaplanır (bkz. app/preprocess.py); eski satırlarda burada hesaplanır
+    call_hashes = [call.content_hash or transcript_hash(call.transcript) for call in call_batch]
+    final_results = lookup_cached_results(db_session, call_hashes)
+    errors = {}  # hash -> o içeriğe sahip çağrıları düşüren hata
+    # hash -> guided alanları eşleyen konu index'i sürümü. Önbellekten gelen sonuçların sürümü
+    # bilinmez (NULL); bunlar yeniden eşleme işinde (app/remap_topics.py) güncellenir.
+    hierarchy_versions = {}
+
+    # Önbellekte olmayan her farklı transkript LLM'e yalnızca bir kez gönderilir
+    calls_to_extract = {}
+    for call, content_hash in zip(call_batch, call_hashes):
+        if content_hash not in final_results and content_hash not in calls_to_extract:
+            calls_to_extract[content_hash] = call
+
+    cache_hits = sum(1 for content_hash in call_hashes if content_hash in final_results)
+    metrics.increment("result_cache_lookups", len(call_hashes))
+    metrics.increment("result_cache_hits", cache_hits)
+    if cache_hits:
+        log.info(f"{cache_hits} çağrı içerik önbelleğinden karşılandı (LLM çağrısı yapılmayacak).")
+
+    # Önceki (yarıda kalmış) bir çalıştırmada yanıtı alınmış çağrılar günlükten tekrar oynatılır
+    partial_results = load_journaled_responses(db_session, list(calls_to_extract))
+    if partial_results:
+        metrics.increment("journal_replays", len(partial_results))
+        log.info(f"{len(partial_results)} çağrının LLM yanıtı günlükten (journal) tekrar kullanılıyor.")
+    pending_hashes = [content_hash for content_hash in calls_to_extract if content_hash not in partial_results]
+    metrics.observe("cache_lookup", time.perf_counter() - lookup_start)
+
+    log.info(f"{len(pending_hashes)} adet çağrı işleniyor (Adım 1: LLM Çıkarım)...")
     start_time = time.time()
-    
+    batch_write = BatchWrite()
+    call_tiers = {}  # hash -> "lite" / "full"
+
     try:
-        # --- ADIM 1: LLM ÇIKARIM (BATCH) ---
-        partial_results = await extraction_chain.abatch(inputs_for_chain)
-        
-        # --- ADIM 2: İKİLİ RAG ARAMA (DÜZELTİLMİŞ MANTIK) ---
-        
-        main_topic_tasks = []
-        sub_topic_group_tasks = [] # Her çağrı için bir "grup" görevi
-        empty_async_list = asyncio.Future()
-        empty_async_list.set_result([])
-
-        for result in partial_results:
-            # Görev 1: Ana Konu (k=1)
-            if result.main_topic_free:
-                query = result.main_topic_free
-                main_topic_tasks.append(vector_store.asimilarity_search_with_score(query, k=1))
-            else:
-                main_topic_tasks.append(empty_async_list)
-                
-            # Görev 2: Alt Konular (k=1, her biri için)
-            if result.sub_topics_free:
-                # Her bir alt konu için ayrı RAG görevleri oluştur
-                tasks_for_this_call = [
-                    vector_store.asimilarity_search_with_score(sub_query, k=1) 
-                    for sub_query in result.sub_topics_free
-                ]
-                # Bu görev grubunu toplayan bir 'gather' görevi oluştur
-                sub_topic_group_tasks.append(asyncio.gather(*tasks_for_this_call))
-            else:
-                sub_topic_group_tasks.append(empty_async_list)
-
-        log.info(f"{len(call_batch)} çağrı için İkili-RAG araması yapılıyor...")
-        
-        # Tüm RAG aramalarını (hem ana hem de alt konu grupları) paralel çalıştır
-        all_main_topic_results = await asyncio.gather(*main_topic_tasks)
-        all_sub_topic_group_results = await asyncio.gather(*sub_topic_group_tasks)
-        
-        end_time = time.time()
-        log.info(f"{len(call_batch)} çağrı {end_time - start_time:.2f} saniyede (LLM+RAG) işlendi.")
-        
-        # --- ADIM 3: BİRLEŞTİRME VE VERİTABANINA YAZMA ---
-        for i in range(len(call_batch)):
-            call_input = call_batch[i]
-            final_output = partial_results[i] 
-            
-            # Alt konu sonuçlarını işle
-            # all_sub_topic_group_results[i] -> [[(doc, score)], [(doc, score)], ...]
-            sub_topic_results_list = all_sub_topic_group_results[i]
-            found_alt_konular = []
-            if sub_topic_results_list:
-                for result_list in sub_topic_results_list:
-                    if result_list: # Arama sonucu boş değilse
-                        best_doc, score = result_list[0] # k=1
-                        found_alt_konular.append(best_doc.metadata['alt_konu'])
-            final_output.sub_topics_guided = list(set(found_alt_konular))
-            
-            # Ana konu sonuçlarını işle
-            main_topic_results_with_scores = all_main_topic_results[i]
-            if main_topic_results_with_scores:
-                best_match_doc, best_score = main_topic_results_with_scores[0]
-                final_output.main_topic_guided = best_match_doc.metadata.get('ana_konu')
+        # --- ADIM 1: LLM ÇIKARIM (BATCH, ÇAĞRI BAZINDA SONUÇ) ---
+        # Her yanıt geldiği anda günlüğe yazılır; sonraki adımlarda hata/çökme olsa bile tekrar ödenmez.
+        if pending_hashes:
+            extracted, extract_errors, call_tiers = await extract_calls(
+                extraction_chain, {content_hash: calls_to_extract[content_hash] for content_hash in pending_hashes},
+                # SQLite commit'i (yazıcı thread'iyle kilit için yarışabilir) olay döngüsünü bloklamasın
+                on_result=lambda content_hash, result, model: asyncio.to_thread(
+                    record_response, calls_to_extract[content_hash].id, content_hash, result, model
+                ),
+            )
+            partial_results.update(extracted)
+            errors.update(extract_errors)
+
+        if partial_results:
+            # --- ADIM 2: İKİLİ RAG ARAMA (TOPLU EMBEDDING + TEK FAISS ARAMASI) ---
+            log.info(f"{len(partial_results)} çağrı için İkili-RAG araması yapılıyor...")
+            with metrics.timed("rag_mapping"):
+                rag_errors = await _map_topics_isolated(vector_store, partial_results)
+            errors.update(rag_errors)
+            for error in rag_errors.values():
+                metrics.increment("errors", stage="rag", type=type(error).__name__)
+            # TopicIndex arama sırasında yeni sürüme geçmiş olabilir; eşlemeyi yapan sürüm kaydedilir
+            mapped_version = index_version(vector_store)
             
-            # Veritabanına yaz
+            end_time = time.time()
+            log.info(f"{len(partial_results)} çağrı {end_time - start_time:.2f} saniyede (LLM+RAG) işlendi.")
+
+            mapped_hashes = [content_hash for content_hash in partial_results if content_hash not in rag_errors]
+            for content_hash in mapped_hashes:
+                final_results[content_hash] = partial_results[content_hash]
+                hierarchy_versions[content_hash] = mapped_version
+                batch_write.cache_entries.append(cached_result_values(
+                    content_hash, partial_results[content_hash], _tier_model(call_tiers.get(content_hash))
+                ))
+            # Çıktılarla aynı commit'te silinir: ya ikisi birden kalıcı olur ya hiçbiri.
+            # RAG'de düşen çağrıların yanıtı günlükte kalır, yeniden denemede tekrar ödenmez.
+            batch_write.journal_hashes.extend(mapped_hashes)
+        
+        # --- ADIM 3: VERİTABANINA YAZMA (yazma aşaması için satırları hazırla) ---
+        for call_input, content_hash in zip(call_batch, call_hashes):
+            if content_hash not in final_results:
+                continue
             try:
-                new_output = CallOutput(
-                    input_call_id=call_input.id,
-                    intent=final_output.intent,
-                    summary=final_output.summary,
-                    main_topic_free=final_output.main_topic_free,
-                    main_topic_guided=final_output.main_topic_guided,
-                    sub_topics_free=", ".join(final_output.sub_topics_free or []),
-                    sub_topics_guided=", ".join(final_output.sub_topics_guided or []),
-                    sentiment=final_output.sentiment.value, 
-                    is_complaint=final_output.is_complaint,
-                    complaint_reason=final_output.complaint_reason,
-                    is_product_offer=final_output.is_product_offer,
-                    is_escalation=final_output.is_escalation,
-                    is_regulatory_mention=final_output.is_regulatory_mention,
-                    is_other_bank_mention=final_output.is_other_bank_mention,
-                    nps_score=final_output.nps_score,
-                    nps_rationale=final_output.nps_rationale,
-                    top_keywords=", ".join(final_output.top_keywords or [])
-                )
-                db_session.add(new_output)
+                version = hierarchy_versions.get(content_hash)
+                batch_write.outputs.append(call_output_values(call_input.id, final_results[content_hash], version))
                 call_input.status = "processed"
+                # Bu çağrıların yakın-kopyaları (dedupe aşaması) aynı analizi LLM'siz kullanır
+                batch_write.representative_results[call_input.id] = final_results[content_hash]
+                batch_write.representative_versions[call_input.id] = version
             except Exception as e:
-                log.error(f"Çağrı ID {call_input.id} veritabanına yazılırken hata: {e}")
-                call_input.status = "failed"
+                errors[content_hash] = e
                 
     except Exception as e:
+        metrics.increment("errors", stage="batch", type=type(e).__name__)
         log.error(f"Batch işleme hatası (LLM veya RAG): {e}")
-        for call in call_batch:
-            call.status = "failed"
+        for content_hash in call_hashes:
+            errors.setdefault(content_hash, e)
             
     finally:
-        db_session.commit()
+        for call, content_hash in zip(call_batch, call_hashes):
+            if call.status == "in_progress" and content_hash in errors:
+                new_status = schedule_retry(call, errors[content_hash])
+                metrics.increment("calls_failed", status=new_status)
+                log.error(
+                    f"Çağrı ID {call.id} başarısız (deneme {call.retry_count}, yeni durum: {new_status}): "
+                    f"{call.last_error}"
+                )
+                if new_status == "dead":
+                    # Dead-letter'a düşen temsilcilerin yakın-kopyaları bağımsız olarak işlenmeye devam eder
+                    batch_write.dead_ids.append(call.id)
+            # İptal (Ctrl-C) durumunda 'in_progress' kalanların lease'i korunur; zamanlayıcı geri bırakır
+            if call.status != "in_progress":
+                release_lease(call)
+                batch_write.call_updates.append(call_state_values(call))
+        # Oturumdaki nesneler commit edilmez; tüm değişiklikler yazma aşamasında tek transaction'da yazılır
+        with metrics.timed("db_enqueue"):
+            await writer.submit(batch_write)
+
+async def _run_batch(extraction_chain, vector_store, db_session, call_batch, writer):
+    """Tek bir batch'i kendi DB oturumu ile işler ve oturumu kapatır."""
+    try:
+        with metrics.timed("batch"):
+            await process_batch(extraction_chain, vector_store, db_session, call_batch, writer)
+    finally:
+        db_session.close()
 
-def run_pipeline():
-    """Ana pipeline fonksiyonu (İkili-Arama RAG / 16 Kriter)."""
-    log.info("Çağrı Merkezi 16-Kriter Analiz Pipeline'ı Başlatılıyor...")
+async def run_scheduler(extraction_chain, vector_store, worker_id,
+                        batch_size=BATCH_SIZE, max_concurrency=MAX_CONCURRENT_CALLS):
+    """
+    Tek bir event loop üzerinde çalışan, sınırlı eşzamanlılıklı iş kuyruğu.
+    Her an en fazla 'max_concurrency' (MAX_CONCURRENT_CALLS) çağrı LLM'de işlenir; bir batch bitip
+    slot boşaldıkça 'pending' çağrılar veritabanında atomik olarak sahiplenilip
+    (claim) kuyruğa eklenir. Aynı veritabanını birden fazla worker paylaşabilir.
+    """
+    in_flight_ids = set()   # Şu an işlenmekte olan çağrıların id'leri
+    # Batch sonuçlarını toplu olarak yazan tek yazıcı (app/db_writer.py)
+    writer = DBWriter().start()
+    running = {}            # asyncio.Task -> o batch'teki çağrı id'leri
+    processed_count = 0
+    start_time = time.time()
+    last_progress_log = start_time
+
+    try:
+        while True:
+            # --- SLOT DOLDURMA: Boş slot kadar yeni çağrı çek ---
+            free_slots = max_concurrency - len(in_flight_ids)
+            if free_slots > 0:
+                db_session = SessionLocal()
+                with metrics.timed("claim"):
+                    call_batch = claim_calls(
+                        db_session, worker_id, min(batch_size, free_slots),
+                        token_budget=BATCH_TOKEN_BUDGET, long_threshold=LONG_TRANSCRIPT_TOKENS
+                    )
+
+                if call_batch:
+                    if len(call_batch) == 1 and (call_batch[0].token_count or 0) > LONG_TRANSCRIPT_TOKENS:
+                        log.info(
+                            f"Uzun transkript (ID {call_batch[0].id}, {call_batch[0].token_count} token) "
+                            f"tek başına bir batch'te işleniyor."
+                        )
+                    batch_ids = [call.id for call in call_batch]
+                    in_flight_ids.update(batch_ids)
+                    task = asyncio.create_task(_run_batch(extraction_chain, vector_store, db_session, call_batch, writer))
+                    running[task] = batch_ids
+                    metrics.gauge("in_flight_calls", len(in_flight_ids))
+                    metrics.gauge("running_batches", len(running))
+                    # Hâlâ boş slot olabilir, beklemeden tekrar doldurmayı dene
+                    continue
+                db_session.close()
+
+            if not running:
+                # Bekleyen sonuçlar (tekrar kuyruğa alınan çağrılar dahil) yazılmadan kuyruk boş sayılmaz
+                await writer.drain()
+                # Geri çekilmede bekleyen çağrı varsa süresi dolana kadar bekle
+                retry_session = SessionLocal()
+                try:
+                    wait_seconds = seconds_until_next_retry(retry_session)
+                finally:
+                    retry_session.close()
+                if wait_seconds is None:
+                    log.info("İşlenecek yeni çağrı bulunamadı. Pipeline tamamlandı.")
+                    break
+                # 0: boşaltma sırasında sahiplenilebilir hale gelen çağrılar var, beklemeden tekrar claim edilir
+                if wait_seconds > 0:
+                    log.info(f"Tekrar denenecek çağrılar için {wait_seconds:.1f} sn bekleniyor...")
+                    await asyncio.sleep(wait_seconds + 0.1)
+                continue
+
+            # --- En az bir batch bitene kadar bekle, slotları serbest bırak ---
+            # Uzun süren batch'lerde lease'in dolmaması için periyodik olarak uyanıp yeniliyoruz
+            done, _ = await asyncio.wait(
+                running.keys(), timeout=LEASE_SECONDS / 3, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                lease_session = SessionLocal()
+                try:
+                    renew_leases(lease_session, worker_id, list(in_flight_ids))
+                finally:
+                    lease_session.close()
+                continue
+            for task in done:
+                batch_ids = running.pop(task)
+                in_flight_ids.difference_update(batch_ids)
+                processed_count += len(batch_ids)
+                if task.exception():
+                    metrics.increment("errors", stage="scheduler", type=type(task.exception()).__name__)
+                    log.error(f"Batch görevi beklenmedik şekilde sonlandı: {task.exception()}")
+
+            metrics.gauge("in_flight_calls", len(in_flight_ids))
+            metrics.gauge("running_batches", len(running))
+
+            now = time.time()
+            if now - last_progress_log >= PROGRESS_LOG_INTERVAL:
+                elapsed = now - start_time
+                log.info(
+                    f"İlerleme: {processed_count} çağrı {elapsed:.1f} sn'de işlendi "
+                    f"({processed_count / elapsed:.2f} çağrı/sn), in-flight: {len(in_flight_ids)}"
+                )
+                last_progress_log = now
+    finally:
+        await writer.close()
+        # Ctrl-C / kritik hata: yarıda kalan çağrıları lease süresini beklemeden kuyruğa geri bırak
+        if in_flight_ids:
+            release_session = SessionLocal()
+            try:
+                release_claims(release_session, worker_id, list(in_flight_ids))
+                log.warning(f"Yarıda kalan {len(in_flight_ids)} çağrı tekrar 'pending' yapıldı.")
+            finally:
+                release_session.close()
+
+    elapsed = time.time() - start_time
+    if processed_count:
+        log.info(
+            f"Toplam {processed_count} çağrı {elapsed:.1f} sn'de işlendi "
+            f"({processed_count / elapsed:.2f} çağrı/sn)."
+        )
+    return processed_count
+
+def _start_metrics_endpoint(port):
+    if not port:
+        return None
+    try:
+        server = metrics.start_http_server(port)
+        log.info(f"Prometheus metrik endpoint'i: http://127.0.0.1:{port}/metrics")
+        return server
+    except OSError as e:
+        log.warning(f"Metrik endpoint'i {port} portunda açılamadı: {e}")
+        return None
+
+def _write_metrics_summary(path, worker_id):
+    """Run sonunda aşama/token/sayaç özetini JSON olarak yazar ve isabet oranlarını loglar."""
+    try:
+        metrics.write_summary(path, worker_id=worker_id)
+        log.info(f"Metrik özeti '{path}' dosyasına yazıldı. Önbellek isabet oranları: {metrics.cache_hit_rates()}")
+    except Exception as e:
+        log.warning(f"Metrik özeti yazılamadı: {e}")
+
+def run_pipeline(worker_id=None, batch_size=BATCH_SIZE, max_concurrency=MAX_CONCURRENT_CALLS,
+                 extraction_mode=EXTRACTION_MODE, metrics_port=METRICS_PORT, metrics_summary_path=METRICS_SUMMARY_PATH):
+    """
+    Ana pipeline fonksiyonu (İkili-Arama RAG / 16 Kriter). İşlenen çağrı sayısını döner.
+    'metrics_port' verilirse çalışma boyunca Prometheus endpoint'i açılır; run sonunda ölçüm özeti
+    'metrics_summary_path'e yazılır (None: yazılmaz).
+    """
+    worker_id = worker_id or default_worker_id()
+    log.info(f"Çağrı Merkezi 16-Kriter Analiz Pipeline'ı Başlatılıyor (worker: {worker_id})...")
+    metrics_server = _start_metrics_endpoint(metrics_port)
+    create_db_and_tables()
+
+    # Ön işleme alanları olmayan (eski sürümle yüklenmiş) satırları tamamla
+    preprocess_missing_calls()
+
+    db_session = SessionLocal()
+    try:
+        requeued = requeue_journaled_failures(db_session)
+        if requeued:
+            log.info(f"LLM yanıtı günlükte olan {requeued} başarısız çağrı tekrar kuyruğa alındı.")
+    finally:
+        db_session.close()
     
     vector_store = load_retriever()
     if not vector_store:
+        if metrics_server is not None:
+            metrics_server.shutdown()
         return
 
     log.info("Ürün listesi yükleniyor...")
     product_list_str = load_text_file(PRODUCT_LIST_PATH)
     
-    log.info("LangChain Çıkarım Zinciri (Zincir 1) oluşturuluyor...")
-    extraction_chain = create_extraction_chain(product_list_str)
+    log.info(f"LangChain Çıkarım Zinciri (Zincir 1) oluşturuluyor (mod: {extraction_mode})...")
+    extraction_chain = create_tiered_extraction_chain(product_list_str, mode=extraction_mode)
 
-    db_session = SessionLocal()
+    log.info(f"Zamanlayıcı başlatılıyor (batch: {batch_size}, eşzamanlı çağrı: {max_concurrency})...")
     try:
-        while True:
-            log.info(f"'pending' statüsündeki {BATCH_SIZE} adet çağrı aranıyor...")
-            
-            call_batch = db_session.query(CallInput).filter(
-                CallInput.status == "pending"
-            ).limit(BATCH_SIZE).all()
-
-            if not call_batch:
-                log.info("İşlenecek yeni çağrı bulunamadı. Pipeline tamamlandı.")
-                break
-            
-            asyncio.run(process_batch(extraction_chain, vector_store, db_session, call_batch))
-
+        # Tüm pipeline boyunca tek, uzun ömürlü bir event loop
+        return asyncio.run(run_scheduler(extraction_chain, vector_store, worker_id, batch_size, max_concurrency))
     except Exception as e:
         log.error(f"Pipeline'da kritik hata: {e}")
-        db_session.rollback()
     finally:
-        db_session.close()
+        vector_store.embeddings.log_stats()
+        log.info(f"OpenAI hız sınırlayıcı: {get_rate_limiter().stats()}")
+        if metrics_summary_path:
+            _write_metrics_summary(metrics_summary_path, worker_id)
+        if metrics_server is not None:
+            metrics_server.shutdown()
         log.info("Veritabanı bağlantısı kapatıldı.")
 
+def run_workers(num_workers):
+    """
+    Aynı veritabanını (ve claim kuyruğunu) paylaşan 'num_workers' adet process başlatır.
+    Her worker kendi event loop'unu ve zincirini kurar; çağrılar lease ile paylaşılır.
+    """
+    # Şema göçü ve ön işleme tamamlama worker'lar arasında yarışmasın diye bir kez ana process'te yapılır
+    create_db_and_tables()
+    preprocess_missing_calls()
+
+    ctx = multiprocessing.get_context("spawn")
+    summary_root, summary_ext = os.path.splitext(METRICS_SUMMARY_PATH)
+    processes = [
+        ctx.Process(
+            target=run_pipeline, name=f"pipeline-worker-{i}",
+            # Her worker kendi endpoint'ini ve özet dosyasını kullanır
+            kwargs={
+                "metrics_port": METRICS_PORT + i if METRICS_PORT else 0,
+                "metrics_summary_path": f"{summary_root}_{i}{summary_ext}",
+            },
+        )
+        for i in range(num_workers)
+    ]
+    log.info(f"{num_workers} adet worker process başlatılıyor...")
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    log.info("Tüm worker process'ler tamamlandı.")
+
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Çağrı analiz pipeline'ını çalıştırır.")
+    parser.add_argument("--workers", type=int, default=1, help="Aynı kuyruğu paylaşan worker process sayısı")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        run_workers(args.workers)
+    else:
+        run_pipeline()
@@ -0,0 +1,213 @@
+# app/metrics.py
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+# Prometheus metrik adlarının öneki
+METRIC_PREFIX = "call_pipeline"
+# Histogram kova sınırları: aşama süreleri (sn) ve istek/çağrı başı token sayıları
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+# Önbellek isabet oranları: ad -> (isabet sayacı, toplam sayacı)
+HIT_RATE_COUNTERS = {
+    "result_cache": ("result_cache_hits", "result_cache_lookups"),
+    "embedding_cache": ("embedding_cache_hits", "embedding_cache_lookups"),
+    "prompt_cache": ("cached_input_tokens", "input_tokens"),
+}
+
+# Aşama adı -> süre ölçümleri (sn). Process içi; benchmark ve run sonu özetleri buradan okur.
+_stage_durations = defaultdict(list)
+# Ad -> token sayıları (ör. istek başı prompt token'ı)
+_token_counts = defaultdict(list)
+# (ad, etiketler) -> sayaç (token kullanımı, tipine göre hatalar vb.)
+_counters = defaultdict(int)
+# Anlık değerler (kuyruk derinliği vb.): ad -> {"value": son değer, "max": görülen en büyük değer}
+_gauges = {}
+# DB yazıcısı ve HTTP endpoint'i ayrı thread'lerde çalışır
+_lock = threading.Lock()
+
+def observe(stage: str, seconds: float):
+    """Bir aşamanın tek bir çalışma süresini kaydeder."""
+    _stage_durations[stage].append(seconds)
+
+@contextmanager
+def timed(stage: str):
+    """'with timed("db_write"):' bloğunun süresini ilgili aşamaya kaydeder."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+def observe_tokens(name: str, count: int):
+    """Tek bir istek/çağrının token sayısını kaydeder (ör. 'prompt_tokens_per_request')."""
+    _token_counts[name].append(count)
+
+def increment(name: str, amount: int = 1, **labels):
+    """Bir sayacı artırır. Etiketler Prometheus etiketi olur: increment("errors", stage="llm", type="Timeout")."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] += amount
+
+def _counter_key(name, labels):
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{key}={value}" for key, value in labels) + "}"
+
+def counter_summary():
+    """{ad: değer}; etiketli sayaçlar 'ad{anahtar=değer,...}' olarak döner."""
+    with _lock:
+        return {_counter_key(name, labels): value for (name, labels), value in _counters.items()}
+
+def _set_gauge(name, value):
+    previous = _gauges.get(name)
+    _gauges[name] = {"value": value, "max": value if previous is None else max(previous["max"], value)}
+
+def gauge(name: str, value: float):
+    """Anlık bir değeri (ör. yazma kuyruğu derinliği) kaydeder; en büyük değer de tutulur."""
+    with _lock:
+        _set_gauge(name, value)
+
+def adjust_gauge(name: str, delta: float):
+    """Anlık değeri 'delta' kadar değiştirir (ör. in-flight istek sayısı için +1 / -1)."""
+    with _lock:
+        previous = _gauges.get(name)
+        _set_gauge(name, (previous["value"] if previous else 0) + delta)
+
+def gauge_summary():
+    with _lock:
+        return {name: dict(values) for name, values in _gauges.items()}
+
+def _distribution(values):
+    values = np.array(values)
+    return {
+        "count": len(values),
+        "total": round(float(values.sum()), 6),
+        "p50": round(float(np.percentile(values, 50)), 6),
+        "p95": round(float(np.percentile(values, 95)), 6),
+        "max": round(float(values.max()), 6),
+    }
+
+def stage_summary():
+    """Aşama başına {count, total, p50, p95, max} (sn) döner."""
+    return {stage: _distribution(durations) for stage, durations in list(_stage_durations.items())}
+
+def token_summary():
+    """Token ölçümü başına {count, total, p50, p95, max} döner."""
+    return {name: _distribution(counts) for name, counts in list(_token_counts.items())}
+
+def cache_hit_rates(counters=None):
+    """Önbellek isabet oranları (0-1); ilgili sayaçlar hiç artmadıysa yer almaz."""
+    counters = counter_summary() if counters is None else counters
+    rates = {}
+    for cache, (hits, total) in HIT_RATE_COUNTERS.items():
+        if counters.get(total):
+            rates[cache] = round(counters.get(hits, 0) / counters[total], 4)
+    return rates
+
+def summary():
+    """Run sonu JSON özeti: aşama süreleri, token dağılımları, sayaçlar, anlık değerler ve isabet oranları."""
+    counters = counter_summary()
+    return {
+        "stages": stage_summary(),
+        "tokens": token_summary(),
+        "counters": counters,
+        "gauges": gauge_summary(),
+        "cache_hit_rates": cache_hit_rates(counters),
+    }
+
+def write_summary(path: str, **extra):
+    """summary()'yi (ve verilen ek alanları) JSON olarak dosyaya yazar."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**extra, **summary()}, f, ensure_ascii=False, indent=2)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+def _histogram_lines(name, label_name, series, buckets):
+    lines = [f"# TYPE {name} histogram"]
+    for label_value, values in series:
+        ordered = np.sort(np.asarray(values, dtype=float))
+        cumulative = np.searchsorted(ordered, buckets, side="right")
+        for bound, count in zip(buckets, cumulative):
+            lines.append(f'{name}_bucket{{{label_name}="{label_value}",le="{bound:g}"}} {int(count)}')
+        lines.append(f'{name}_bucket{{{label_name}="{label_value}",le="+Inf"}} {len(ordered)}')
+        lines.append(f'{name}_sum{{{label_name}="{label_value}"}} {float(ordered.sum()):.6f}')
+        lines.append(f'{name}_count{{{label_name}="{label_value}"}} {len(ordered)}')
+    return lines
+
+def render_prometheus():
+    """Tüm metrikleri Prometheus metin formatında (0.0.4) döner."""
+    lines = []
+    stages = [(stage, list(values)) for stage, values in list(_stage_durations.items()) if values]
+    if stages:
+        lines += _histogram_lines(f"{METRIC_PREFIX}_stage_seconds", "stage", stages, LATENCY_BUCKETS)
+    tokens = [(name, list(values)) for name, values in list(_token_counts.items()) if values]
+    if tokens:
+        lines += _histogram_lines(f"{METRIC_PREFIX}_tokens", "name", tokens, TOKEN_BUCKETS)
+
+    with _lock:
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+    typed = set()
+    for (name, labels), value in counters:
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for name, values in gauges:
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+        lines.append(f"{METRIC_PREFIX}_{name} {values['value']}")
+    rates = cache_hit_rates()
+    if rates:
+        lines.append(f"# TYPE {METRIC_PREFIX}_cache_hit_ratio gauge")
+        lines += [f'{METRIC_PREFIX}_cache_hit_ratio{{cache="{cache}"}} {rate}' for cache, rate in rates.items()]
+    return "\n".join(lines) + "\n"
+
+def _metrics_handler():
+    from http.server import BaseHTTPRequestHandler  # yalnızca endpoint açılınca gerekir
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Her scrape'in pipeline loguna düşmesini engelle
+            pass
+
+    return _MetricsHandler
+
+def start_http_server(port: int, host: str = "127.0.0.1"):
+    """/metrics endpoint'ini arka plan thread'inde başlatır (Prometheus scrape için). Sunucuyu döner."""
+    from http.server import ThreadingHTTPServer
+
+    server = ThreadingHTTPServer((host, port), _metrics_handler())
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+def reset():
+    """Tüm ölçümleri temizler (ör. benchmark senaryoları arasında)."""
+    _stage_durations.clear()
+    _token_counts.clear()
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
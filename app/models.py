@@ -1,18 +1,36 @@
 # app/models.py
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, DateTime
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, Text, Boolean, DateTime, LargeBinary
+from sqlalchemy import ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import datetime
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, create_model
 from typing import List, Optional, Literal
 from sqlalchemy.orm import sessionmaker
+from app.config import DATABASE_URL
 
-# Banka simülasyonu için lokal SQLite veritabanı yolu
-DATABASE_URL = "sqlite:///./bank_calls.db"
+# Her SQLite bağlantısında uygulanır. WAL: okuyucular (claim, önbellek sorguları) yazıcıyı beklemez;
+# synchronous=NORMAL: WAL'da commit başına fsync yapılmaz (güç kesintisinde yalnızca son commit'ler kaybolabilir,
+# veritabanı bozulmaz); busy_timeout: worker'lar arası kilit çakışmasında hemen hata vermek yerine bekler.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 30000,  # ms
+    "temp_store": "MEMORY",
+    "cache_size": -65536,  # KiB (64 MB)
+}
 
 Base = declarative_base()
 engine = create_engine(DATABASE_URL)
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 class CallInput(Base):
@@ -20,15 +38,26 @@ class CallInput(Base):
     __tablename__ = "calls_input"
     id = Column(Integer, primary_key=True, index=True)
     call_id = Column(String, unique=True, index=True) # Çağrıya ait benzersiz bir ID (örn: dosya adı)
-    transcript = Column(Text, nullable=False)
-    status = Column(String, default="pending") # (pending, processed, failed)
+    transcript = Column(Text, nullable=False) # Ingest'te normalize edilmiş transkript (bkz. app/preprocess.py)
+    transcript_start = Column(Text, nullable=True) # İlk 40 kelime ('intent' için), ingest'te hesaplanır
+    token_count = Column(Integer, nullable=True) # Transkriptin token sayısı (batch paketleme için)
+    token_counter = Column(String, nullable=True) # token_count'u üreten sayaç: tiktoken kodlaması ya da "estimate"
+    content_hash = Column(String, nullable=True, index=True) # Normalize transkriptin SHA-256 özeti
+    status = Column(String, default="pending", index=True) # (pending, in_progress, processed, failed, duplicate, dead)
+    worker_id = Column(String, nullable=True) # Çağrıyı sahiplenen (claim) worker
+    lease_expires_at = Column(DateTime, nullable=True) # Sahiplik (lease) bitiş zamanı (UTC)
+    minhash = Column(LargeBinary, nullable=True) # Yakın-kopya tespiti için MinHash imzası
+    duplicate_of = Column(Integer, nullable=True, index=True) # Yakın-kopyası olduğu temsilci çağrının id'si
+    retry_count = Column(Integer, default=0, server_default="0") # Başarısız deneme sayısı
+    last_error = Column(Text, nullable=True) # Son hatanın tipi ve mesajı
+    next_attempt_at = Column(DateTime, nullable=True) # Geri çekilme (backoff) sonrası en erken deneme zamanı (UTC)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 class CallOutput(Base):
     """LLM tarafından işlenen ve 16 kriterin yazıldığı hedef tablo."""
     __tablename__ = "calls_output"
     id = Column(Integer, primary_key=True, index=True)
-    input_call_id = Column(Integer, index=True) # calls_input tablosundaki id'ye referans
+    input_call_id = Column(Integer, ForeignKey("calls_input.id"), index=True) # calls_input tablosundaki id'ye referans
 
     # --- YENİ ALAN (16. KRİTER) ---
     intent = Column(String, nullable=True) # Müşterinin ilk arama niyeti
@@ -36,7 +65,7 @@ class CallOutput(Base):
     # Diğer 15 Kriter
     summary = Column(Text)
     main_topic_free = Column(String)
-    main_topic_guided = Column(String)
+    main_topic_guided = Column(String, index=True)
     sub_topics_free = Column(String) 
     sub_topics_guided = Column(String) 
     sentiment = Column(String) 
@@ -49,12 +78,105 @@ class CallOutput(Base):
     nps_score = Column(Integer, nullable=True)
     nps_rationale = Column(Text, nullable=True)
     top_keywords = Column(String) 
+    # Guided alanları üreten konu index'i sürümü (app/topic_index.py); NULL: bilinmiyor (ör. önbellekten gelen sonuç).
+    # Hiyerarşi değişince yalnızca bu sürümü eski olan satırlar yeniden eşlenir (bkz. app/remap_topics.py)
+    hierarchy_version = Column(String, nullable=True, index=True)
     
-    processed_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+class CallOutputTopic(Base):
+    """
+    calls_output'taki alt konu listelerinin normalize hali: konu başına bir satır.
+    Alt konuya göre sorgular string bölmeden index üzerinden yapılır. Satırlar app/analytics.py'de yazılır.
+    """
+    __tablename__ = "call_output_topics"
+    id = Column(Integer, primary_key=True)
+    call_output_id = Column(Integer, ForeignKey("calls_output.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String, nullable=False) # "free" (sub_topics_free) veya "guided" (sub_topics_guided)
+    topic = Column(String, nullable=False)
+    position = Column(Integer, nullable=False) # Listedeki sırası
+    __table_args__ = (Index("ix_call_output_topics_kind_topic", "kind", "topic"),)
+
+class CallOutputKeyword(Base):
+    """calls_output.top_keywords listesinin normalize hali: anahtar kelime başına bir satır."""
+    __tablename__ = "call_output_keywords"
+    id = Column(Integer, primary_key=True)
+    call_output_id = Column(Integer, ForeignKey("calls_output.id", ondelete="CASCADE"), nullable=False, index=True)
+    keyword = Column(String, nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+
+class DailyTopicStats(Base):
+    """
+    Günlük özet (rollup): gün x guided ana konu x duygu x şikayet başına çağrı sayısı ve NPS toplamı.
+    DB yazma aşamasında artımlı olarak güncellenir (bkz. app/analytics.py); dashboard'lar ham satırları taramaz.
+    """
+    __tablename__ = "daily_topic_stats"
+    day = Column(String, primary_key=True) # YYYY-MM-DD (processed_at, UTC)
+    main_topic = Column(String, primary_key=True) # main_topic_guided ("": eşleşme yok)
+    sentiment = Column(String, primary_key=True)
+    is_complaint = Column(Boolean, primary_key=True)
+    call_count = Column(Integer, nullable=False, default=0)
+    nps_sum = Column(Integer, nullable=False, default=0) # Ortalama NPS = nps_sum / nps_count
+    nps_count = Column(Integer, nullable=False, default=0) # NPS skoru olan çağrı sayısı
+
+class DailySubtopicStats(Base):
+    """Günlük özet: gün x guided alt konu başına çağrı ve şikayet sayısı (bir çağrı her alt konuda bir kez sayılır)."""
+    __tablename__ = "daily_subtopic_stats"
+    day = Column(String, primary_key=True)
+    sub_topic = Column(String, primary_key=True)
+    call_count = Column(Integer, nullable=False, default=0)
+    complaint_count = Column(Integer, nullable=False, default=0)
+
+class AnalysisCache(Base):
+    """
+    İçerik-adresli sonuç önbelleği: Aynı transkript (farklı call_id ile bile) tekrar geldiğinde
+    LLM'e gitmeden saklanan CallAnalysisOutput JSON'u kullanılır.
+    """
+    __tablename__ = "analysis_cache"
+    transcript_hash = Column(String, primary_key=True) # Transkript metninin SHA-256 özeti
+    prompt_version = Column(String, primary_key=True)
+    llm_model = Column(String, primary_key=True)
+    output_json = Column(Text, nullable=False) # RAG eşlemesi dahil nihai CallAnalysisOutput
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class LLMJournal(Base):
+    """
+    Append-only ham LLM yanıt günlüğü. Her çıkarım sonucu geldiği anda yazılır; pipeline
+    çökse bile bir sonraki çalıştırmada bu yanıtlar tekrar ödenmeden RAG/DB adımına verilir.
+    Sonuç 'calls_output'a yazıldığı transaction'da silinir.
+    """
+    __tablename__ = "llm_journal"
+    id = Column(Integer, primary_key=True)
+    input_call_id = Column(Integer, index=True)
+    transcript_hash = Column(String, index=True)
+    prompt_version = Column(String)
+    llm_model = Column(String)
+    response_json = Column(Text, nullable=False) # RAG öncesi ham CallAnalysisOutput
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 def create_db_and_tables():
     """Veritabanı ve tabloları oluşturur."""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns_and_indexes()
+
+def _add_missing_columns_and_indexes():
+    """
+    create_all() mevcut tablolara yeni kolon/index eklemez.
+    Eski bir bank_calls.db ile çalışırken eksik kolonları ALTER TABLE ile ekler.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
 
 
 SentimentEnum = Literal["POZITIF", "NEGATIF", "NOTR"]
@@ -110,4 +232,42 @@ class CallAnalysisOutput(BaseModel):
     
     nps_rationale: Optional[str] = Field(description="NPS skorunu çıkarsadığın ifadelerin aslına sadık kısa özeti.")
     
-    top_keywords: List[str] = Field(description="MÜŞTERİ'nin (temsilcinin değil) kullandığı, çağrı içinde önem derecesi en yüksek ve en iyi anlatan 4 kelime veya kısa kelime öbeği seç.", max_items=4)
\ No newline at end of file
+    top_keywords: List[str] = Field(description="MÜŞTERİ'nin (temsilcinin değil) kullandığı, çağrı içinde önem derecesi en yüksek ve en iyi anlatan 4 kelime veya kısa kelime öbeği seç.", max_items=4)
+
+# Küçük model katmanının azaltılmış şeması: kural motorunun doldurduğu flag'ler, RAG alanları ve
+# nps_rationale çıkarılmıştır. Alan tanımları CallAnalysisOutput'tan alınır (açıklamalar tek yerde).
+LITE_SCHEMA_FIELDS = (
+    "intent", "summary", "main_topic_free", "sub_topics_free", "sentiment", "is_complaint",
+    "complaint_reason", "is_product_offer", "nps_score", "top_keywords",
+)
+CallAnalysisLite = create_model(
+    "CallAnalysisLite",
+    __doc__="Kısa/basit çağrılar için küçük modelden dönmesini beklediğimiz azaltılmış yapı.",
+    **{
+        name: (CallAnalysisOutput.model_fields[name].annotation, CallAnalysisOutput.model_fields[name])
+        for name in LITE_SCHEMA_FIELDS
+    },
+)
+
+def call_output_values(call_input_id, final_output: CallAnalysisOutput, hierarchy_version=None) -> dict:
+    """'calls_output' satırının kolon değerleri (toplu INSERT / executemany için)."""
+    return dict(
+        input_call_id=call_input_id,
+        intent=final_output.intent,
+        summary=final_output.summary,
+        main_topic_free=final_output.main_topic_free,
+        main_topic_guided=final_output.main_topic_guided,
+        sub_topics_free=", ".join(final_output.sub_topics_free or []),
+        sub_topics_guided=", ".join(final_output.sub_topics_guided or []),
+        sentiment=final_output.sentiment,
+        is_complaint=final_output.is_complaint,
+        complaint_reason=final_output.complaint_reason,
+        is_product_offer=final_output.is_product_offer,
+        is_escalation=final_output.is_escalation,
+        is_regulatory_mention=final_output.is_regulatory_mention,
+        is_other_bank_mention=final_output.is_other_bank_mention,
+        nps_score=final_output.nps_score,
+        nps_rationale=final_output.nps_rationale,
+        top_keywords=", ".join(final_output.top_keywords or []),
+        hierarchy_version=hierarchy_version
+    )
@@ -0,0 +1,161 @@
+# app/preprocess.py
+import logging
+import re
+import time
+import unicodedata
+from sqlalchemy import select, update, or_
+from app.models import SessionLocal, CallInput, create_db_and_tables
+from app.result_cache import transcript_hash
+from app.utils import estimate_tokens, get_call_start
+
+log = logging.getLogger(__name__)
+
+def _speaker_pattern(names):
+    """'[Müşteri]', '(Temsilci):', 'MÜŞTERİ :', 'Agent -' gibi satır başı etiketlerini yakalar."""
+    alternatives = "|".join(names)
+    return re.compile(
+        rf"^(?:[\[(]\s*(?:{alternatives})\s*[\])]\s*[:\-–]?|(?:{alternatives})(?:\s*:|\s+[-–]))\s*",
+        re.IGNORECASE
+    )
+
+# Satır başındaki konuşmacı etiketi varyasyonları tek biçime indirilir
+_SPEAKER_TAGS = [
+    (_speaker_pattern(["müşteri", "musteri", "müsteri", "customer", "m"]), "Müşteri: "),
+    (_speaker_pattern(["müşteri temsilcisi", "temsilci", "agent", "operatör", "operator", "mt", "t"]), "Temsilci: "),
+]
+_INLINE_SPACE = re.compile(r"[ \t\u00a0\u200b]+")
+
+TOKEN_ENCODING = "o200k_base"
+ESTIMATE_COUNTER = "estimate"  # tiktoken yoksa: ~3 karakter/token tahmini
+
+_encoding = None  # None: henüz denenmedi, False: tiktoken kullanılamıyor
+
+def _get_encoding():
+    """tiktoken kodlamasını bir kez yükler; yüklenemezse (ör. ağ yoksa) kaba tahmine düşer."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception as e:
+            log.warning(f"tiktoken kodlaması yüklenemedi ({type(e).__name__}); token sayıları tahmin edilecek.")
+            _encoding = False
+    return _encoding
+
+def token_counter() -> str:
+    """Bu process'te count_tokens'ın kullandığı sayaç (calls_input.token_counter'a yazılır)."""
+    return TOKEN_ENCODING if _get_encoding() else ESTIMATE_COUNTER
+
+def count_tokens(text: str) -> int:
+    """Metnin token sayısı (tiktoken varsa gerçek, yoksa ~3 karakter/token tahmini)."""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+def normalize_transcript(transcript: str) -> str:
+    """
+    Unicode NFC, satır sonları ve boşlukları sadeleştirir, boş satırları atar ve
+    konuşmacı etiketlerini 'Müşteri:' / 'Temsilci:' biçiminde tekilleştirir.
+    """
+    text = unicodedata.normalize("NFC", transcript).replace("\r\n", "\n").replace("\r", "\n")
+    lines = []
+    for line in text.split("\n"):
+        line = _INLINE_SPACE.sub(" ", line).strip()
+        if not line:
+            continue
+        for pattern, canonical in _SPEAKER_TAGS:
+            if pattern.match(line):
+                line = pattern.sub(canonical, line, count=1)
+                break
+        lines.append(line)
+    return "\n".join(lines)
+
+def preprocess_fields(transcript: str, normalize: bool = True) -> dict:
+    """
+    Ingest sırasında bir kez hesaplanan alanlar: normalize transkript, çağrı başı,
+    token sayısı ve içerik özeti (sonuç önbelleği anahtarı).
+    """
+    normalized = normalize_transcript(transcript) if normalize else transcript
+    return {
+        "transcript": normalized,
+        "transcript_start": get_call_start(normalized),
+        "token_count": count_tokens(normalized),
+        "token_counter": token_counter(),
+        "content_hash": transcript_hash(normalized),
+    }
+
+def preprocess_missing_calls(chunk_size: int = 2000) -> int:
+    """
+    Ön işleme alanları boş olan (ör. eski bir veritabanından gelen) satırları doldurur.
+    Yalnızca henüz işlenmemiş çağrıların transkripti normalize edilir; işlenmiş çağrılarda
+    metin korunur, sadece türetilmiş alanlar yazılır. Dönüş: güncellenen satır sayısı.
+    """
+    create_db_and_tables()
+    db_session = SessionLocal()
+    start_time = time.time()
+    updated = 0
+    try:
+        while True:
+            calls = db_session.scalars(
+                select(CallInput).where(CallInput.token_count.is_(None)).order_by(CallInput.id).limit(chunk_size)
+            ).all()
+            if not calls:
+                break
+            for call in calls:
+                # İşlenmiş / işlenmekte olan çağrıların metni (ve önbellek anahtarı) değiştirilmez
+                keep_text = call.status in ("processed", "in_progress")
+                for name, value in preprocess_fields(call.transcript, normalize=not keep_text).items():
+                    setattr(call, name, value)
+            db_session.commit()
+            updated += len(calls)
+        if updated:
+            log.info(f"{updated} çağrı için ön işleme alanları {time.time() - start_time:.2f} sn'de dolduruldu.")
+        recount_estimated_tokens(chunk_size)
+        return updated
+    finally:
+        db_session.close()
+
+def recount_estimated_tokens(chunk_size: int = 2000) -> int:
+    """
+    tiktoken yüklenebiliyorsa, token sayısı tahminle (ör. ingest çevrimdışı yapıldıysa) ya da bilinmeyen
+    bir sayaçla hesaplanmış, henüz işlenmemiş çağrıları yeniden sayar. Böylece batch paketleme
+    (BATCH_TOKEN_BUDGET) ve katman seçimi (LITE_MAX_TOKENS) ingest ortamının ağ erişimine bağlı kalmaz.
+    Dönüş: güncellenen satır sayısı.
+    """
+    if not _get_encoding():
+        return 0
+    db_session = SessionLocal()
+    start_time = time.time()
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            rows = db_session.execute(
+                select(CallInput.id, CallInput.transcript)
+                .where(CallInput.id > last_id)
+                .where(CallInput.token_count.is_not(None))
+                .where(or_(CallInput.token_counter.is_(None), CallInput.token_counter != TOKEN_ENCODING))
+                .where(CallInput.status.not_in(("processed", "dead")))
+                .order_by(CallInput.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            db_session.execute(update(CallInput), [
+                {"id": row.id, "token_count": count_tokens(row.transcript), "token_counter": TOKEN_ENCODING}
+                for row in rows
+            ])
+            db_session.commit()
+            updated += len(rows)
+        if updated:
+            log.info(f"{updated} çağrının token sayısı {TOKEN_ENCODING} ile {time.time() - start_time:.2f} sn'de yeniden hesaplandı.")
+        return updated
+    finally:
+        db_session.close()
+
+if __name__ == "__main__":
+    from app.utils import setup_logging
+    setup_logging()
+    preprocess_missing_calls()
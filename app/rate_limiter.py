@@ -0,0 +1,269 @@
+# app/rate_limiter.py
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import List
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableLambda
+from app.config import (
+    OPENAI_REQUESTS_PER_MINUTE, OPENAI_TOKENS_PER_MINUTE, MAX_CONCURRENT_CALLS,
+    RATE_LIMIT_MIN_CONCURRENCY, RATE_LIMIT_DEFAULT_BACKOFF_SECONDS, RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_INCREASE_COOLDOWN_SECONDS,
+    LLM_COMPLETION_TOKENS_ESTIMATE, MAX_RETRIES
+)
+from app.utils import estimate_tokens
+from app import metrics
+
+log = logging.getLogger(__name__)
+
+# Event loop'a bağlı asyncio primitiflerini kullanmamak için bekleyenler kısa aralıklarla yoklar
+_POLL_SECONDS = 0.02
+
+def is_rate_limit_error(error) -> bool:
+    """OpenAI 429 (RateLimitError) veya HTTP 429 döndüren herhangi bir hata mı?"""
+    return type(error).__name__ == "RateLimitError" or getattr(error, "status_code", None) == 429
+
+def retry_after_seconds(error):
+    """Hatanın HTTP yanıtındaki Retry-After / retry-after-ms başlığını saniye olarak döner."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(retry_after)
+        return max(parsed.timestamp() - time.time(), 0.0) if parsed else None
+
+class TokenBucket:
+    """Dakikalık kapasitesi olan, sürekli dolan klasik token bucket."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.refill_per_second = per_minute / 60.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """'amount' token alınabilmesi için beklenmesi gereken süre (0 ise hemen alınabilir)."""
+        self._refill()
+        # Kapasiteden büyük istekler kova dolunca geçer (aksi halde sonsuza kadar beklerdi)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """Tahmin ile gerçek kullanım arasındaki farkı kovaya yansıtır (negatif = iade)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+class AdaptiveRateLimiter:
+    """
+    OpenAI istekleri için istemci tarafı hız sınırlayıcı:
+    - İstek/dakika ve tahmini token/dakika için iki ayrı token bucket,
+    - 429 / Retry-After sinyallerine göre AIMD ile ayarlanan eşzamanlılık limiti
+      (başarıda toplamsal artış, 429'da yarıya iniş ve Retry-After kadar duraklama).
+    Limit her değiştiğinde yeni bir "dönem" (epoch) başlar. Önceki dönemde, yani eski (daha yüksek)
+    limitle gönderilmiş isteklerin 429'ları limiti tekrar yarıya indirmez (aynı tıkanıklık olayıdır),
+    başarıları da limiti büyütmez. Son 429'dan sonraki RATE_LIMIT_INCREASE_COOLDOWN_SECONDS boyunca
+    limit hiç artırılmaz. Aksi halde yarıya inişin hemen ardından gelen başarılar limiti yeniden
+    429 bölgesine taşır.
+    Çıkarım zinciri ve embedding çağrıları aynı örneği paylaşır.
+    """
+
+    def __init__(self, requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+                 max_concurrency=MAX_CONCURRENT_CALLS,
+                 min_concurrency=RATE_LIMIT_MIN_CONCURRENCY):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.epoch = 0
+        self.last_rate_limited_at = None
+        self.requests = 0
+        self.rate_limited = 0
+
+    async def _acquire(self, estimated_tokens):
+        start = time.perf_counter()
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            if self.in_flight >= int(self.concurrency_limit):
+                await asyncio.sleep(_POLL_SECONDS)
+                continue
+            wait = max(self.request_bucket.wait_time(1), self.token_bucket.wait_time(estimated_tokens))
+            if wait > 0:
+                await asyncio.sleep(min(wait, 1.0))
+                continue
+            self.request_bucket.take(1)
+            self.token_bucket.take(estimated_tokens)
+            self.in_flight += 1
+            self.requests += 1
+            # Limiter kuyruğunda bekleme süresi (RPM/TPM bütçesi, eşzamanlılık limiti, 429 duraklaması)
+            metrics.observe("rate_limit_wait", time.perf_counter() - start)
+            return self.epoch
+
+    @asynccontextmanager
+    async def limit(self, estimated_tokens: int):
+        """Bir OpenAI isteğini sınırlar; 429 hatalarını yakalayıp limiti ayarlar ve hatayı yükseltir."""
+        epoch = await self._acquire(estimated_tokens)
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.on_rate_limited(retry_after_seconds(e), epoch)
+            raise
+        else:
+            self.on_success(epoch)
+        finally:
+            self.in_flight -= 1
+
+    def on_success(self, epoch=None):
+        if epoch is not None and epoch != self.epoch:
+            return
+        if (self.last_rate_limited_at is not None
+                and time.monotonic() - self.last_rate_limited_at < RATE_LIMIT_INCREASE_COOLDOWN_SECONDS):
+            return
+        # Toplamsal artış: tam bir "pencere" başarılı olunca limit ~1 artar
+        self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1.0 / self.concurrency_limit)
+
+    def on_rate_limited(self, retry_after=None, epoch=None):
+        self.rate_limited += 1
+        metrics.increment("rate_limited")
+        pause = retry_after if retry_after is not None else RATE_LIMIT_DEFAULT_BACKOFF_SECONDS
+        self.last_rate_limited_at = time.monotonic()
+        self.paused_until = max(self.paused_until, self.last_rate_limited_at + pause)
+        if epoch is not None and epoch != self.epoch:
+            # Limit düşürülmeden önce gönderilmiş istek: aynı tıkanıklık için tekrar yarıya inilmez
+            return
+        # Çarpımsal azalış
+        self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+        self.epoch += 1
+        log.warning(
+            f"OpenAI 429 alındı: eşzamanlılık limiti {self.concurrency_limit:.1f}'e düşürüldü, "
+            f"{pause:.1f} sn duraklatılıyor."
+        )
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Gerçek token kullanımı bilindiğinde TPM kovasını düzeltir."""
+        if actual_tokens:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "concurrency_limit": round(self.concurrency_limit, 2),
+            "in_flight": self.in_flight,
+        }
+
+_shared_limiter = None
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """Process genelinde paylaşılan limiter (zincir + embedding'ler aynı bütçeyi kullanır)."""
+    global _shared_limiter
+    if _shared_limiter is None:
+        _shared_limiter = AdaptiveRateLimiter()
+    return _shared_limiter
+
+async def call_with_retries(limiter, estimated_tokens, call, retry_errors=True, retry_metric=None):
+    """
+    'call' (argümansız coroutine fabrikası) çağrısını limiter'dan geçirerek yapar ve tekrar dener.
+    429'lar limiter tarafından duraklatılıp yeniden sıraya alındığı için kendi bütçelerini
+    (RATE_LIMIT_MAX_RETRIES) kullanır ve MAX_RETRIES'tan düşülmez; böylece limiter'ın zaten
+    yavaşlattığı bir istek, art arda birkaç 429 yüzünden başarısız olmaz. Diğer hatalar
+    (retry_errors=True ise) üstel geri çekilmeyle en fazla MAX_RETRIES kez denenir.
+    """
+    failures = 0
+    rate_limited = 0
+    while True:
+        try:
+            async with limiter.limit(estimated_tokens):
+                return await call()
+        except Exception as e:
+            if is_rate_limit_error(e):
+                rate_limited += 1
+                if rate_limited > RATE_LIMIT_MAX_RETRIES:
+                    raise
+            else:
+                failures += 1
+                if not retry_errors or failures >= MAX_RETRIES:
+                    raise
+            if retry_metric:
+                metrics.increment(retry_metric, type=type(e).__name__)
+            # 429'da bekleme limiter'ın duraklamasıyla yapılır; diğer hatalarda üstel geri çekilme
+            if not is_rate_limit_error(e):
+                await asyncio.sleep(min(2 ** failures, 30) * random.uniform(0.5, 1.0))
+
+def rate_limited_chat_model(llm, limiter=None):
+    """
+    Chat modelini limiter'dan geçen bir Runnable ile sarar. 429'lar limiter'a bildirilir ve
+    tekrar denemeler de limiter'dan geçer (bkz. call_with_retries); modelin kendi iç retry'ı
+    kapalı olmalıdır. Not: LangChain'in with_retry() batch yolunda return_exceptions ile
+    sonuçların sırası kayabildiği için tekrar deneme burada, çağrı bazında yapılır.
+    """
+    limiter = limiter or get_rate_limiter()
+
+    async def _ainvoke(prompt_value):
+        estimated = estimate_tokens(prompt_value.to_string()) + LLM_COMPLETION_TOKENS_ESTIMATE
+        message = await call_with_retries(
+            limiter, estimated, lambda: llm.ainvoke(prompt_value), retry_metric="llm_retries"
+        )
+        # Yapılandırılmış çıktı modunda (include_raw=True) kullanım bilgisi ham mesajdadır
+        raw_message = message["raw"] if isinstance(message, dict) else message
+        usage = getattr(raw_message, "usage_metadata", None) or {}
+        limiter.record_usage(estimated, usage.get("total_tokens"))
+        return message
+
+    def _invoke(prompt_value):
+        # Senkron yol (pipeline kullanmaz) limiter'ı atlar
+        return llm.invoke(prompt_value)
+
+    return RunnableLambda(_invoke, afunc=_ainvoke)
+
+class RateLimitedEmbeddings(Embeddings):
+    """Embedding isteklerini paylaşılan limiter'dan geçirir; 429'da limiter üzerinden tekrar dener."""
+
+    def __init__(self, underlying: Embeddings, limiter=None):
+        self.underlying = underlying
+        self.limiter = limiter or get_rate_limiter()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        estimated = sum(estimate_tokens(text) for text in texts)
+        # Yalnızca 429'lar tekrar denenir; diğer hatalar çağırana iletilir
+        return await call_with_retries(
+            self.limiter, estimated, lambda: self.underlying.aembed_documents(texts), retry_errors=False
+        )
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
@@ -0,0 +1,107 @@
+# app/remap_topics.py
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+from sqlalchemy import select, update, or_
+from app.models import SessionLocal, CallOutput, create_db_and_tables
+from app.config import REMAP_CHUNK_SIZE
+from app.analytics import ROLLUP_SOURCE_COLUMNS, split_list, update_guided_topics
+from app.topic_mapper import index_version, map_guided_topics
+from app.utils import setup_logging
+from app import metrics
+
+log = setup_logging()
+
+async def remap_guided_topics(vector_store, chunk_size=REMAP_CHUNK_SIZE, force=False):
+    """
+    'calls_output' satırlarındaki main_topic_guided / sub_topics_guided alanlarını, LLM'e gitmeden
+    saklanan serbest konulardan (main_topic_free / sub_topics_free) yeniden eşler.
+    Satırlar id sırasıyla 'chunk_size'lık parçalar halinde okunur; her parça tek RAG aramasıyla
+    eşlenip toplu UPDATE ile yazılır ve commit edilir (iş yarıda kesilse de ilerleme korunur).
+    Yalnızca hierarchy_version'ı etkin index sürümünden farklı olan satırlara dokunulur
+    ('force' ile tümü). Dönüş: güncellenen satır sayısı.
+    """
+    current = index_version(vector_store)
+    if current is None:
+        log.error("Konu index'inin sürümü bilinmiyor; önce 'python -m app.build_vector_store' çalıştırın.")
+        return 0
+
+    db_session = SessionLocal()
+    start_time = time.time()
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            # Rollup'lardaki eski katkıyı geri almak için guided alanların eski değerleri de okunur
+            query = select(CallOutput.main_topic_free, *ROLLUP_SOURCE_COLUMNS).where(CallOutput.id > last_id)
+            if not force:
+                query = query.where(or_(CallOutput.hierarchy_version.is_(None), CallOutput.hierarchy_version != current))
+            rows = db_session.execute(query.order_by(CallOutput.id).limit(chunk_size)).mappings().all()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+
+            # map_guided_topics yalnızca serbest/guided konu alanlarını kullanır
+            results = [
+                SimpleNamespace(
+                    main_topic_free=row["main_topic_free"], sub_topics_free=split_list(row["sub_topics_free"]),
+                    main_topic_guided=None, sub_topics_guided=[],
+                )
+                for row in rows
+            ]
+            with metrics.timed("remap_chunk"):
+                await map_guided_topics(vector_store, results)
+                # TopicIndex arama sırasında yeni sürüme geçmiş olabilir; eşlemeyi yapan sürüm yazılır
+                version = index_version(vector_store)
+                updates = [
+                    {
+                        "id": row["id"],
+                        "main_topic_guided": result.main_topic_guided,
+                        "sub_topics_guided": ", ".join(result.sub_topics_guided or []),
+                        "hierarchy_version": version,
+                    }
+                    for row, result in zip(rows, results)
+                ]
+                db_session.execute(update(CallOutput), updates)
+                # Guided alt konu satırları ve günlük rollup'lar aynı transaction'da güncellenir
+                update_guided_topics(db_session, rows, updates)
+                db_session.commit()
+            updated += len(rows)
+            log.info(f"{updated} satır yeniden eşlendi (son id: {last_id}).")
+
+        elapsed = time.time() - start_time
+        if updated:
+            log.info(
+                f"Toplam {updated} satırın guided konuları {elapsed:.2f} sn'de yeniden eşlendi "
+                f"({updated / elapsed:.0f} satır/sn, index sürümü: {current})."
+            )
+        else:
+            log.info(f"Tüm satırlar güncel index sürümüyle ({current}) eşlenmiş; yapılacak iş yok.")
+        return updated
+    except Exception as e:
+        db_session.rollback()
+        log.error(f"Yeniden eşleme sırasında hata: {e}")
+        return updated
+    finally:
+        db_session.close()
+
+def run_remap(chunk_size=REMAP_CHUNK_SIZE, force=False):
+    """Etkin konu index'ini yükleyip eski sürümle eşlenmiş satırları günceller."""
+    from app.main import load_retriever
+
+    create_db_and_tables()
+    vector_store = load_retriever()
+    if not vector_store:
+        return 0
+    return asyncio.run(remap_guided_topics(vector_store, chunk_size=chunk_size, force=force))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Konu hiyerarşisi değiştiğinde guided konu alanlarını LLM'e gitmeden yeniden eşler."
+    )
+    parser.add_argument("--chunk-size", type=int, default=REMAP_CHUNK_SIZE)
+    parser.add_argument("--all", action="store_true", help="Sürümüne bakmadan tüm satırları yeniden eşle")
+    args = parser.parse_args()
+
+    run_remap(args.chunk_size, force=args.all)
@@ -0,0 +1,40 @@
+# app/result_cache.py
+import hashlib
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import AnalysisCache, CallAnalysisOutput
+from app.config import PROMPT_VERSION, LLM_MODEL, LITE_LLM_MODEL, TIERED_EXTRACTION_ENABLED
+
+# Sonucu kabul edilen modeller: iki katmanlı çıkarımda küçük modelin sonuçları da geçerlidir
+ACCEPTED_LLM_MODELS = (LLM_MODEL, LITE_LLM_MODEL) if TIERED_EXTRACTION_ENABLED else (LLM_MODEL,)
+
+def transcript_hash(transcript: str) -> str:
+    """Transkript metninin içerik özetini (SHA-256) döner."""
+    return hashlib.sha256(transcript.strip().encode("utf-8")).hexdigest()
+
+def lookup_cached_results(db_session, hashes):
+    """Verilen transkript özetleri için önbellekteki sonuçları döner: {hash: CallAnalysisOutput}."""
+    if not hashes:
+        return {}
+    rows = db_session.query(AnalysisCache).filter(
+        AnalysisCache.transcript_hash.in_(set(hashes)),
+        AnalysisCache.prompt_version == PROMPT_VERSION,
+        AnalysisCache.llm_model.in_(ACCEPTED_LLM_MODELS)
+    ).all()
+    return {row.transcript_hash: CallAnalysisOutput.model_validate_json(row.output_json) for row in rows}
+
+def store_cached_results(db_session, entries):
+    """
+    Nihai sonuçları (cached_result_values satırları) tek bir toplu INSERT ile önbelleğe yazar
+    (commit çağırana aittir). Aynı içerik başka bir worker tarafından zaten yazıldıysa sessizce atlanır.
+    """
+    if entries:
+        db_session.execute(sqlite_insert(AnalysisCache).on_conflict_do_nothing(), entries)
+
+def cached_result_values(content_hash, output: CallAnalysisOutput, llm_model: str = LLM_MODEL) -> dict:
+    """'analysis_cache' satırının kolon değerleri (toplu INSERT için)."""
+    return dict(
+        transcript_hash=content_hash,
+        prompt_version=PROMPT_VERSION,
+        llm_model=llm_model,
+        output_json=output.model_dump_json()
+    )
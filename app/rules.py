@@ -0,0 +1,187 @@
+# app/rules.py
+from collections import deque
+from app.models import CallAnalysisOutput
+from app.config import TIERED_EXTRACTION_ENABLED, LITE_MAX_TOKENS
+
+try:
+    import ahocorasick  # pyahocorasick: C uygulaması; yoksa aşağıdaki saf Python otomatı kullanılır
+except ImportError:
+    ahocorasick = None
+
+# Kategori -> anahtar ifadeler. Sonu '*' ile biten ifadeler ek alabilir ("bddk*" -> "bddkya"),
+# diğerleri tam kelime olarak (kesme işaretli ekler dahil: "teb'e") eşleşir.
+# Karşılaştırma Türkçe karakterler ASCII'ye indirgenerek yapılır (bkz. fold_text).
+RULE_PATTERNS = {
+    "regulatory": [
+        "bddk*", "bankacılık düzenleme ve denetleme*", "cimer*", "tüketici hakem heyeti*", "hakem heyeti*",
+        "tüketici mahkemesi*", "merkez bankası*", "tcmb*", "spk", "kvkk*", "kişisel verileri koruma*",
+        "savcılığa", "savcılık*", "avukatım*", "dava açacağım", "dava açarım", "yasal yollara*",
+    ],
+    "other_bank": [
+        "garanti bbva*", "garanti bankası*", "garanti'*", "iş bankası*", "işbankası*", "yapı kredi*",
+        "ziraat*", "halkbank*", "halk bankası*", "vakıfbank*", "vakıflar bankası*", "denizbank*",
+        "qnb*", "finansbank*", "enpara*", "teb", "ing bank*", "ing'*", "hsbc*", "kuveyt türk*",
+        "albaraka*", "şekerbank*", "odeabank*", "fibabanka*", "alternatifbank*", "anadolubank*",
+        "türkiye finans*", "papara*",
+    ],
+    "escalation": [
+        "aktarıyorum", "aktarıyoruz", "aktaracağım", "aktaracağız", "aktarılıyorsunuz", "aktarıyorum efendim",
+        "bağlıyorum", "bağlayacağım", "bağlıyoruz", "yönlendiriyorum", "yönlendireceğim", "yönlendiriyoruz",
+        "ilgili birime*", "ilgili departmana*", "ilgili ekibe*", "üst yetkiliye*", "yöneticime bağla*",
+        "transfer ediyorum",
+    ],
+    # Flag alanı değil; çağrıyı küçük modele yönlendirmeyi engelleyen karmaşıklık sinyali
+    "complaint": [
+        "şikayet*", "şikâyet*", "rezalet*", "mağdur*", "kabul edilemez*", "skandal*", "dolandırıl*",
+        "itiraz ediyorum", "memnun değilim",
+    ],
+}
+
+# Bu sinyallerden biri varsa çağrı "basit" sayılmaz ve küçük modele yönlendirilmez
+COMPLEX_CATEGORIES = {"complaint", "regulatory", "escalation"}
+
+# CallAnalysisOutput flag alanı -> kural kategorisi
+FLAG_CATEGORIES = {
+    "is_regulatory_mention": "regulatory",
+    "is_other_bank_mention": "other_bank",
+    "is_escalation": "escalation",
+}
+
+# str.translate ASCII dışı metinlerde karakter başına yavaş; az sayıda replace çok daha hızlı
+_FOLD_PAIRS = [
+    ("ı", "i"), ("ş", "s"), ("ğ", "g"), ("ü", "u"), ("ö", "o"), ("ç", "c"), ("â", "a"), ("î", "i"), ("û", "u"),
+    ("’", "'"), ("`", "'"),
+]
+
+def fold_text(text: str) -> str:
+    """Küçük harfe çevirip Türkçe karakterleri ASCII'ye indirger ('İŞ BANKASI' -> 'is bankasi')."""
+    # str.lower() 'İ' için birleşik nokta üretir; önce düz 'i'ye çevrilir
+    text = text.replace("İ", "i").replace("I", "i").lower()
+    for source, target in _FOLD_PAIRS:
+        text = text.replace(source, target)
+    return text
+
+class KeywordMatcher:
+    """
+    Aho-Corasick otomatı: tüm ifadeleri metin üzerinde tek geçişte arar (metin uzunluğuyla doğrusal,
+    ifade sayısından bağımsız). Eşleşmeler kelime başında başlamalı; ek almayan ifadeler kelime
+    sonunda bitmelidir. pyahocorasick kuruluysa otomat C tarafında çalışır.
+    """
+
+    def __init__(self, patterns_by_category):
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]  # durum -> [(ifade uzunluğu, kategori, ek alabilir mi)]
+        entries = {}  # katlanmış ifade -> [(ifade uzunluğu, kategori, ek alabilir mi)]
+        for category, patterns in patterns_by_category.items():
+            for pattern in patterns:
+                folded = fold_text(pattern.rstrip("*"))
+                entries.setdefault(folded, []).append((len(folded), category, pattern.endswith("*")))
+
+        self._automaton = None
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for folded, outputs in entries.items():
+                self._automaton.add_word(folded, outputs)
+            self._automaton.make_automaton()
+        else:
+            for folded, outputs in entries.items():
+                self._add(folded, outputs)
+            self._build_failure_links()
+
+    def _add(self, pattern, outputs):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].extend(outputs)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # Sonek durumlarının eşleşmeleri de bu durumda raporlanır
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def _iter_matches(self, folded):
+        """(bitiş indeksi, [(ifade uzunluğu, kategori, ek alabilir mi)]) çiftlerini verir."""
+        if self._automaton is not None:
+            yield from self._automaton.iter(folded)
+            return
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        root = goto[0]
+        state = 0
+        for end, char in enumerate(folded):
+            if not state and char not in root:
+                continue
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                yield end, outputs[state]
+
+    def categories(self, text: str) -> set:
+        """Metinde geçen ifadelerin kategorilerini döner."""
+        folded = fold_text(text)
+        length = len(folded)
+        found = set()
+        for end, matches in self._iter_matches(folded):
+            for pattern_length, category, allow_suffix in matches:
+                if category in found:
+                    continue
+                start = end - pattern_length + 1
+                if start > 0 and folded[start - 1].isalnum():
+                    continue
+                if not allow_suffix and end + 1 < length and folded[end + 1].isalnum():
+                    continue
+                found.add(category)
+        return found
+
+_matcher = None
+
+def get_matcher() -> KeywordMatcher:
+    """Process başına bir kez kurulan varsayılan eşleştiriciyi döner."""
+    global _matcher
+    if _matcher is None:
+        _matcher = KeywordMatcher(RULE_PATTERNS)
+    return _matcher
+
+def detect_signals(transcript: str) -> set:
+    """Transkriptte geçen kural kategorilerini döner (ör. {'regulatory', 'complaint'})."""
+    return get_matcher().categories(transcript)
+
+def rule_flags(signals) -> dict:
+    """Kural sinyallerinden flag alanlarını üretir: {'is_escalation': True, ...}."""
+    return {field: category in signals for field, category in FLAG_CATEGORIES.items()}
+
+def choose_tier(token_count: int, num_parts: int, signals) -> str:
+    """
+    Çağrının hangi katmanda çıkarılacağını seçer: "lite" (küçük model, azaltılmış şema) veya "full".
+    Yalnızca tek parçalı, LITE_MAX_TOKENS altındaki ve karmaşıklık sinyali olmayan çağrılar "lite" olur.
+    """
+    if not TIERED_EXTRACTION_ENABLED or num_parts > 1 or token_count > LITE_MAX_TOKENS:
+        return "full"
+    return "full" if COMPLEX_CATEGORIES & set(signals) else "lite"
+
+def apply_rule_flags(result, signals) -> CallAnalysisOutput:
+    """
+    Azaltılmış şemalı (küçük model) sonucun eksik flag'lerini kural sonuçlarıyla doldurup tam
+    CallAnalysisOutput döner. Ana model sonucu olduğu gibi bırakılır: flag'leri modelden gelir.
+    Geniş ifadeler ("bağlıyorum", "merkez bankası*") bağlamdan bağımsız eşleştiği için modelin
+    False kararını ezmemelidir.
+    """
+    if isinstance(result, CallAnalysisOutput):
+        return result
+    return CallAnalysisOutput(**result.model_dump(), **rule_flags(signals), nps_rationale=None)
@@ -0,0 +1,372 @@
+# app/service.py
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.models import SessionLocal, AnalysisCache, create_db_and_tables
+from app.config import PRODUCT_LIST_PATH, SERVICE_HOST, SERVICE_PORT, SERVICE_BATCH_WINDOW_SECONDS
+from app.config import SERVICE_MAX_BATCH_SIZE, SERVICE_MAX_CONCURRENT_BATCHES, SERVICE_MAX_TRANSCRIPTS_PER_REQUEST
+from app.config import SERVICE_MAX_BODY_BYTES
+from app.main import load_retriever, extract_calls, _map_topics_isolated, _tier_model
+from app.llm_chain import create_tiered_extraction_chain
+from app.preprocess import preprocess_fields
+from app.result_cache import lookup_cached_results, cached_result_values
+from app.topic_mapper import index_version
+from app.utils import setup_logging, load_text_file
+from app import metrics
+
+log = setup_logging()
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+class RequestError(Exception):
+    """İstemciye 4xx olarak dönen, istekten kaynaklanan hata."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def _lookup_cached(hashes):
+    db_session = SessionLocal()
+    try:
+        return lookup_cached_results(db_session, hashes)
+    finally:
+        db_session.close()
+
+def _store_cached(entries):
+    # Servisin ürettiği sonuçlar da içerik önbelleğine yazılır; aynı transkript (servis ya da batch
+    # pipeline'ında) tekrar geldiğinde LLM'e gidilmez
+    db_session = SessionLocal()
+    try:
+        db_session.execute(sqlite_insert(AnalysisCache).on_conflict_do_nothing(), entries)
+        db_session.commit()
+    finally:
+        db_session.close()
+
+async def analyze_transcripts(extraction_chain, vector_store, calls):
+    """
+    Bir mikro-batch'i işler: içerik önbelleği, tek LLM batch isteği ve tek RAG araması.
+    'calls' {içerik özeti: ön işlenmiş çağrı} sözlüğüdür. Dönüş: ({hash: CallAnalysisOutput}, {hash: hata})
+    """
+    with metrics.timed("cache_lookup"):
+        final_results = await asyncio.to_thread(_lookup_cached, list(calls))
+    metrics.increment("result_cache_lookups", len(calls))
+    metrics.increment("result_cache_hits", len(final_results))
+
+    pending = {content_hash: call for content_hash, call in calls.items() if content_hash not in final_results}
+    if not pending:
+        return final_results, {}
+    partial_results, errors, call_tiers = await extract_calls(extraction_chain, pending)
+    if partial_results:
+        with metrics.timed("rag_mapping"):
+            rag_errors = await _map_topics_isolated(vector_store, partial_results)
+        errors.update(rag_errors)
+        for error in rag_errors.values():
+            metrics.increment("errors", stage="rag", type=type(error).__name__)
+        mapped = {content_hash: result for content_hash, result in partial_results.items() if content_hash not in rag_errors}
+        if mapped:
+            try:
+                await asyncio.to_thread(_store_cached, [
+                    cached_result_values(content_hash, result, _tier_model(call_tiers.get(content_hash)))
+                    for content_hash, result in mapped.items()
+                ])
+            except Exception as e:
+                # Önbelleğe yazılamaması yanıtı etkilemez
+                metrics.increment("errors", stage="service_cache", type=type(e).__name__)
+                log.warning(f"Servis sonuçları önbelleğe yazılamadı: {e}")
+        final_results.update(mapped)
+    return final_results, errors
+
+class MicroBatcher:
+    """
+    Eşzamanlı istekleri mikro-batch'lerde toplar. İlk transkript geldikten sonra en fazla 'window' sn
+    (ya da 'max_batch_size' transkripte ulaşılana kadar) beklenir; toplanan transkriptler tek LLM batch'i
+    ve tek embedding/konu aramasıyla işlenir. Aynı anda en fazla 'max_concurrent_batches' batch çalışır;
+    slotlar doluyken gelen istekler kuyrukta birikir ve bir sonraki batch'e girer.
+    """
+
+    def __init__(self, extraction_chain, vector_store, window=SERVICE_BATCH_WINDOW_SECONDS,
+                 max_batch_size=SERVICE_MAX_BATCH_SIZE, max_concurrent_batches=SERVICE_MAX_CONCURRENT_BATCHES):
+        self.extraction_chain = extraction_chain
+        self.vector_store = vector_store
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue = asyncio.Queue()
+        self._arrived = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_concurrent_batches)
+        self._batches = set()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def analyze(self, transcripts):
+        """Transkriptleri kuyruğa ekler ve sonuçlarını bekler: her biri için CallAnalysisOutput ya da hata."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for transcript in transcripts:
+            future = loop.create_future()
+            # Ingest ile aynı ön işleme: aynı transkript aynı önbellek anahtarını üretir
+            self._queue.put_nowait((SimpleNamespace(id=None, **preprocess_fields(transcript)), future, time.perf_counter()))
+            futures.append(future)
+        self._arrived.set()
+        metrics.gauge("service_queue_depth", self._queue.qsize())
+        return await asyncio.gather(*futures, return_exceptions=True)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+    async def _collect(self):
+        """İlk öğeyi bekler; ardından pencere süresi dolana ya da batch dolana kadar gelenleri toplar."""
+        items = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(items) < self.max_batch_size:
+            if not self._queue.empty():
+                items.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            # Kuyruk öğesi yerine olay beklenir: zaman aşımında kuyruktan öğe kaybolmaz
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def _run(self):
+        while True:
+            # Slot boşalmadan toplamaya başlanmaz; bu sürede gelenler bir sonraki batch'i doldurur
+            await self._slots.acquire()
+            try:
+                items = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._process(items))
+            self._batches.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task):
+        self._batches.discard(task)
+        self._slots.release()
+
+    async def _process(self, items):
+        calls = {}
+        for call, _, _ in items:
+            calls.setdefault(call.content_hash, call)
+        metrics.increment("service_batches")
+        metrics.increment("service_transcripts", len(items))
+        metrics.gauge("service_batch_size", len(items))
+        log.info(f"Mikro-batch: {len(items)} transkript ({len(calls)} farklı içerik) işleniyor...")
+        try:
+            with metrics.timed("service_batch"):
+                results, errors = await analyze_transcripts(self.extraction_chain, self.vector_store, calls)
+        except Exception as e:
+            metrics.increment("errors", stage="service", type=type(e).__name__)
+            log.error(f"Mikro-batch işlenemedi: {e}")
+            results, errors = {}, {content_hash: e for content_hash in calls}
+        now = time.perf_counter()
+        for call, future, enqueued_at in items:
+            metrics.observe("service_queue_wait", now - enqueued_at)
+            if future.done():
+                # İstemci bağlantıyı kapatmış (istek iptal edilmiş)
+                continue
+            if call.content_hash in results:
+                future.set_result(results[call.content_hash])
+            else:
+                future.set_exception(errors.get(call.content_hash) or RuntimeError("Sonuç üretilemedi"))
+
+def _parse_transcripts(body):
+    """{"transcript": "..."} ya da {"transcripts": [...]} gövdesini çözer. Dönüş: (transkriptler, tekil mi)."""
+    try:
+        payload = json.loads(body)
+    except ValueError as e:
+        raise RequestError(400, f"Geçersiz JSON: {e}")
+    if not isinstance(payload, dict):
+        raise RequestError(400, "Gövde bir JSON nesnesi olmalı")
+    if "transcript" in payload:
+        transcripts, single = [payload["transcript"]], True
+    elif "transcripts" in payload:
+        transcripts, single = payload["transcripts"], False
+        if not isinstance(transcripts, list):
+            raise RequestError(400, "'transcripts' bir liste olmalı")
+    else:
+        raise RequestError(400, "'transcript' ya da 'transcripts' alanı gerekli")
+    if len(transcripts) > SERVICE_MAX_TRANSCRIPTS_PER_REQUEST:
+        raise RequestError(413, f"Bir istekte en fazla {SERVICE_MAX_TRANSCRIPTS_PER_REQUEST} transkript gönderilebilir")
+    if not all(isinstance(transcript, str) and transcript.strip() for transcript in transcripts):
+        raise RequestError(400, "Transkriptler boş olmayan metinler olmalı")
+    return transcripts, single
+
+def _result_json(result):
+    return json.loads(result.model_dump_json())
+
+class AnalysisService:
+    """
+    Zincir, konu index'i ve ürün listesi bir kez yüklenir; asyncio HTTP sunucusu istekleri
+    MicroBatcher'a iletir. Uç noktalar:
+      POST /analyze  {"transcript": "..."}      -> CallAnalysisOutput JSON
+                     {"transcripts": ["...", ...]} -> {"results": [CallAnalysisOutput | {"error": ...}, ...]}
+      GET  /health   -> durum ve konu index'i sürümü
+      GET  /metrics  -> Prometheus metrikleri
+    """
+
+    def __init__(self, batcher, vector_store):
+        self.batcher = batcher
+        self.vector_store = vector_store
+
+    async def handle_connection(self, reader, writer):
+        """Tek bir bağlantıdaki (keep-alive) istekleri sırayla işler."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Geçersiz istek satırı"}, keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Geçersiz Content-Length"}, keep_alive=False)
+                    break
+                if length > SERVICE_MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "İstek gövdesi çok büyük"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload, content_type = await self._dispatch(method, target.split("?")[0], body)
+                await self._respond(writer, status, payload, keep_alive, content_type)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        if path == "/analyze":
+            if method != "POST":
+                return 405, {"error": "Yalnızca POST desteklenir"}, None
+            start = time.perf_counter()
+            try:
+                status, payload = await self._analyze(body)
+            except RequestError as e:
+                status, payload = e.status, {"error": str(e)}
+            metrics.observe("service_request", time.perf_counter() - start)
+            metrics.increment("service_requests", status=status)
+            return status, payload, None
+        if path == "/health" and method == "GET":
+            return 200, {"status": "ok", "topic_index_version": index_version(self.vector_store)}, None
+        if path == "/metrics" and method == "GET":
+            return 200, metrics.render_prometheus(), "text/plain; version=0.0.4; charset=utf-8"
+        return 404, {"error": "Bulunamadı"}, None
+
+    async def _analyze(self, body):
+        transcripts, single = _parse_transcripts(body)
+        results = await self.batcher.analyze(transcripts)
+        if single:
+            result = results[0]
+            if isinstance(result, Exception):
+                return 500, {"error": f"{type(result).__name__}: {result}"}
+            return 200, _result_json(result)
+        return 200, {"results": [
+            {"error": f"{type(result).__name__}: {result}"} if isinstance(result, Exception) else _result_json(result)
+            for result in results
+        ]}
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive, content_type=None):
+        if content_type is None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            body = payload.encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+async def serve(extraction_chain, vector_store, host=SERVICE_HOST, port=SERVICE_PORT):
+    """HTTP sunucusunu başlatır ve durdurulana kadar çalışır."""
+    batcher = MicroBatcher(extraction_chain, vector_store).start()
+    service = AnalysisService(batcher, vector_store)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    log.info(
+        f"Analiz servisi http://{host}:{port} adresinde hazır (mikro-batch penceresi: "
+        f"{batcher.window * 1000:.0f} ms, en fazla {batcher.max_batch_size} transkript)."
+    )
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.close()
+
+def run_service(host=SERVICE_HOST, port=SERVICE_PORT):
+    """Konu index'ini, ürün listesini ve zinciri bir kez yükleyip servisi çalıştırır."""
+    create_db_and_tables()
+    vector_store = load_retriever()
+    if not vector_store:
+        return
+    log.info("Ürün listesi yükleniyor...")
+    product_list_str = load_text_file(PRODUCT_LIST_PATH)
+    extraction_chain = create_tiered_extraction_chain(product_list_str)
+    try:
+        asyncio.run(serve(extraction_chain, vector_store, host, port))
+    except KeyboardInterrupt:
+        log.info("Analiz servisi durduruldu.")
+    finally:
+        vector_store.embeddings.log_stats()
+
+def analyze_one(transcript):
+    """
+    Tek bir transkripti servisle aynı yoldan (önbellek, kural motoru, LLM, RAG) analiz eder.
+    Dönüş: CallAnalysisOutput (hata durumunda istisna fırlatır).
+    """
+    create_db_and_tables()
+    vector_store = load_retriever()
+    if not vector_store:
+        raise RuntimeError("Konu index'i yüklenemedi")
+    extraction_chain = create_tiered_extraction_chain(load_text_file(PRODUCT_LIST_PATH))
+    call = SimpleNamespace(id=None, **preprocess_fields(transcript))
+    try:
+        results, errors = asyncio.run(analyze_transcripts(extraction_chain, vector_store, {call.content_hash: call}))
+    finally:
+        vector_store.embeddings.log_stats()
+    if call.content_hash not in results:
+        raise errors.get(call.content_hash) or RuntimeError("Sonuç üretilemedi")
+    return results[call.content_hash]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tekil çağrıları analiz eden, sürekli çalışan HTTP servisi.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    args = parser.parse_args()
+
+    run_service(args.host, args.port)
@@ -1,66 +1,176 @@
 # app/setup_db.py
-import pandas as pd
+import argparse
+import math
+import os
+import time
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
 from app.models import engine, create_db_and_tables, CallInput, Base
 import logging
+from app.dedupe import flag_near_duplicates
+from app.preprocess import preprocess_fields, preprocess_missing_calls
 
-# XLSX dosyanızın yolu
+# XLSX dosyanızın yolu (CSV ve Parquet dosyaları da kabul edilir)
 XLSX_PATH = "data/new_calls.xlsx"
 # Transkriptlerin olduğu sütunun adı (Sizdeki adı buraya yazın)
-TRANSCRIPT_COLUMN_NAME = "Transkript" 
+TRANSCRIPT_COLUMN_NAME = "Transkript"
 # Benzersiz bir ID sütunu varsa (yoksa index'i kullanırız)
-CALL_ID_COLUMN_NAME = "Çağrı ID" 
+CALL_ID_COLUMN_NAME = "Çağrı ID"
+# Dosya bu kadar satırlık parçalar halinde okunur ve yazılır (bellek kullanımı sabit kalır)
+INGEST_CHUNK_SIZE = 5000
+# SQLite'ın sorgu başına değişken sınırına takılmamak için IN (...) listelerinin boyutu
+_IN_CLAUSE_LIMIT = 900
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
-def load_xlsx_to_db():
+def _iter_xlsx_chunks(path, chunk_size):
+    """openpyxl read-only modunda satırları akış halinde okur; tüm çalışma kitabı belleğe alınmaz."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell) if cell is not None else "" for cell in next(rows, ())]
+        chunk = []
+        for values in rows:
+            chunk.append(dict(zip(header, values)))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+_NEEDED_COLUMNS = (CALL_ID_COLUMN_NAME, TRANSCRIPT_COLUMN_NAME)
+
+def _iter_csv_chunks(path, chunk_size):
+    import pandas as pd  # yalnızca CSV girdisi için gerekir (import'u ~0.4 sn)
+
+    # Yalnızca gereken sütunlar okunur
+    for frame in pd.read_csv(path, chunksize=chunk_size, dtype=str, usecols=lambda c: c in _NEEDED_COLUMNS):
+        yield frame.to_dict("records")
+
+def _iter_parquet_chunks(path, chunk_size):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    columns = [c for c in _NEEDED_COLUMNS if c in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pylist()
+
+def iter_source_chunks(path, chunk_size=INGEST_CHUNK_SIZE):
+    """Dosya uzantısına göre (.xlsx/.xlsm, .csv, .parquet) satırları {sütun: değer} parçaları olarak verir."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        return _iter_xlsx_chunks(path, chunk_size)
+    if extension == ".csv":
+        return _iter_csv_chunks(path, chunk_size)
+    if extension == ".parquet":
+        return _iter_parquet_chunks(path, chunk_size)
+    raise ValueError(f"Desteklenmeyen dosya türü: '{extension}' (xlsx, csv veya parquet bekleniyor)")
+
+def _is_blank(value):
+    return value is None or (isinstance(value, float) and math.isnan(value)) or not str(value).strip()
+
+def _existing_call_ids(session, call_ids):
+    """Verilen call_id'lerden veritabanında zaten olanları tek sorguda (IN listesi parçalarıyla) döner."""
+    existing = set()
+    for start in range(0, len(call_ids), _IN_CLAUSE_LIMIT):
+        part = call_ids[start:start + _IN_CLAUSE_LIMIT]
+        existing.update(session.scalars(select(CallInput.call_id).where(CallInput.call_id.in_(part))))
+    return existing
+
+def load_calls_to_db(path=XLSX_PATH, chunk_size=INGEST_CHUNK_SIZE):
+    """
+    Çağrı dosyasını parça parça okuyup 'calls_input' tablosuna toplu olarak ekler.
+    Her parçada mevcut call_id'ler tek sorguyla alınır, yeni satırlar tek bir
+    INSERT ... ON CONFLICT DO NOTHING (executemany) ile yazılır ve parça commit edilir.
+    """
     log.info("Veritabanı ve tablolar oluşturuluyor...")
     create_db_and_tables()
-    
-    log.info(f"'{XLSX_PATH}' dosyasından veriler okunuyor...")
-    try:
-        df = pd.read_excel(XLSX_PATH)
-    except FileNotFoundError:
-        log.error(f"HATA: '{XLSX_PATH}' dosyası bulunamadı.")
-        return
-    except Exception as e:
-        log.error(f"XLSX okuma hatası: {e}")
+
+    log.info(f"'{path}' dosyasından veriler okunuyor...")
+    if not os.path.exists(path):
+        log.error(f"HATA: '{path}' dosyası bulunamadı.")
         return
 
     # Veritabanı oturumu başlatma
     SessionLocal = sessionmaker(bind=engine)
     session = SessionLocal()
+    insert_stmt = sqlite_insert(CallInput).on_conflict_do_nothing(index_elements=["call_id"])
 
     log.info("Transkriptler 'calls_input' tablosuna yükleniyor...")
+    start_time = time.time()
+    row_index = 0
+    read_count = 0
     count = 0
+    skipped = 0
     try:
-        for index, row in df.iterrows():
-            call_id = str(row.get(CALL_ID_COLUMN_NAME, f"call_{index}"))
-            transcript = row.get(TRANSCRIPT_COLUMN_NAME)
-
-            if not transcript or pd.isna(transcript):
-                log.warning(f"Satır {index} (ID: {call_id}) atlanıyor: Transkript boş.")
-                continue
-
-            # Bu call_id daha önce eklendi mi diye kontrol et
-            exists = session.query(CallInput).filter_by(call_id=call_id).first()
-            if not exists:
-                new_call = CallInput(
-                    call_id=call_id,
-                    transcript=str(transcript),
-                    status="pending" # Başlangıç durumu
-                )
-                session.add(new_call)
-                count += 1
-            
-        session.commit()
-        log.info(f"Başarıyla {count} adet yeni çağrı transkripti veritabanına eklendi.")
+        for chunk in iter_source_chunks(path, chunk_size):
+            records = {}
+            for row in chunk:
+                index = row_index
+                row_index += 1
+                call_id = row.get(CALL_ID_COLUMN_NAME)
+                call_id = f"call_{index}" if _is_blank(call_id) else str(call_id).strip()
+                transcript = row.get(TRANSCRIPT_COLUMN_NAME)
+
+                if _is_blank(transcript):
+                    log.warning(f"Satır {index} (ID: {call_id}) atlanıyor: Transkript boş.")
+                    skipped += 1
+                    continue
+                # Dosya içinde tekrar eden call_id'lerde ilk satır geçerlidir
+                if call_id not in records:
+                    # Ön işleme (normalizasyon, çağrı başı, token sayısı, özet) ingest'te bir kez yapılır
+                    records[call_id] = {"call_id": call_id, "status": "pending", **preprocess_fields(str(transcript))}
+
+            read_count += len(chunk)
+            existing = _existing_call_ids(session, list(records))
+            new_records = [record for call_id, record in records.items() if call_id not in existing]
+            if new_records:
+                # Eşzamanlı başka bir yükleme aynı call_id'yi eklediyse satır sessizce atlanır
+                session.execute(insert_stmt, new_records)
+            session.commit()
+            count += len(new_records)
+
+            elapsed = time.time() - start_time
+            log.info(
+                f"{read_count} satır okundu, {count} yeni çağrı eklendi "
+                f"({read_count / elapsed if elapsed else 0:.0f} satır/sn)."
+            )
+
+        elapsed = time.time() - start_time
+        log.info(
+            f"Başarıyla {count} adet yeni çağrı transkripti veritabanına eklendi "
+            f"({read_count} satır, {skipped} boş satır atlandı, {elapsed:.2f} sn, "
+            f"{read_count / elapsed if elapsed else 0:.0f} satır/sn)."
+        )
+        return count
     except Exception as e:
         session.rollback()
         log.error(f"Veritabanına yazma hatası: {e}")
     finally:
         session.close()
 
+def load_xlsx_to_db():
+    """Varsayılan XLSX_PATH dosyasını yükler."""
+    return load_calls_to_db(XLSX_PATH)
+
+def ingest(path=XLSX_PATH, chunk_size=INGEST_CHUNK_SIZE):
+    """Dosyayı yükler, eksik ön işleme alanlarını tamamlar ve yakın-kopyaları işaretler ('ingest' komutu)."""
+    load_calls_to_db(path, chunk_size)
+    # Eski sürümle yüklenmiş satırların ön işleme alanlarını tamamla
+    preprocess_missing_calls()
+    # Yeni yüklenen transkriptler için yakın-kopya kümelerini işaretle
+    flag_near_duplicates()
+
 if __name__ == "__main__":
-    load_xlsx_to_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Çağrı transkriptlerini (xlsx/csv/parquet) veritabanına yükler.")
+    parser.add_argument("path", nargs="?", default=XLSX_PATH, help="Yüklenecek dosya")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    ingest(args.path, args.chunk_size)
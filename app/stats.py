@@ -0,0 +1,123 @@
+# app/stats.py
+import json
+from datetime import timedelta
+from sqlalchemy import func, select
+from app.models import (
+    SessionLocal, CallInput, CallOutput, AnalysisCache, LLMJournal, DailyTopicStats, DailySubtopicStats,
+    create_db_and_tables,
+)
+from app.call_queue import utcnow
+from app.analytics import rebuild_analytics, rollup_coverage
+
+DEFAULT_STATS_DAYS = 30
+
+def collect_stats(db_session):
+    """Kuyruk ve tablo özetini döner: duruma göre çağrı sayıları, çıktı/önbellek/günlük satırları."""
+    status_counts = dict(db_session.execute(
+        select(CallInput.status, func.count()).group_by(CallInput.status).order_by(CallInput.status)
+    ).all())
+    return {
+        "calls_by_status": status_counts,
+        "calls_total": sum(status_counts.values()),
+        "outputs": db_session.scalar(select(func.count()).select_from(CallOutput)),
+        "analysis_cache_entries": db_session.scalar(select(func.count()).select_from(AnalysisCache)),
+        "journal_entries": db_session.scalar(select(func.count()).select_from(LLMJournal)),
+    }
+
+def collect_topic_stats(db_session, days=DEFAULT_STATS_DAYS, daily_subtopics=False):
+    """
+    Son 'days' günün konu özetini günlük rollup tablolarından okur (calls_output taranmaz):
+    ana konu başına çağrı sayısı, şikayet oranı, ortalama NPS ve duygu dağılımı.
+    daily_subtopics=True ise guided alt konuların gün gün çağrı/şikayet sayıları da eklenir.
+    """
+    since = (utcnow() - timedelta(days=days - 1)).date().isoformat()
+    rows = db_session.execute(
+        select(
+            DailyTopicStats.main_topic, DailyTopicStats.sentiment, DailyTopicStats.is_complaint,
+            func.sum(DailyTopicStats.call_count), func.sum(DailyTopicStats.nps_sum), func.sum(DailyTopicStats.nps_count),
+        )
+        .where(DailyTopicStats.day >= since)
+        .group_by(DailyTopicStats.main_topic, DailyTopicStats.sentiment, DailyTopicStats.is_complaint)
+    ).all()
+
+    topics = {}
+    for main_topic, sentiment, is_complaint, calls, nps_sum, nps_count in rows:
+        topic = topics.setdefault(main_topic or "-", {"calls": 0, "complaints": 0, "nps_sum": 0, "nps_count": 0, "sentiment": {}})
+        topic["calls"] += calls
+        topic["complaints"] += calls if is_complaint else 0
+        topic["nps_sum"] += nps_sum
+        topic["nps_count"] += nps_count
+        topic["sentiment"][sentiment or "-"] = topic["sentiment"].get(sentiment or "-", 0) + calls
+    topic_stats = [
+        {
+            "main_topic": main_topic,
+            "calls": topic["calls"],
+            "complaint_rate": round(topic["complaints"] / topic["calls"], 4) if topic["calls"] else 0.0,
+            "avg_nps": round(topic["nps_sum"] / topic["nps_count"], 2) if topic["nps_count"] else None,
+            "sentiment": topic["sentiment"],
+        }
+        for main_topic, topic in sorted(topics.items(), key=lambda item: -item[1]["calls"])
+    ]
+    stats = {"since": since, "days": days, "topics": topic_stats}
+    if daily_subtopics:
+        stats["daily_subtopics"] = [
+            {"day": day, "sub_topic": sub_topic, "calls": calls, "complaints": complaints}
+            for day, sub_topic, calls, complaints in db_session.execute(
+                select(DailySubtopicStats.day, DailySubtopicStats.sub_topic,
+                       DailySubtopicStats.call_count, DailySubtopicStats.complaint_count)
+                .where(DailySubtopicStats.day >= since)
+                .order_by(DailySubtopicStats.day, DailySubtopicStats.call_count.desc(), DailySubtopicStats.sub_topic)
+            ).all()
+        ]
+    return stats
+
+def format_stats(stats):
+    lines = [f"Toplam çağrı: {stats['calls_total']}"]
+    lines += [f"  {status or '-':<12} {count:>10}" for status, count in stats["calls_by_status"].items()]
+    lines.append(f"calls_output satırı: {stats['outputs']}")
+    lines.append(f"Sonuç önbelleği: {stats['analysis_cache_entries']} kayıt, günlük (journal): {stats['journal_entries']} kayıt")
+    topic_stats = stats.get("topic_stats")
+    if topic_stats is None:
+        return "\n".join(lines)
+    if stats["rollup_calls"] != stats["outputs"]:
+        lines.append(
+            f"UYARI: Günlük özetler {stats['rollup_calls']} çağrıyı kapsıyor, calls_output'ta {stats['outputs']} satır var; "
+            "'python -m app stats --rebuild' ile yeniden oluşturun."
+        )
+    lines.append(f"\nAna konular (son {topic_stats['days']} gün, {topic_stats['since']} itibarıyla):")
+    lines.append(f"  {'Ana konu':<40} {'Çağrı':>8} {'Şikayet %':>10} {'Ort. NPS':>9}  Duygu")
+    for topic in topic_stats["topics"]:
+        avg_nps = f"{topic['avg_nps']:.2f}" if topic["avg_nps"] is not None else "-"
+        sentiment = ", ".join(f"{name}: {count}" for name, count in sorted(topic["sentiment"].items()))
+        lines.append(
+            f"  {topic['main_topic'][:40]:<40} {topic['calls']:>8} {topic['complaint_rate'] * 100:>9.1f}% {avg_nps:>9}  {sentiment}"
+        )
+    if "daily_subtopics" in topic_stats:
+        lines.append("\nGünlük alt konular:")
+        lines.append(f"  {'Gün':<10} {'Alt konu':<50} {'Çağrı':>8} {'Şikayet':>8}")
+        lines += [
+            f"  {row['day']:<10} {row['sub_topic'][:50]:<50} {row['calls']:>8} {row['complaints']:>8}"
+            for row in topic_stats["daily_subtopics"]
+        ]
+    return "\n".join(lines)
+
+def print_stats(as_json=False, days=DEFAULT_STATS_DAYS, daily_subtopics=False, rebuild=False):
+    """
+    Özeti ekrana yazar ('stats' komutu). LangChain/OpenAI import edilmez; API anahtarı gerekmez.
+    rebuild=True ise önce alt tablolar ve günlük özetler calls_output'tan yeniden oluşturulur.
+    """
+    create_db_and_tables()
+    if rebuild:
+        rebuild_analytics()
+    db_session = SessionLocal()
+    try:
+        stats = collect_stats(db_session)
+        stats["rollup_calls"] = rollup_coverage(db_session)[1]
+        stats["topic_stats"] = collect_topic_stats(db_session, days=days, daily_subtopics=daily_subtopics)
+    finally:
+        db_session.close()
+    print(json.dumps(stats, ensure_ascii=False, indent=2) if as_json else format_stats(stats))
+    return stats
+
+if __name__ == "__main__":
+    print_stats()
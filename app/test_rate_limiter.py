@@ -0,0 +1,148 @@
+# app/test_rate_limiter.py
+import asyncio
+import base64
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from app.rate_limiter import AdaptiveRateLimiter, rate_limited_chat_model, RateLimitedEmbeddings
+from app.utils import setup_logging
+
+# Stub sunucu saniyede en fazla bu kadar isteği kabul eder, fazlasına 429 + Retry-After döner
+STUB_REQUESTS_PER_SECOND = 5
+STUB_RETRY_AFTER_SECONDS = 1
+STUB_LATENCY_SECONDS = 0.2
+NUM_CHAT_REQUESTS = 40
+NUM_EMBEDDING_REQUESTS = 10
+# İstek başına alınabilecek en fazla 429 oranı. İlk saniyede stub, max_concurrency=20 isteğin yalnızca
+# 5'ini kabul eder (~15 adet 429 kaçınılmazdır); sonrasında limiter 429'ları düşük tutmalıdır.
+MAX_RATE_LIMITED_RATIO = 0.6
+
+log = setup_logging()
+
+class _StubState:
+    lock = threading.Lock()
+    window_start = 0.0
+    window_count = 0
+    accepted = 0
+    rejected = 0
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """/chat/completions ve /embeddings uçlarını taklit eden, hız sınırı uygulayan stub."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with _StubState.lock:
+            now = time.time()
+            if now - _StubState.window_start >= 1.0:
+                _StubState.window_start, _StubState.window_count = now, 0
+            allowed = _StubState.window_count < STUB_REQUESTS_PER_SECOND
+            if allowed:
+                _StubState.window_count += 1
+                _StubState.accepted += 1
+            else:
+                _StubState.rejected += 1
+
+        if not allowed:
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": str(STUB_RETRY_AFTER_SECONDS)}
+            )
+            return
+
+        time.sleep(STUB_LATENCY_SECONDS)
+        usage = {"prompt_tokens": 50, "completion_tokens": 5, "total_tokens": 55}
+        if self.path.endswith("/embeddings"):
+            texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            data = []
+            for i in range(len(texts)):
+                vector = np.full(8, 0.1, dtype=np.float32)
+                embedding = (
+                    base64.b64encode(vector.tobytes()).decode() if request.get("encoding_format") == "base64"
+                    else vector.tolist()
+                )
+                data.append({"object": "embedding", "index": i, "embedding": embedding})
+            self._send_json(200, {"object": "list", "data": data, "model": "stub", "usage": usage})
+        else:
+            self._send_json(200, {
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": "stub",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+async def run_rate_limiter_test_async():
+    """
+    Adaptif limiter'ı, 429 döndüren lokal bir stub OpenAI sunucusuna karşı çalıştırır.
+    Beklenen: 429'lar sonrası eşzamanlılık düşer, tüm istekler sonunda başarıyla tamamlanır ve
+    429 sayısı MAX_RATE_LIMITED_RATIO sınırında kalır. Dönüş: karşılanmayan beklentilerin listesi.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    log.info(f"Stub OpenAI sunucusu {base_url} adresinde başlatıldı (limit: {STUB_REQUESTS_PER_SECOND} istek/sn).")
+
+    # Limiter'ın kendi bütçesi bol: 429 sinyalleri yalnızca stub'dan gelir
+    limiter = AdaptiveRateLimiter(requests_per_minute=10_000, tokens_per_minute=10_000_000, max_concurrency=20)
+    llm = rate_limited_chat_model(
+        ChatOpenAI(model="stub", base_url=base_url, api_key="stub", max_retries=0), limiter
+    )
+    chain = ChatPromptTemplate.from_template("Merhaba {i}") | llm
+    embeddings = RateLimitedEmbeddings(
+        OpenAIEmbeddings(model="stub", base_url=base_url, api_key="stub", max_retries=0,
+                         check_embedding_ctx_length=False),
+        limiter
+    )
+
+    start_time = time.time()
+    chat_results = await chain.abatch([{"i": i} for i in range(NUM_CHAT_REQUESTS)], return_exceptions=True)
+    embedding_results = await asyncio.gather(
+        *[embeddings.aembed_documents([f"konu {i}"]) for i in range(NUM_EMBEDDING_REQUESTS)],
+        return_exceptions=True
+    )
+    elapsed = time.time() - start_time
+    server.shutdown()
+
+    failures = [r for r in list(chat_results) + list(embedding_results) if isinstance(r, Exception)]
+    total_requests = NUM_CHAT_REQUESTS + NUM_EMBEDDING_REQUESTS
+    rate_limited_ratio = _StubState.rejected / total_requests
+    print("\n--- HIZ SINIRLAYICI TEST SONUCU ---")
+    print(f"Toplam istek: {NUM_CHAT_REQUESTS} chat + {NUM_EMBEDDING_REQUESTS} embedding, süre: {elapsed:.2f} sn")
+    print(
+        f"Stub: {_StubState.accepted} kabul, {_StubState.rejected} adet 429 "
+        f"(istek başına {rate_limited_ratio:.2f}, sınır {MAX_RATE_LIMITED_RATIO})"
+    )
+    print(f"Limiter: {limiter.stats()}")
+    print(f"Başarısız istek: {len(failures)}")
+    for failure in failures[:3]:
+        print(f"  {type(failure).__name__}: {failure}")
+    print("-----------------------------------\n")
+
+    problems = []
+    if failures:
+        problems.append(f"{len(failures)} istek başarısız oldu")
+    if rate_limited_ratio > MAX_RATE_LIMITED_RATIO:
+        problems.append(f"429 oranı {rate_limited_ratio:.2f} > {MAX_RATE_LIMITED_RATIO}")
+    return problems
+
+if __name__ == "__main__":
+    problems = asyncio.run(run_rate_limiter_test_async())
+    if problems:
+        sys.exit("HATA: " + "; ".join(problems))
@@ -1,12 +1,14 @@
 # app/test_single_call.py
 import json
 import time
-import asyncio # Asenkron RAG görevleri için eklendi
+import asyncio
 from app.utils import setup_logging, load_text_file, get_call_start
 from app.config import PRODUCT_LIST_PATH
 from app.llm_chain import create_extraction_chain
 from app.models import SessionLocal, CallInput
 from app.main import load_retriever 
+from app.topic_mapper import map_guided_topics
+from app.compaction import extract_call
 
 TEST_CALL_ID = 21
 log = setup_logging()
@@ -14,7 +16,7 @@ log = setup_logging()
 async def run_single_test_async(): # Fonksiyonu asenkron hale getiriyoruz
     """
     Tekil çağrıyı 16 kriterli "İkili-Arama RAG" akışı ile test eder.
-    (HATA DÜZELTMESİ: Her 'sub_topic_free' için AYRI RAG araması yapar)
+    (Her 'sub_topic_free' ayrı eşlenir; tüm sorgular tek embedding isteğiyle aranır)
     """
     log.info(f"Tekil Çağrı Testi Başlatılıyor (Çağrı ID: {TEST_CALL_ID})...")
     
@@ -27,6 +29,8 @@ async def run_single_test_async(): # Fonksiyonu asenkron hale getiriyoruz
             return
         log.info("Test transkripti veritabanından başarıyla alındı.")
         full_transcript = test_call.transcript
+        # Ingest'te hesaplanmış çağrı başı (eski satırlarda yoksa burada hesaplanır)
+        transcript_start = test_call.transcript_start or get_call_start(full_transcript)
     except Exception as e:
         log.error(f"Veritabanından çağrı okunurken hata: {e}")
         return
@@ -41,9 +45,6 @@ async def run_single_test_async(): # Fonksiyonu asenkron hale getiriyoruz
     product_list_str = load_text_file(PRODUCT_LIST_PATH)
     extraction_chain = create_extraction_chain(product_list_str)
     
-    log.info("Çağrı başı ve tüm transkript hazırlanıyor...")
-    transcript_start = get_call_start(full_transcript)
-    
     log.info("RAG zinciri hazır. Adım 1: OpenAI'ye Çıkarım İsteği gönderiliyor...")
     start_time = time.time()
 
@@ -53,65 +54,41 @@ async def run_single_test_async(): # Fonksiyonu asenkron hale getiriyoruz
             "transcript_start": transcript_start,
             "full_transcript": full_transcript
         }
-        # invoke() yerine async olan ainvoke() kullanıyoruz
-        partial_result = await extraction_chain.ainvoke(input_data)
+        # Pipeline ile aynı yol: sıkıştırma + (uzun çağrılarda) map-reduce
+        partial_result, tokens_saved = await extract_call(
+            extraction_chain, input_data["transcript_start"], input_data["full_transcript"], test_call.token_count
+        )
         
-        log.info("Adım 1 tamamlandı. Serbest konular alınıyor...")
+        log.info(f"Adım 1 tamamlandı (sıkıştırma ile {tokens_saved} token tasarruf). Serbest konular alınıyor...")
         print("\n--- ZİNCİR 1 ÇIKTISI ---")
         print(f"INTENT (Arama Niyeti): {partial_result.intent}")
         print(f"ANA KONU (Genel): {partial_result.main_topic_free}")
         print(f"ALT KONULAR (Genel): {partial_result.sub_topics_free}")
         print("--------------------------\n")
 
-        # --- ADIM 2: İKİLİ RAG ARAMA (DÜZELTİLMİŞ MANTIK) ---
+        # --- ADIM 2: İKİLİ RAG ARAMA (TOPLU EMBEDDING + TEK FAISS ARAMASI) ---
         final_result = partial_result 
-        
-        # --- ARAMA 1: ALT KONULAR (HER BİRİ İÇİN AYRI AYRI) ---
+        log.info("RAG Araması (Ana Konu + Alt Konular) tek seferde yapılıyor...")
+        matches = await map_guided_topics(vector_store, [final_result])
+
         if partial_result.sub_topics_free:
-            log.info(f"RAG Araması (Alt Konular) {len(partial_result.sub_topics_free)} adet konu için ayrı ayrı yapılıyor...")
-            
-            sub_topic_tasks = []
-            for sub_query in partial_result.sub_topics_free:
-                # Her bir alt konu için k=1 (en iyi) araması
-                sub_topic_tasks.append(vector_store.asimilarity_search_with_score(sub_query, k=1))
-            
-            # Tüm alt konu RAG aramalarını paralel çalıştır
-            sub_topic_results_list = await asyncio.gather(*sub_topic_tasks)
-            
             print("--- RAG ARAMA SONUÇLARI (ALT KONULAR) ---")
-            found_alt_konular = []
-            for i, result_list in enumerate(sub_topic_results_list):
-                if result_list:
-                    best_doc, score = result_list[0]
-                    found_alt_konu = best_doc.metadata['alt_konu']
-                    found_alt_konular.append(found_alt_konu)
-                    print(f"  SORGULANAN: '{partial_result.sub_topics_free[i]}'")
-                    print(f"  BULUNAN (SKOR: {score:.4f}): '{found_alt_konu}'")
+            for sub_query in partial_result.sub_topics_free:
+                if sub_query in matches:
+                    best_doc, score = matches[sub_query]
+                    print(f"  SORGULANAN: '{sub_query}'")
+                    print(f"  BULUNAN (SKOR: {score:.4f}): '{best_doc.metadata['alt_konu']}'")
             print("-------------------------------------------\n")
-            
-            final_result.sub_topics_guided = list(set(found_alt_konular))
         else:
             log.info("RAG Araması (Alt Konular) atlandı: Serbest alt konu bulunamadı.")
 
-        # --- ARAMA 2: ANA KONU İÇİN (k=1) ---
-        if partial_result.main_topic_free:
-            main_topic_query = partial_result.main_topic_free
-            log.info(f"RAG Araması (Ana Konu) yapılıyor...")
-            
-            # Ana konu için asenkron arama
-            main_topic_results = await vector_store.asimilarity_search_with_score(main_topic_query, k=1)
-            
-            if main_topic_results:
-                best_match_doc, best_score = main_topic_results[0]
-                found_main_topic = best_match_doc.metadata.get('ana_konu')
-                
-                print("--- RAG ARAMA SONUCU (ANA KONU) ---")
-                print(f"SKOR: {best_score:.4f} | Eşleşen Ana Konu: {found_main_topic}")
-                print("-------------------------------------------\n")
-                
-                final_result.main_topic_guided = found_main_topic
-            else:
-                log.info("RAG Araması (Ana Konu) sonuç bulamadı.")
+        if partial_result.main_topic_free in matches:
+            best_match_doc, best_score = matches[partial_result.main_topic_free]
+            print("--- RAG ARAMA SONUCU (ANA KONU) ---")
+            print(f"SKOR: {best_score:.4f} | Eşleşen Ana Konu: {final_result.main_topic_guided}")
+            print("-------------------------------------------\n")
+        elif partial_result.main_topic_free:
+            log.info("RAG Araması (Ana Konu) sonuç bulamadı.")
         else:
             log.info("RAG Araması (Ana Konu) atlandı: Serbest ana konu bulunamadı.")
 
@@ -126,6 +103,8 @@ async def run_single_test_async(): # Fonksiyonu asenkron hale getiriyoruz
 
     except Exception as e:
         log.error(f"Zincir çalıştırılırken bir hata oluştu: {e}")
+    finally:
+        vector_store.embeddings.log_stats()
 
 if __name__ == "__main__":
     # Asenkron fonksiyonu çalıştırmak için asyncio.run() kullanılır
@@ -0,0 +1,195 @@
+# app/topic_index.py
+import json
+import os
+import shutil
+import time
+import numpy as np
+from app import metrics
+
+# Index kökü: versions/<sürüm>/ dizinleri ve etkin sürümün adını tutan CURRENT dosyası.
+# Yeni sürüm tamamen yazıldıktan sonra CURRENT atomik olarak (os.replace) değiştirilir;
+# okuyucular yarım kalmış bir index görmez.
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+VECTORS_FILE = "vectors.npy"  # (n, d) float32, satırlar L2-normalize
+TOPICS_FILE = "topics.npy"    # (n, 2) unicode: [ana_konu, alt_konu]
+HASHES_FILE = "hashes.npy"    # (n,) unicode: doküman metninin SHA-256 özeti (artımlı build için)
+INFO_FILE = "index.json"      # embedding modeli, boyut, doküman sayısı
+FAISS_DIR = "faiss"           # Aynı vektörlerle kurulan LangChain FAISS index'i (TOPIC_MATCHER="faiss")
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def save_topic_index(path, vectors, topics, embedding_model, hashes=None):
+    """
+    Konu index'ini diske yazar: normalize float32 vektör matrisi, [ana_konu, alt_konu] dizisi ve
+    (verilirse) doküman özetleri. 'topics' {ana_konu, alt_konu} sözlüklerinin listesidir (vektörlerle aynı sırada).
+    """
+    os.makedirs(path, exist_ok=True)
+    matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32)).astype(np.float32)
+    np.save(os.path.join(path, VECTORS_FILE), matrix)
+    np.save(os.path.join(path, TOPICS_FILE), np.array([[t["ana_konu"], t["alt_konu"]] for t in topics], dtype=str))
+    if hashes is not None:
+        np.save(os.path.join(path, HASHES_FILE), np.array(hashes, dtype=str))
+    with open(os.path.join(path, INFO_FILE), "w", encoding="utf-8") as f:
+        json.dump({"embedding_model": embedding_model, "dim": int(matrix.shape[1]), "count": int(matrix.shape[0])}, f)
+
+def current_version(root):
+    """Etkin sürümün adını döner (CURRENT yoksa None)."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def current_index_path(root):
+    """
+    Etkin sürümün dizinini döner. CURRENT yoksa ve kök dizinin kendisi bir index ise
+    (sürümlemeden önceki düz yerleşim) kökü döner; hiç index yoksa None.
+    """
+    version = current_version(root)
+    if version:
+        return os.path.join(root, VERSIONS_DIR, version)
+    if os.path.exists(os.path.join(root, VECTORS_FILE)):
+        return root
+    return None
+
+def new_version_dir(root):
+    """Henüz yayınlanmamış yeni bir sürüm için geçici dizin oluşturur: (sürüm adı, geçici yol)."""
+    now = time.time()
+    version = time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f".{int(now * 1000) % 1000:03d}-{os.getpid()}"
+    staging = os.path.join(root, VERSIONS_DIR, f".{version}.tmp")
+    os.makedirs(staging)
+    return version, staging
+
+def publish_version(root, version, staging, keep_versions=3):
+    """
+    Tamamlanmış sürümü yerine taşır ve CURRENT işaretçisini atomik olarak değiştirir.
+    En yeni 'keep_versions' sürüm (etkin olan dahil) tutulur, eskiler silinir.
+    """
+    versions_root = os.path.join(root, VERSIONS_DIR)
+    os.replace(staging, os.path.join(versions_root, version))
+    pointer_tmp = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(root, CURRENT_FILE))
+
+    published = sorted(name for name in os.listdir(versions_root) if not name.startswith("."))
+    for name in published[:-keep_versions] if keep_versions else []:
+        if name != version:
+            # Eski sürümü mmap ile okuyan process'ler etkilenmez (POSIX); silinemezse bir sonraki build'e kalır
+            shutil.rmtree(os.path.join(versions_root, name), ignore_errors=True)
+
+def load_document_vectors(path):
+    """Bir sürümdeki {doküman özeti: normalize vektör} eşlemesini ve index bilgisini döner."""
+    hashes_path = os.path.join(path, HASHES_FILE)
+    if not os.path.exists(hashes_path):
+        return {}, {}
+    with open(os.path.join(path, INFO_FILE), encoding="utf-8") as f:
+        info = json.load(f)
+    vectors = np.load(os.path.join(path, VECTORS_FILE))
+    hashes = np.load(hashes_path)
+    return {str(content_hash): vectors[row] for row, content_hash in enumerate(hashes)}, info
+
+class TopicIndex:
+    """
+    Konu hiyerarşisi için bellek eşlemeli (mmap) NumPy index'i. Birkaç yüz alt konu için FAISS ve
+    pickle'lı docstore gerekmez: bir batch'teki tüm sorgular tek matris çarpımı + argmax ile eşlenir.
+    Skor kosinüs benzerliğidir; 'min_score' altındaki en iyi eşleşmeler "eşleşme yok" sayılır.
+    """
+
+    def __init__(self, vectors, topics, embeddings, min_score=0.0, info=None, root=None, version=None,
+                 refresh_seconds=30.0):
+        self.vectors = vectors
+        self.topics = topics
+        self.embeddings = embeddings
+        self.min_score = min_score
+        self.info = info or {}
+        self.root = root
+        self.version = version
+        self.refresh_seconds = refresh_seconds
+        self._last_refresh_check = time.monotonic()
+
+    @staticmethod
+    def _read(path):
+        vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        topics = np.load(os.path.join(path, TOPICS_FILE))
+        with open(os.path.join(path, INFO_FILE), encoding="utf-8") as f:
+            info = json.load(f)
+        return vectors, topics, info
+
+    @classmethod
+    def load(cls, root, embeddings, min_score=0.0, refresh_seconds=30.0):
+        """Kök dizindeki etkin (CURRENT) sürümü yükler."""
+        path = current_index_path(root)
+        if path is None:
+            raise FileNotFoundError(f"'{root}' altında konu index'i bulunamadı")
+        vectors, topics, info = cls._read(path)
+        return cls(vectors, topics, embeddings, min_score=min_score, info=info, root=root,
+                   version=current_version(root), refresh_seconds=refresh_seconds)
+
+    def refresh(self):
+        """
+        En fazla 'refresh_seconds' aralıkla CURRENT'ı kontrol eder; yeni bir sürüm yayınlandıysa
+        ona geçer. Uzun süre çalışan worker'lar yeniden başlatılmadan güncel index'i kullanır.
+        Dönüş: sürüm değiştiyse True.
+        """
+        now = time.monotonic()
+        if self.root is None or now - self._last_refresh_check < self.refresh_seconds:
+            return False
+        self._last_refresh_check = now
+        version = current_version(self.root)
+        if not version or version == self.version:
+            return False
+        self.vectors, self.topics, self.info = self._read(os.path.join(self.root, VERSIONS_DIR, version))
+        self.version = version
+        return True
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def match_vectors(self, query_vectors):
+        """
+        Sorgu vektörlerini (m, d) tek çarpımla eşler. Dönüş: (indeksler, skorlar);
+        eşiğin altında kalan sorguların indeksi -1'dir.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32)
+        # Index satırları normalize; sorgunun normu argmax'ı değiştirmez, yalnızca kazanan skorlar bölünür
+        scores = queries @ self.vectors.T
+        best = scores.argmax(axis=1)
+        norms = np.linalg.norm(queries, axis=1)
+        norms[norms == 0] = 1.0
+        best_scores = scores[np.arange(len(best)), best] / norms
+        best[best_scores < self.min_score] = -1
+        return best, best_scores
+
+    def topic(self, index):
+        ana_konu, alt_konu = self.topics[index]
+        return {"ana_konu": str(ana_konu), "alt_konu": str(alt_konu)}
+
+    async def asearch(self, queries):
+        """
+        Sorguları tek embed_documents çağrısıyla vektörize edip eşler.
+        Dönüş: {sorgu: (Document(metadata={ana_konu, alt_konu}), skor)} (eşleşmeyenler yer almaz)
+        """
+        from langchain_core.documents import Document  # eşleşme sonucu FAISS yoluyla aynı biçimde döner
+
+        unique_queries = list(dict.fromkeys(queries))
+        if not unique_queries:
+            return {}
+        self.refresh()
+        with metrics.timed("embedding"):
+            vectors = await self.embeddings.aembed_documents(unique_queries)
+        with metrics.timed("topic_search"):
+            indices, scores = self.match_vectors(vectors)
+        matches = {}
+        for query, index, score in zip(unique_queries, indices, scores):
+            if index == -1:
+                continue
+            topic = self.topic(index)
+            matches[query] = (Document(page_content=topic["alt_konu"], metadata=topic), float(score))
+        return matches
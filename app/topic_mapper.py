@@ -0,0 +1,73 @@
+# app/topic_mapper.py
+import numpy as np
+from app.topic_index import TopicIndex
+from app import metrics
+
+async def search_topics_batch(vector_store, queries):
+    """
+    Verilen tüm sorguları tekilleştirir, TEK bir embed_documents çağrısı ile vektörize eder
+    ve FAISS index'inde TEK bir matris araması (k=1) yapar.
+    Dönüş: {sorgu: (en_iyi_doc, skor)}  (sonuç bulunamayan sorgular sözlükte yer almaz)
+    NumPy konu index'inde (TopicIndex) arama index'in kendisine bırakılır.
+    """
+    if isinstance(vector_store, TopicIndex):
+        return await vector_store.asearch(queries)
+
+    unique_queries = list(dict.fromkeys(queries))
+    if not unique_queries:
+        return {}
+
+    with metrics.timed("embedding"):
+        vectors = await vector_store.embeddings.aembed_documents(unique_queries)
+    matrix = np.array(vectors, dtype=np.float32)
+    import faiss  # FAISS yolu seçilmişse vector_store yüklenirken zaten import edilmiştir
+
+    # asimilarity_search_with_score ile birebir aynı sonuç için aynı normalizasyon
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(matrix)
+
+    with metrics.timed("topic_search"):
+        scores, indices = vector_store.index.search(matrix, 1)
+
+    matches = {}
+    for row, query in enumerate(unique_queries):
+        doc_index = indices[row][0]
+        if doc_index == -1:
+            continue
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[doc_index])
+        matches[query] = (doc, scores[row][0])
+    return matches
+
+def index_version(vector_store):
+    """Eşlemede kullanılan konu index'i sürümü (TopicIndex.version; FAISS için yüklemede atanır)."""
+    return getattr(vector_store, "version", None)
+
+async def map_guided_topics(vector_store, partial_results):
+    """
+    "İkili-Arama RAG": Her sonucun 'main_topic_free' ve 'sub_topics_free' alanlarını
+    topic hiyerarşisine eşler ve 'main_topic_guided' / 'sub_topics_guided' alanlarını doldurur.
+    Batch'teki tüm sorgular tek seferde aranır. Eşleşme sözlüğünü döner.
+    """
+    queries = []
+    for result in partial_results:
+        if result.main_topic_free:
+            queries.append(result.main_topic_free)
+        queries.extend(result.sub_topics_free or [])
+
+    matches = await search_topics_batch(vector_store, queries)
+
+    for result in partial_results:
+        # Alt konular (her biri için ayrı eşleşme)
+        found_alt_konular = [
+            matches[sub_query][0].metadata['alt_konu']
+            for sub_query in (result.sub_topics_free or [])
+            if sub_query in matches
+        ]
+        result.sub_topics_guided = list(set(found_alt_konular))
+
+        # Ana konu
+        if result.main_topic_free and result.main_topic_free in matches:
+            best_match_doc, best_score = matches[result.main_topic_free]
+            result.main_topic_guided = best_match_doc.metadata.get('ana_konu')
+
+    return matches
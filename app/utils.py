@@ -1,10 +1,12 @@
 # app/utils.py
 import logging
 import json
+import os
 from typing import Optional
 
 def setup_logging():
     """Temel loglama ayarlarını yapılandırır."""
+    os.makedirs("logs", exist_ok=True)
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s - %(message)s",
@@ -33,6 +35,10 @@ def load_text_file(file_path: str):
         logging.error(f"HATA: {file_path} dosyası okunamadı: {e}")
         return ""
 
+def estimate_tokens(text: str) -> int:
+    """Hızlı token tahmini (Türkçe metinlerde ~3 karakter/token)."""
+    return len(text) // 3 + 1
+
 def get_call_start(transcript: str, num_words: int = 40) -> str:
     """
     Transkriptin ilk 'num_words' kelimesini alır.